@@ -1,18 +1,47 @@
+import os
 from flask import Flask, render_template, redirect, url_for, request, session, flash, jsonify
 from flask_cors import CORS
 from functools import wraps
-from datetime import datetime
-from models import db, Admin, Bus, Driver, Route, MaintenanceLog
+from datetime import date, datetime
+from config import ATTENDANCE_PATH, DATABASE_URI, SHARED_STATE_PATH
+import attendance
+import clustering
+import compression
+import jobs
+import metrics
+import repository
+import rostering
+import static_assets
+from repository import get_repository, pick_fields
+import serialization
+from serialization import request_data, respond, stream_list
+from validation import parse_location_update
 
 app = Flask(__name__)
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///smart_bus.db"
+app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URI
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.secret_key = "change_this_secret"
+# sqlalchemy / firestore / memory
+app.config["DATA_BACKEND"] = os.environ.get("DATA_BACKEND", "sqlalchemy")
+# Live positions + cache versions shared by all worker processes
+app.config["SHARED_STATE_PATH"] = SHARED_STATE_PATH
+app.config["ATTENDANCE_PATH"] = ATTENDANCE_PATH
 
 # Enable CORS for Flutter app
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
-db.init_app(app)
+# SQLAlchemy is only imported when it is the configured backend
+if app.config["DATA_BACKEND"] == "sqlalchemy":
+    from models import db
+    db.init_app(app)
+repository.init_app(app)
+attendance.init_app(app)
+metrics.init_app(app)
+scheduler = jobs.init_app(app)
+serialization.init_app(app)
+static_assets.init_app(app)
+# Registered last so it runs first, inside the timing of metrics
+compression.init_app(app)
 
 
 # -------------- LOGIN REQUIRED DECORATOR -------------- 
@@ -33,10 +62,10 @@ def login():
         username = request.form.get("username")
         password = request.form.get("password")
 
-        admin = Admin.query.filter_by(username=username, password=password).first()
+        admin_id = get_repository().authenticate(username, password)
 
-        if admin:
-            session["admin_id"] = admin.id
+        if admin_id is not None:
+            session["admin_id"] = admin_id
             flash("Login successful!", "success")
             return redirect(url_for("dashboard"))
         else:
@@ -56,20 +85,20 @@ def logout():
 @app.route("/dashboard")
 @login_required
 def dashboard():
-    buses = Bus.query.all()
-    drivers = Driver.query.all()
-    routes = Route.query.all()
-    maintenance = MaintenanceLog.query.order_by(MaintenanceLog.reported_at.desc()).all() \
-        if hasattr(MaintenanceLog, "reported_at") else MaintenanceLog.query.all()
+    repo = get_repository()
+    buses = repo.list("buses")
+    drivers = repo.list("drivers")
+    routes = repo.list("routes")
+    maintenance = repo.list("maintenance")
 
     # Calculate statistics
-    active_buses = len([b for b in buses if getattr(b, "status", "") == "Active"])
-    inactive_buses = len([b for b in buses if getattr(b, "status", "") == "In Depot"])
-    breakdown_buses = len([b for b in buses if getattr(b, "status", "") == "Breakdown"])
-    present_drivers = len([d for d in drivers if getattr(d, "attendance", "") == "Present"])
-    absent_drivers = len([d for d in drivers if getattr(d, "attendance", "") == "Absent"])
-    pending_maintenance = len([m for m in maintenance if getattr(m, "status", "") == "Pending"])
-    resolved_maintenance = len([m for m in maintenance if getattr(m, "status", "") == "Resolved"])
+    active_buses = len([b for b in buses if b.get("status") == "Active"])
+    inactive_buses = len([b for b in buses if b.get("status") == "In Depot"])
+    breakdown_buses = len([b for b in buses if b.get("status") == "Breakdown"])
+    present_drivers = len([d for d in drivers if d.get("attendance") == "Present"])
+    absent_drivers = len([d for d in drivers if d.get("attendance") == "Absent"])
+    pending_maintenance = len([m for m in maintenance if m.get("status") == "Pending"])
+    resolved_maintenance = len([m for m in maintenance if m.get("status") == "Resolved"])
     
     summary = {
         "total_buses": len(buses),
@@ -85,7 +114,7 @@ def dashboard():
         "resolved_maintenance": resolved_maintenance,
     }
 
-    live_locations = {}
+    live_locations = repo.get_live_locations()
 
     return render_template(
         "dashboard.html",
@@ -103,58 +132,78 @@ def dashboard():
 @app.route("/api/public/buses", methods=["GET"])
 def api_public_buses():
     """Get all buses - Public API for Flutter app"""
-    buses = Bus.query.all()
-    return jsonify([{
-        "bus_id": b.bus_id,
-        "number": b.number,
-        "route_id": b.route_id,
-        "status": b.status
-    } for b in buses])
+    buses = get_repository().iter_list("buses")
+    return stream_list({
+        "bus_id": b["bus_id"],
+        "number": b["number"],
+        "route_id": b["route_id"],
+        "status": b["status"]
+    } for b in buses)
 
 
 @app.route("/api/public/routes", methods=["GET"])
 def api_public_routes():
     """Get all routes - Public API for Flutter app"""
-    routes = Route.query.all()
-    return jsonify([{
-        "route_id": r.route_id,
-        "name": r.name,
-        "start_stop": r.start_stop,
-        "end_stop": r.end_stop,
-        "first_bus": r.first_bus,
-        "last_bus": r.last_bus,
-        "frequency_min": r.frequency_min
-    } for r in routes])
+    routes = get_repository().iter_list("routes")
+    return stream_list({
+        "route_id": r["route_id"],
+        "name": r["name"],
+        "start_stop": r["start_stop"],
+        "end_stop": r["end_stop"],
+        "first_bus": r["first_bus"],
+        "last_bus": r["last_bus"],
+        "frequency_min": r["frequency_min"]
+    } for r in routes)
 
 
 @app.route("/api/public/drivers", methods=["GET"])
 def api_public_drivers():
     """Get all drivers - Public API for Flutter app"""
-    drivers = Driver.query.all()
-    return jsonify([{
-        "driver_id": d.driver_id,
-        "name": d.name,
-        "phone": d.phone,
-        "attendance": d.attendance
-    } for d in drivers])
+    drivers = get_repository().iter_list("drivers")
+    return stream_list({
+        "driver_id": d["driver_id"],
+        "name": d["name"],
+        "phone": d["phone"],
+        "attendance": d["attendance"]
+    } for d in drivers)
+
+
+@app.route("/api/public/live-locations", methods=["GET"])
+def api_public_live_locations():
+    """Latest position of every bus (or of ?bus_ids=1,2,3) - Public API for Flutter app"""
+    locations = get_repository().get_live_locations()
+    bus_ids = request.args.get("bus_ids")
+    if bus_ids:
+        wanted = set(bus_ids.split(","))
+        locations = {k: v for k, v in locations.items() if k in wanted}
+    return respond(locations)
+
+
+@app.route("/api/public/clusters", methods=["GET"])
+def api_public_clusters():
+    """Live buses grouped for a map view at ?zoom=Z[&bbox=west,south,east,north] - Public API for Flutter app"""
+    zoom, bbox, error = clustering.parse_query(request.args)
+    if error:
+        return respond({"error": error}, 400)
+    index = clustering.cluster_index(get_repository())
+    return respond({
+        "zoom": zoom,
+        "buses": index.bus_count,
+        "clusters": index.clusters(zoom, bbox)
+    })
 
 
 @app.route("/api/public/location-update", methods=["POST"])
 def api_location_update():
     """Update bus location - Public API for Flutter app"""
-    data = request.get_json() or {}
-    bus_id = data.get("bus_id")
-    lat = data.get("lat")
-    lng = data.get("lng")
-    speed = data.get("speed", 0)
-    occupancy = data.get("occupancy", 0)
-    
-    if not bus_id or not lat or not lng:
-        return jsonify({"error": "bus_id, lat, and lng are required"}), 400
-    
-    # Store location update (you can create a LiveLocation model if needed)
-    # For now, we'll just return success
-    return jsonify({
+    # JSON, or MessagePack with Content-Type: application/msgpack
+    data = request_data() or {}
+    bus_id, location, error = parse_location_update(data)
+    if error:
+        return respond({"error": error}, 400)
+
+    get_repository().update_live_location(bus_id, location)
+    return respond({
         "ok": True,
         "message": "Location updated",
         "bus_id": bus_id,
@@ -170,44 +219,36 @@ def api_location_update():
 def api_add_bus():
     data = request.get_json() or {}
 
-    bus = Bus(
-        number=data.get("number"),
-        route_id=data.get("route_id"),
-        status=data.get("status") or "Active",
-    )
-    db.session.add(bus)
-    db.session.commit()
-    return jsonify({"ok": True, "bus_id": bus.bus_id})
+    bus_id = get_repository().add("buses", {
+        "number": data.get("number"),
+        "route_id": data.get("route_id"),
+        "status": data.get("status") or "Active",
+    })
+    rostering.refresh_bus(get_repository(), rostering.get_shared(), bus_id)
+    return jsonify({"ok": True, "bus_id": bus_id})
 
 # Update Bus
-@app.route("/api/buses/<int:bus_id>", methods=["PUT"])
+@app.route("/api/buses/<bus_id>", methods=["PUT"])
 @login_required
 def api_update_bus(bus_id):
     data = request.get_json() or {}
-    bus = Bus.query.get(bus_id)
-    if not bus:
+    fields = pick_fields("buses", data)
+    repo = get_repository()
+    bus = repo.get("buses", bus_id)
+    if not bus or not repo.update("buses", bus_id, fields):
         return jsonify({"error": "Bus not found"}), 404
-    
-    if "number" in data:
-        bus.number = data.get("number")
-    if "route_id" in data:
-        bus.route_id = data.get("route_id")
-    if "status" in data:
-        bus.status = data.get("status")
-    
-    db.session.commit()
+    # Only the status and the route matter to the roster
+    if any(str(fields[k]) != str(bus[k]) for k in fields.keys() & {"status", "route_id"}):
+        rostering.refresh_bus(repo, rostering.get_shared(), bus_id)
     return jsonify({"ok": True})
 
 # Delete Bus
-@app.route("/api/buses/<int:bus_id>", methods=["DELETE"])
+@app.route("/api/buses/<bus_id>", methods=["DELETE"])
 @login_required
 def api_delete_bus(bus_id):
-    bus = Bus.query.get(bus_id)
-    if not bus:
+    if not get_repository().delete("buses", bus_id):
         return jsonify({"error": "Bus not found"}), 404
-    
-    db.session.delete(bus)
-    db.session.commit()
+    rostering.refresh_bus(get_repository(), rostering.get_shared(), bus_id)
     return jsonify({"ok": True})
 
 
@@ -217,116 +258,129 @@ def api_delete_bus(bus_id):
 def api_add_driver():
     data = request.get_json() or {}
 
-    driver = Driver(
-        name=data.get("name"),
-        phone=data.get("phone"),
-        attendance="Absent",
-    )
-    db.session.add(driver)
-    db.session.commit()
-    return jsonify({"ok": True, "driver_id": driver.driver_id})
+    driver_id = get_repository().add("drivers", {
+        "name": data.get("name"),
+        "phone": data.get("phone"),
+        "attendance": "Absent",
+    })
+    return jsonify({"ok": True, "driver_id": driver_id})
 
 # Update Driver
-@app.route("/api/drivers/<int:driver_id>", methods=["PUT"])
+@app.route("/api/drivers/<driver_id>", methods=["PUT"])
 @login_required
 def api_update_driver(driver_id):
     data = request.get_json() or {}
-    driver = Driver.query.get(driver_id)
-    if not driver:
+    if not get_repository().update("drivers", driver_id, pick_fields("drivers", data)):
         return jsonify({"error": "Driver not found"}), 404
-    
-    if "name" in data:
-        driver.name = data.get("name")
-    if "phone" in data:
-        driver.phone = data.get("phone")
     if "attendance" in data:
-        driver.attendance = data.get("attendance")
-    
-    db.session.commit()
+        attendance.get_history().mark(date.today(), driver_id, data["attendance"] == "Present")
+        rostering.refresh_driver(get_repository(), rostering.get_shared(), driver_id)
     return jsonify({"ok": True})
 
 # Delete Driver
-@app.route("/api/drivers/<int:driver_id>", methods=["DELETE"])
+@app.route("/api/drivers/<driver_id>", methods=["DELETE"])
 @login_required
 def api_delete_driver(driver_id):
-    driver = Driver.query.get(driver_id)
-    if not driver:
+    if not get_repository().delete("drivers", driver_id):
         return jsonify({"error": "Driver not found"}), 404
-    
-    db.session.delete(driver)
-    db.session.commit()
+    rostering.refresh_driver(get_repository(), rostering.get_shared(), driver_id)
     return jsonify({"ok": True})
 
 
 # Update Attendance
-@app.route("/api/drivers/<int:driver_id>/attendance", methods=["POST"])
+@app.route("/api/drivers/<driver_id>/attendance", methods=["POST"])
 @login_required
 def api_driver_attendance(driver_id):
     data = request.get_json() or {}
     status = data.get("status")
 
-    driver = Driver.query.get(driver_id)
-    if not driver:
+    if not get_repository().update("drivers", driver_id, {"attendance": status}):
         return jsonify({"error": "Driver not found"}), 404
-
-    driver.attendance = status
-    db.session.commit()
+    attendance.get_history().mark(date.today(), driver_id, status == "Present")
+    rostering.refresh_driver(get_repository(), rostering.get_shared(), driver_id)
     return jsonify({"ok": True})
 
 
+# -------------- ATTENDANCE HISTORY -------------- 
+# Per-day counts over ?start=&end= (default: the last 90 days)
+@app.route("/api/attendance/daily")
+@login_required
+def api_attendance_daily():
+    start, end, error = attendance.parse_range(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    return jsonify({"days": attendance.get_history().daily_counts(start, end)})
+
+# Per-driver present days and absence rate (?driver_ids=1,2 to filter)
+@app.route("/api/attendance/rates")
+@login_required
+def api_attendance_rates():
+    start, end, error = attendance.parse_range(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    driver_ids = request.args.get("driver_ids")
+    rates = attendance.get_history().rates(start, end, driver_ids.split(",") if driver_ids else None)
+    return jsonify({"drivers": rates})
+
+# Longest and current absence streak per driver (?min_days=3)
+@app.route("/api/attendance/streaks")
+@login_required
+def api_attendance_streaks():
+    start, end, error = attendance.parse_range(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    min_days = request.args.get("min_days", 1, type=int)
+    return jsonify({"drivers": attendance.get_history().absence_streaks(start, end, min_days)})
+
+# Store today's attendance of every driver and reset them to Absent (in the background)
+@app.route("/api/attendance/rollover", methods=["POST"])
+@login_required
+def api_attendance_rollover():
+    data = request.get_json(silent=True) or {}
+    try:
+        day = date.fromisoformat(data["date"]) if data.get("date") else date.today()
+    except (TypeError, ValueError):
+        return jsonify({"error": "date must be YYYY-MM-DD"}), 400
+    if not scheduler.trigger("attendance-rollover", day):
+        return jsonify({"error": "Roll-over is already running"}), 409
+    return jsonify({"ok": True, "date": day.isoformat(), "job": "attendance-rollover"}), 202
+
+
 # Add Route
 @app.route("/api/routes", methods=["POST"])
 @login_required
 def api_add_route():
     data = request.get_json() or {}
 
-    route = Route(
-        name=data.get("name"),
-        start_stop=data.get("start_stop"),
-        end_stop=data.get("end_stop"),
-        first_bus=data.get("first_bus"),
-        last_bus=data.get("last_bus"),
-        frequency_min=data.get("frequency_min"),
-    )
-    db.session.add(route)
-    db.session.commit()
-    return jsonify({"ok": True, "route_id": route.route_id})
+    route_id = get_repository().add("routes", {
+        "name": data.get("name"),
+        "start_stop": data.get("start_stop"),
+        "end_stop": data.get("end_stop"),
+        "first_bus": data.get("first_bus"),
+        "last_bus": data.get("last_bus"),
+        "frequency_min": data.get("frequency_min"),
+    })
+    rostering.refresh_route(get_repository(), rostering.get_shared(), route_id)
+    return jsonify({"ok": True, "route_id": route_id})
 
 # Update Route
-@app.route("/api/routes/<int:route_id>", methods=["PUT"])
+@app.route("/api/routes/<route_id>", methods=["PUT"])
 @login_required
 def api_update_route(route_id):
     data = request.get_json() or {}
-    route = Route.query.get(route_id)
-    if not route:
+    if not get_repository().update("routes", route_id, pick_fields("routes", data)):
         return jsonify({"error": "Route not found"}), 404
-    
-    if "name" in data:
-        route.name = data.get("name")
-    if "start_stop" in data:
-        route.start_stop = data.get("start_stop")
-    if "end_stop" in data:
-        route.end_stop = data.get("end_stop")
-    if "first_bus" in data:
-        route.first_bus = data.get("first_bus")
-    if "last_bus" in data:
-        route.last_bus = data.get("last_bus")
-    if "frequency_min" in data:
-        route.frequency_min = data.get("frequency_min")
-    
-    db.session.commit()
+    if data.keys() & {"first_bus", "last_bus", "frequency_min"}:
+        rostering.refresh_route(get_repository(), rostering.get_shared(), route_id)
     return jsonify({"ok": True})
 
 # Delete Route
-@app.route("/api/routes/<int:route_id>", methods=["DELETE"])
+@app.route("/api/routes/<route_id>", methods=["DELETE"])
 @login_required
 def api_delete_route(route_id):
-    route = Route.query.get(route_id)
-    if not route:
+    if not get_repository().delete("routes", route_id):
         return jsonify({"error": "Route not found"}), 404
-    
-    db.session.delete(route)
-    db.session.commit()
+    rostering.refresh_route(get_repository(), rostering.get_shared(), route_id)
     return jsonify({"ok": True})
 
 
@@ -336,48 +390,88 @@ def api_delete_route(route_id):
 def api_add_maintenance():
     data = request.get_json() or {}
 
-    log = MaintenanceLog(
-        bus_id=data.get("bus_id"),
-        issue=data.get("issue"),
-        status=data.get("status") or "Pending",
-        reported_on=datetime.now().strftime("%Y-%m-%d %H:%M")
-    )
-    db.session.add(log)
-    db.session.commit()
-    return jsonify({"ok": True, "id": log.id})
+    log_id = get_repository().add("maintenance", {
+        "bus_id": data.get("bus_id"),
+        "issue": data.get("issue"),
+        "status": data.get("status") or "Pending",
+        "reported_on": datetime.now().strftime("%Y-%m-%d %H:%M"),
+    })
+    rostering.refresh_bus(get_repository(), rostering.get_shared(), data.get("bus_id"))
+    return jsonify({"ok": True, "id": log_id})
 
 # Update Maintenance
-@app.route("/api/maintenance/<int:maintenance_id>", methods=["PUT"])
+@app.route("/api/maintenance/<maintenance_id>", methods=["PUT"])
 @login_required
 def api_update_maintenance(maintenance_id):
     data = request.get_json() or {}
-    log = MaintenanceLog.query.get(maintenance_id)
-    if not log:
+    fields = {k: data[k] for k in ("bus_id", "issue", "status") if k in data}
+    repo = get_repository()
+    log = repo.get("maintenance", maintenance_id)
+    if not log or not repo.update("maintenance", maintenance_id, fields):
         return jsonify({"error": "Maintenance record not found"}), 404
-    
-    if "bus_id" in data:
-        log.bus_id = data.get("bus_id")
-    if "issue" in data:
-        log.issue = data.get("issue")
-    if "status" in data:
-        log.status = data.get("status")
-    
-    db.session.commit()
+    # The old and the new bus, if the record moved
+    for bus_id in {str(log["bus_id"]), str(fields.get("bus_id", log["bus_id"]))}:
+        rostering.refresh_bus(repo, rostering.get_shared(), bus_id)
     return jsonify({"ok": True})
 
 # Delete Maintenance
-@app.route("/api/maintenance/<int:maintenance_id>", methods=["DELETE"])
+@app.route("/api/maintenance/<maintenance_id>", methods=["DELETE"])
 @login_required
 def api_delete_maintenance(maintenance_id):
-    log = MaintenanceLog.query.get(maintenance_id)
-    if not log:
+    repo = get_repository()
+    log = repo.get("maintenance", maintenance_id)
+    if not log or not repo.delete("maintenance", maintenance_id):
         return jsonify({"error": "Maintenance record not found"}), 404
-    
-    db.session.delete(log)
-    db.session.commit()
+    rostering.refresh_bus(repo, rostering.get_shared(), log["bus_id"])
     return jsonify({"ok": True})
 
 
+# -------------- ROSTER -------------- 
+# Today's trips with their bus and driver (solved on first request of the day)
+@app.route("/api/roster")
+@login_required
+def api_roster():
+    roster = rostering.current_roster(get_repository(), rostering.get_shared())
+    return jsonify({"summary": roster.summary(), "trips": roster.assignments()})
+
+# Solve today's roster again from scratch (in the background)
+@app.route("/api/roster", methods=["POST"])
+@login_required
+def api_roster_solve():
+    if not scheduler.trigger("roster", True):
+        return jsonify({"error": "Roster is already being solved"}), 409
+    return jsonify({"ok": True, "job": "roster"}), 202
+
+
+# -------------- BACKGROUND JOBS -------------- 
+# Daily after the last shift; set ROLLOVER_AT= (empty) to only run it on demand
+@scheduler.job("attendance-rollover", at=os.environ.get("ROLLOVER_AT", "23:55") or None)
+def job_attendance_rollover(day=None, scheduled=None):
+    # A roll-over caught up after midnight is still for the day it was scheduled on
+    attendance.rollover(get_repository(), attendance.get_history(), day or (scheduled and scheduled.date()))
+
+# Solves the day's roster once, before the first GET /api/roster of the day needs it
+@scheduler.job("roster", every=300)
+def job_roster(rebuild=False):
+    rostering.current_roster(get_repository(), rostering.get_shared(), rebuild=rebuild)
+
+# Every job with its schedule and last run
+@app.route("/api/jobs")
+@login_required
+def api_jobs():
+    return jsonify({"jobs": scheduler.status()})
+
+# Start a job now
+@app.route("/api/jobs/<name>", methods=["POST"])
+@login_required
+def api_run_job(name):
+    if name not in scheduler.jobs:
+        return jsonify({"error": "Job not found"}), 404
+    if not scheduler.trigger(name):
+        return jsonify({"error": "Job is already running"}), 409
+    return jsonify({"ok": True, "job": name}), 202
+
+
 # AI Prediction (dummy logic)
 @app.route("/api/predictions")
 @login_required
@@ -399,30 +493,33 @@ def api_predictions():
 @app.route("/buses")
 @login_required
 def list_buses():
-    buses = Bus.query.all()
+    buses = get_repository().list("buses")
     return render_template("buses.html", buses=buses)
 
 
 @app.route("/drivers")
 @login_required
 def list_drivers():
-    drivers = Driver.query.all()
+    drivers = get_repository().list("drivers")
     return render_template("drivers.html", drivers=drivers)
 
 
 @app.route("/routes")
 @login_required
 def list_routes():
-    routes = Route.query.all()
+    routes = get_repository().list("routes")
     return render_template("routes.html", routes=routes)
 
 
 @app.route("/maintenance")
 @login_required
 def maintenance_page():
-    logs = MaintenanceLog.query.all()
+    logs = get_repository().list("maintenance")
     return render_template("maintenance.html", logs=logs)
 
 
 if __name__ == "__main__":
+    # Only in the reloader's child, which is the process that serves
+    if os.environ.get("WERKZEUG_RUN_MAIN"):
+        jobs.autostart(app)
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,353 @@
+"""
+Attendance history
+One bit per driver per day, kept in a small SQLite file (see shared_state.py
+for the same multi-worker setup). Every driver gets a slot number once, and
+each day stores two bitmaps with bit `slot` set:
+
+    recorded  the driver was on the roster that day
+    present   the driver was present
+
+Bitmaps are Python ints, so one bitwise operation covers 64 drivers per
+machine word. Per-day counts are one popcount per day. Per-driver counts and
+absence streaks use bit-sliced counters: counter bit k of every driver lives
+in one int, and adding a day costs a few big-int operations whatever the
+number of drivers. Only the final counts are unpacked per driver.
+
+    history = get_history()
+    history.record_day(date(2024, 5, 1), {"7": True, "9": False})
+    history.rates(date(2024, 4, 1), date(2024, 6, 30))
+
+`python attendance.py` runs the daily roll-over (store every driver's
+attendance for today, then reset them to Absent), e.g. from cron.
+
+Days with no record at all (not rolled over) are left out of every query.
+"""
+import os
+import sqlite3
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+
+from flask import current_app
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attendance_slot (
+    driver_id TEXT PRIMARY KEY,
+    slot INTEGER NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS attendance_day (
+    day TEXT PRIMARY KEY,
+    recorded BLOB NOT NULL,
+    present BLOB NOT NULL
+);
+"""
+
+# Range used when a query gives no start date (about a quarter)
+DEFAULT_DAYS = 90
+
+_BITS_TO_BYTES = bytes.maketrans(b"01", b"\x00\x01")
+
+
+# -------------- BITMAPS --------------
+def _to_blob(bitmap):
+    return bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+
+
+def _from_blob(blob):
+    return int.from_bytes(blob, "little")
+
+
+def _bitmap(slots):
+    """Int with the given bits set, built in one pass"""
+    if not slots:
+        return 0
+    bits = bytearray(b"0") * (max(slots) + 1)
+    for slot in slots:
+        bits[-1 - slot] = 0x31  # "1"
+    return int(bits, 2)
+
+
+def _increment(counter, mask):
+    """Add 1 to every lane of the bit-sliced `counter` that is set in `mask`"""
+    carry = mask
+    for k, bits in enumerate(counter):
+        if not carry:
+            return
+        counter[k] = bits ^ carry
+        carry &= bits
+    if carry:
+        counter.append(carry)
+
+
+def _maximum(best, counter):
+    """Lane-wise best = max(best, counter), both bit-sliced"""
+    width = max(len(best), len(counter))
+    best.extend([0] * (width - len(best)))
+    counter = counter + [0] * (width - len(counter))
+    greater, equal = 0, -1
+    for k in range(width - 1, -1, -1):
+        greater |= equal & counter[k] & ~best[k]
+        equal &= ~(counter[k] ^ best[k])
+    if greater:
+        for k in range(width):
+            best[k] = (counter[k] & greater) | (best[k] & ~greater)
+
+
+def _unpack(counter, lanes):
+    """Per-lane values of a bit-sliced counter, as a list of `lanes` ints.
+
+    Each slice is spread to one byte per lane and added, shifted, into a
+    wide int with 32 bits per lane, so the work stays in C.
+    """
+    if not lanes:
+        return []
+    total = 0
+    for k, bits in enumerate(counter):
+        spread = bytearray(4 * lanes)
+        spread[3::4] = format(bits, f"0{lanes}b")[::-1].encode().translate(_BITS_TO_BYTES)
+        total += int.from_bytes(spread, "big") << k
+    values = array("I")
+    values.frombytes(total.to_bytes(4 * lanes, "big"))
+    if sys.byteorder == "little":
+        values.byteswap()
+    return values.tolist()
+
+
+# -------------- HISTORY --------------
+class AttendanceHistory:
+    """Per-day attendance bitmaps, cached in memory per process"""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._slots = None    # {driver_id: slot}
+        self._drivers = None  # [driver_id by slot]
+        self._days = None     # sorted day ordinals
+        self._bitmaps = None  # {ordinal: (recorded, present)}
+
+    def _connect(self):
+        if self._conn is None or self._pid != os.getpid():
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+            self._pid = os.getpid()
+            self._data_version = None
+        return self._conn
+
+    def _load(self):
+        """Re-read everything if another connection has committed since the last read"""
+        conn = self._connect()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version and self._bitmaps is not None:
+            return
+        self._data_version = data_version
+        self._slots = dict(conn.execute("SELECT driver_id, slot FROM attendance_slot"))
+        self._drivers = [None] * len(self._slots)
+        for driver_id, slot in self._slots.items():
+            self._drivers[slot] = driver_id
+        self._bitmaps = {
+            date.fromisoformat(day).toordinal(): (_from_blob(recorded), _from_blob(present))
+            for day, recorded, present in conn.execute("SELECT day, recorded, present FROM attendance_day")
+        }
+        self._days = sorted(self._bitmaps)
+
+    @staticmethod
+    def _slot_of(conn, slots, driver_id):
+        """Slot of `driver_id`, assigned on first use (inside a write transaction)"""
+        driver_id = str(driver_id)
+        if driver_id not in slots:
+            slots[driver_id] = len(slots)
+            conn.execute("INSERT INTO attendance_slot (driver_id, slot) VALUES (?, ?)", (driver_id, slots[driver_id]))
+        return slots[driver_id]
+
+    def _write(self, fn):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                slots = dict(conn.execute("SELECT driver_id, slot FROM attendance_slot"))
+                result = fn(conn, slots)
+            # data_version doesn't move for our own commits
+            self._bitmaps = None
+            return result
+
+    # ---------- WRITES ----------
+    def record_day(self, day, statuses, keep_marked=False):
+        """Store a whole day at once from {driver_id: present?}, replacing what was there.
+
+        With keep_marked, drivers already marked present that day stay present.
+        """
+        return self.record_days({day: statuses}, keep_marked)
+
+    def record_days(self, days, keep_marked=False):
+        """record_day for {day: statuses} in one transaction (backfills)"""
+        def write(conn, slots):
+            rows = []
+            for day, statuses in days.items():
+                recorded = [self._slot_of(conn, slots, driver_id) for driver_id in statuses]
+                present = _bitmap([slot for slot, is_present in zip(recorded, statuses.values()) if is_present])
+                if keep_marked:
+                    row = conn.execute("SELECT present FROM attendance_day WHERE day = ?",
+                                       (day.isoformat(),)).fetchone()
+                    present |= _from_blob(row[0]) if row else 0
+                recorded = _bitmap(recorded)
+                rows.append((day.isoformat(), _to_blob(recorded), _to_blob(present & recorded)))
+            conn.executemany(
+                "INSERT OR REPLACE INTO attendance_day (day, recorded, present) VALUES (?, ?, ?)", rows
+            )
+            return sum(len(statuses) for statuses in days.values())
+        return self._write(write)
+
+    def mark(self, day, driver_id, is_present):
+        """Set one driver's bit for `day`, keeping everyone else's"""
+        def write(conn, slots):
+            bit = 1 << self._slot_of(conn, slots, driver_id)
+            row = conn.execute("SELECT recorded, present FROM attendance_day WHERE day = ?",
+                               (day.isoformat(),)).fetchone()
+            recorded, present = (_from_blob(row[0]), _from_blob(row[1])) if row else (0, 0)
+            present = present | bit if is_present else present & ~bit
+            conn.execute(
+                "INSERT OR REPLACE INTO attendance_day (day, recorded, present) VALUES (?, ?, ?)",
+                (day.isoformat(), _to_blob(recorded | bit), _to_blob(present)),
+            )
+        self._write(write)
+
+    # ---------- QUERIES ----------
+    def _range(self, start, end):
+        """[(ordinal, recorded, present)] of the recorded days in start..end, and the drivers by slot"""
+        with self._lock:
+            self._load()
+            days = self._days[bisect_left(self._days, start.toordinal()):bisect_right(self._days, end.toordinal())]
+            return [(day, *self._bitmaps[day]) for day in days], list(self._drivers)
+
+    def daily_counts(self, start, end):
+        """[{day, present, recorded}] for every recorded day in start..end"""
+        days, _ = self._range(start, end)
+        return [
+            {"day": date.fromordinal(day).isoformat(),
+             "present": (present & recorded).bit_count(),
+             "recorded": recorded.bit_count()}
+            for day, recorded, present in days
+        ]
+
+    def rates(self, start, end, driver_ids=None):
+        """{driver_id: {present, recorded, absence_rate}} over start..end"""
+        days, drivers = self._range(start, end)
+        present_days, recorded_days = [], []
+        for _, recorded, present in days:
+            _increment(recorded_days, recorded)
+            _increment(present_days, present & recorded)
+        present_days = _unpack(present_days, len(drivers))
+        recorded_days = _unpack(recorded_days, len(drivers))
+        wanted = None if driver_ids is None else {str(d) for d in driver_ids}
+        return {
+            driver_id: {
+                "present": present_days[slot],
+                "recorded": recorded_days[slot],
+                "absence_rate": round(1 - present_days[slot] / recorded_days[slot], 4),
+            }
+            for slot, driver_id in enumerate(drivers)
+            if recorded_days[slot] and (wanted is None or driver_id in wanted)
+        }
+
+    def absence_streaks(self, start, end, min_days=1):
+        """{driver_id: {longest, current}} consecutive absences in start..end, for longest >= min_days.
+
+        A day the driver was not on the roster ends the streak; days nobody
+        was recorded are skipped.
+        """
+        days, drivers = self._range(start, end)
+        run, longest = [], []
+        for _, recorded, present in days:
+            absent = recorded & ~present
+            run = [bits & absent for bits in run]
+            _increment(run, absent)
+            _maximum(longest, run)
+        if not any(longest):
+            return {}
+        longest = _unpack(longest, len(drivers))
+        current = _unpack(run, len(drivers))
+        return {
+            drivers[slot]: {"longest": days_absent, "current": current[slot]}
+            for slot, days_absent in enumerate(longest)
+            if days_absent >= max(min_days, 1)
+        }
+
+
+# -------------- ROLL-OVER --------------
+def rollover(repo, history, day=None):
+    """Store every driver's attendance for `day` (default today), then reset them all to Absent.
+
+    For a past day (a roll-over run late), drivers marked since then keep
+    their status, which belongs to the later day.
+    """
+    today = date.today()
+    day = day or today
+    drivers = list(repo.iter_list("drivers"))
+    marked_since = history.rates(day + timedelta(days=1), today) if day < today else {}
+    # Marks made through the day are kept, so running this twice loses nothing
+    statuses = {d["driver_id"]: d.get("attendance") == "Present" and str(d["driver_id"]) not in marked_since
+                for d in drivers}
+    history.record_day(day, statuses, keep_marked=True)
+    repo.update_many("drivers", {d["driver_id"]: {"attendance": "Absent"} for d in drivers
+                                 if d.get("attendance") != "Absent" and str(d["driver_id"]) not in marked_since})
+    return len(drivers)
+
+
+def parse_range(args):
+    """Read ?start=&end= ISO dates; returns (start, end, None) or (None, None, error)"""
+    try:
+        end = date.fromisoformat(args["end"]) if args.get("end") else date.today()
+        start = date.fromisoformat(args["start"]) if args.get("start") else end - timedelta(days=DEFAULT_DAYS - 1)
+    except ValueError:
+        return None, None, "start and end must be YYYY-MM-DD dates"
+    if start > end:
+        return None, None, "start must not be after end"
+    return start, end, None
+
+
+# -------------- APP --------------
+def init_app(app):
+    app.extensions['attendance'] = {
+        'path': app.config.get('ATTENDANCE_PATH'),
+        'instance': None,
+        'lock': threading.Lock(),
+    }
+
+
+def get_history():
+    """Return the attendance history of the current Flask app"""
+    state = current_app.extensions['attendance']
+    if state['instance'] is None:
+        with state['lock']:
+            if state['instance'] is None:
+                state['instance'] = AttendanceHistory(state['path'] or ':memory:')
+    return state['instance']
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Store the day's driver attendance and reset it")
+    parser.add_argument("--date", type=date.fromisoformat, help="day to store (default today)")
+    args = parser.parse_args()
+
+    from app import app
+    from repository import get_repository
+
+    with app.app_context():
+        count = rollover(get_repository(), get_history(), args.date)
+    print(f"Stored attendance of {count} drivers for {(args.date or date.today()).isoformat()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Attendance history benchmark
+Backfills years of daily attendance for a synthetic roster (85% present,
+new drivers joining part way through) into attendance.AttendanceHistory,
+then times each query over the whole range and over the last quarter.
+
+Results are first checked against a plain per-driver loop on a small
+roster.
+
+Usage:
+    python benchmarks/bench_attendance.py [--drivers 10000] [--years 3]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from attendance import AttendanceHistory
+
+
+def roster(drivers, days, rng, start=date(2020, 1, 1)):
+    """{day: {driver_id: present?}}; every tenth driver joins half way, Sundays are not recorded"""
+    history = {}
+    for n in range(days):
+        day = start + timedelta(days=n)
+        if day.weekday() == 6:
+            continue
+        history[day] = {str(i): rng.random() < 0.85 for i in range(drivers) if i % 10 or n >= days // 2}
+    return history
+
+
+def check(rng):
+    truth = roster(300, 200, rng)
+    history = AttendanceHistory(":memory:")
+    history.record_days(truth)
+    days = sorted(truth)
+    start, end = days[10], days[-5]
+    days = [day for day in days if start <= day <= end]
+
+    assert history.daily_counts(start, end) == [
+        {"day": day.isoformat(), "present": sum(truth[day].values()), "recorded": len(truth[day])} for day in days
+    ]
+    rates = history.rates(start, end)
+    streaks = history.absence_streaks(start, end)
+    for driver_id in map(str, range(300)):
+        marks = [truth[day][driver_id] for day in days if driver_id in truth[day]]
+        assert rates[driver_id]["present"] == sum(marks) and rates[driver_id]["recorded"] == len(marks)
+        run = longest = 0
+        for day in days:
+            run = run + 1 if truth[day].get(driver_id) is False else 0
+            longest = max(longest, run)
+        assert streaks.get(driver_id) == ({"longest": longest, "current": run} if longest else None), driver_id
+    print("results match a per-driver loop\n")
+
+
+def best_of(fn, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drivers", type=int, default=10000)
+    parser.add_argument("--years", type=float, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    check(rng)
+
+    truth = roster(args.drivers, int(args.years * 365), rng)
+    path = os.path.join(tempfile.mkdtemp(), "attendance.db")
+    history = AttendanceHistory(path)
+    start = time.perf_counter()
+    history.record_days(truth)
+    elapsed = time.perf_counter() - start
+    days = sorted(truth)
+    print(f"{args.drivers} drivers, {len(days)} recorded days: backfill {elapsed:.1f} s, "
+          f"file {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+    last = days[-1]
+    print(f"daily roll-over: {best_of(lambda: history.record_day(last, truth[last]), 3) * 1000:.1f} ms\n")
+    first_load = best_of(lambda: AttendanceHistory(path).daily_counts(last, last), 1)
+    print(f"first query of a process (loads every day): {first_load * 1000:.1f} ms")
+
+    quarter = last - timedelta(days=89)
+    print(f"{'query':<18} {'all days ms':>12} {'quarter ms':>11}")
+    for name, query in (
+        ("daily_counts", history.daily_counts),
+        ("rates", history.rates),
+        ("absence_streaks", lambda a, b: history.absence_streaks(a, b, 3)),
+    ):
+        whole = best_of(lambda: query(days[0], last))
+        recent = best_of(lambda: query(quarter, last))
+        print(f"{name:<18} {whole * 1000:>12.2f} {recent * 1000:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Clustering benchmark
+Builds clustering.ClusterIndex over a synthetic fleet of live positions
+(spread over one city, as generate_fleet.py places them), then times a
+cluster query and measures its JSON size at each zoom level next to the
+full /api/public/live-locations payload.
+
+Every level is checked to account for every bus, and bbox queries are
+compared against filtering the buses by hand. Positions and bboxes with
+NaN / infinite numbers must be skipped or rejected, not crash the index.
+
+Usage:
+    python benchmarks/bench_clusters.py [--buses 5000] [--spread 0.08]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clustering import MAX_ZOOM, ClusterIndex, _cell, parse_query
+from generate_fleet import live_locations
+
+
+def best_of(fn, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def check(index, locations, rng):
+    for zoom in range(MAX_ZOOM + 1):
+        total = sum(c["count"] for c in index.clusters(zoom))
+        assert total == len(locations), f"zoom {zoom}: {total} buses in clusters, expected {len(locations)}"
+    for _ in range(50):
+        zoom = rng.randrange(8, MAX_ZOOM + 1)
+        lat, lng = rng.choice(list(locations.values()))["lat"], rng.choice(list(locations.values()))["lng"]
+        bbox = (lng - 0.02, lat - 0.02, lng + 0.02, lat + 0.02)
+        x0, y0 = _cell(bbox[3], bbox[0], zoom)
+        x1, y1 = _cell(bbox[1], bbox[2], zoom)
+        expected = sum(
+            1 for loc in locations.values()
+            if x0 <= _cell(loc["lat"], loc["lng"], zoom)[0] <= x1 and y0 <= _cell(loc["lat"], loc["lng"], zoom)[1] <= y1
+        )
+        got = sum(c["count"] for c in index.clusters(zoom, bbox))
+        assert got == expected, f"zoom {zoom} bbox {bbox}: {got} buses, expected {expected}"
+
+
+def check_non_finite(locations):
+    bad = dict(locations)
+    bad["nan"] = {"lat": 21.76, "lng": "nan", "occupancy": 3}
+    bad["inf"] = {"lat": float("inf"), "lng": 72.15}
+    bad["nan-occupancy"] = {"lat": 21.76, "lng": 72.15, "occupancy": float("nan")}
+    index = ClusterIndex(bad)
+    assert index.bus_count == len(locations) + 1, index.bus_count
+    for zoom in range(MAX_ZOOM + 1):
+        for cluster in index.clusters(zoom):
+            assert cluster["avg_occupancy"] is None or cluster["avg_occupancy"] == cluster["avg_occupancy"], cluster
+    for bbox in ("nan,0,1,1", "0,0,inf,1", "-inf,0,1,1"):
+        zoom, parsed, error = parse_query({"zoom": "12", "bbox": bbox})
+        assert error and parsed is None, bbox
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buses", type=int, default=5000)
+    parser.add_argument("--spread", type=float, default=0.08, help="degrees around the city centre")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    buses = {str(i): {"status": "Active"} for i in range(1, args.buses + 1)}
+    locations = dict(live_locations(buses, rng, spread=args.spread))
+    full = len(json.dumps(locations).encode())
+
+    build = best_of(lambda: ClusterIndex(locations))
+    index = ClusterIndex(locations)
+    check(index, locations, rng)
+    check_non_finite(locations)
+    print(f"{len(locations)} buses: index built in {build * 1000:.1f} ms, "
+          f"full live-locations payload {full / 1024:.0f} KB\n")
+
+    print(f"{'zoom':>4} {'clusters':>9} {'query ms':>9} {'KB':>8}")
+    for zoom in range(0, MAX_ZOOM + 1):
+        query = best_of(lambda: index.clusters(zoom))
+        body = json.dumps(index.clusters(zoom)).encode()
+        print(f"{zoom:>4} {len(index.levels[zoom]):>9} {query * 1000:>9.2f} {len(body) / 1024:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
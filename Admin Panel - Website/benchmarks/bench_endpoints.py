@@ -0,0 +1,271 @@
+"""
+Endpoint benchmark
+Loads a synthetic fleet (generate_fleet.py) into a fresh store of the chosen
+backend, then times every route of app.py through the WSGI test client and
+writes throughput and p50/p99 latency per route to JSON.
+
+Requests run one at a time in this process, so the numbers are the cost of
+the app and its backend without any network or server in between (see
+bench_ingest.py for load through gunicorn). The firestore backend runs
+against fake_firestore.FakeClient.
+
+With --baseline, routes whose p50 got slower by more than --max-regression
+compared to an earlier result file are flagged, and the exit status is 1.
+
+Usage:
+    python benchmarks/bench_endpoints.py [--backend sqlalchemy] [--preset small] [--duration 1]
+                                         [--output FILE] [--baseline OLD.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Data keys of the ids returned by the add routes
+CREATED_ID = {"buses": "bus_id", "drivers": "driver_id", "routes": "route_id", "maintenance": "id"}
+
+
+def make_cases(ids):
+    """(endpoint, method, kind created/deleted or None, make(n) -> (path, request kwargs))"""
+    def pick(kind, n):
+        return ids[kind][n % len(ids[kind])]
+
+    login = {"data": {"username": "admin", "password": "admin123"}}
+    return [
+        ("login", "GET", None, lambda n: ("/", {})),
+        ("login", "POST", None, lambda n: ("/", login)),
+        ("logout", "GET", None, lambda n: ("/logout", {})),
+        ("dashboard", "GET", None, lambda n: ("/dashboard", {})),
+        ("list_buses", "GET", None, lambda n: ("/buses", {})),
+        ("list_drivers", "GET", None, lambda n: ("/drivers", {})),
+        ("list_routes", "GET", None, lambda n: ("/routes", {})),
+        ("maintenance_page", "GET", None, lambda n: ("/maintenance", {})),
+        ("api_public_buses", "GET", None, lambda n: ("/api/public/buses", {})),
+        ("api_public_routes", "GET", None, lambda n: ("/api/public/routes", {})),
+        ("api_public_drivers", "GET", None, lambda n: ("/api/public/drivers", {})),
+        ("api_public_live_locations", "GET", None, lambda n: ("/api/public/live-locations", {})),
+        ("api_public_clusters", "GET", None, lambda n: (f"/api/public/clusters?zoom={n % 18}", {})),
+        ("api_roster", "GET", None, lambda n: ("/api/roster", {})),
+        ("api_roster_solve", "POST", None, lambda n: ("/api/roster", {})),
+        ("api_jobs", "GET", None, lambda n: ("/api/jobs", {})),
+        ("api_run_job", "POST", None, lambda n: ("/api/jobs/roster", {})),
+        ("api_predictions", "GET", None, lambda n: (f"/api/predictions?bus_id={pick('buses', n)}", {})),
+        ("metrics", "GET", None, lambda n: ("/metrics", {})),
+        ("api_location_update", "POST", None, lambda n: ("/api/public/location-update", {"json": {
+            "bus_id": pick("buses", n), "lat": 21.76 + n * 1e-6, "lng": 72.15, "speed": 30, "occupancy": n % 60}})),
+
+        ("api_add_route", "POST", "routes", lambda n: ("/api/routes", {"json": {
+            "name": f"Bench {n}", "start_stop": "A", "end_stop": "B", "frequency_min": 15}})),
+        ("api_add_bus", "POST", "buses", lambda n: ("/api/buses", {"json": {
+            "number": f"BENCH-{n}", "route_id": pick("routes", n), "status": "Active"}})),
+        ("api_add_driver", "POST", "drivers", lambda n: ("/api/drivers", {"json": {
+            "name": f"Bench {n}", "phone": "9000000000"}})),
+        ("api_add_maintenance", "POST", "maintenance", lambda n: ("/api/maintenance", {"json": {
+            "bus_id": pick("buses", n), "issue": "Bench", "status": "Pending"}})),
+
+        ("api_update_route", "PUT", None, lambda n: (f"/api/routes/{pick('routes', n)}", {"json": {
+            "frequency_min": 10 + n % 20}})),
+        ("api_update_bus", "PUT", None, lambda n: (f"/api/buses/{pick('buses', n)}", {"json": {
+            "status": "Active"}})),
+        ("api_update_driver", "PUT", None, lambda n: (f"/api/drivers/{pick('drivers', n)}", {"json": {
+            "phone": f"9{n:09d}"}})),
+        ("api_driver_attendance", "POST", None, lambda n: (f"/api/drivers/{pick('drivers', n)}/attendance", {
+            "json": {"status": "Present" if n % 2 else "Absent"}})),
+        ("api_attendance_daily", "GET", None, lambda n: ("/api/attendance/daily", {})),
+        ("api_attendance_rates", "GET", None, lambda n: ("/api/attendance/rates", {})),
+        ("api_attendance_streaks", "GET", None, lambda n: ("/api/attendance/streaks?min_days=2", {})),
+        ("api_attendance_rollover", "POST", None, lambda n: ("/api/attendance/rollover", {"json": {
+            "date": (date(2020, 1, 1) + timedelta(days=n)).isoformat()}})),
+        ("api_update_maintenance", "PUT", None, lambda n: (f"/api/maintenance/{pick('maintenance', n)}", {
+            "json": {"status": "Resolved"}})),
+
+        ("api_delete_maintenance", "DELETE", "maintenance", None),
+        ("api_delete_bus", "DELETE", "buses", None),
+        ("api_delete_driver", "DELETE", "drivers", None),
+        ("api_delete_route", "DELETE", "routes", None),
+    ]
+
+
+DELETE_PATHS = {"routes": "/api/routes/{}", "buses": "/api/buses/{}", "drivers": "/api/drivers/{}",
+                "maintenance": "/api/maintenance/{}"}
+
+
+def percentile(values, p):
+    return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 3)
+
+
+def run_case(client, method, make, duration, min_requests, max_requests=None):
+    """Time requests until `duration` has passed; returns (stats, responses)"""
+    latencies, statuses, responses = [], {}, []
+    deadline = time.perf_counter() + duration
+    n = 0
+    while (n < min_requests or time.perf_counter() < deadline) and (max_requests is None or n < max_requests):
+        path, kwargs = make(n)
+        start = time.perf_counter()
+        response = client.open(path, method=method, **kwargs)
+        latencies.append(time.perf_counter() - start)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        responses.append(response)
+        n += 1
+    total = sum(latencies)
+    latencies.sort()
+    return {
+        "requests": n,
+        "req_per_sec": round(n / total, 1) if total else None,
+        "p50_ms": percentile(latencies, 0.50) if latencies else None,
+        "p99_ms": percentile(latencies, 0.99) if latencies else None,
+        "mean_ms": round(total / n * 1000, 3) if n else None,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }, responses
+
+
+def setup_backend(backend, tmp):
+    """Point app.py at a fresh store of `backend` before it is imported"""
+    os.environ["DATA_BACKEND"] = backend
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tmp, "bench.db")
+    os.environ["SHARED_STATE_PATH"] = os.path.join(tmp, "state.db")
+    os.environ["ATTENDANCE_PATH"] = os.path.join(tmp, "attendance.db")
+    os.environ.pop("METRICS_DIR", None)
+    # Jobs still run when a route triggers them, just not on the timer
+    os.environ["SCHEDULER"] = "0"
+    if backend == "firestore":
+        import firebase_service
+        from fake_firestore import FakeClient
+
+        firebase_service.set_client(FakeClient())
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, max_regression):
+    """Print p50 changes against a baseline result file; returns the regressed routes"""
+    regressed = []
+    print(f"\nagainst {baseline['meta'].get('commit')} ({baseline['meta'].get('backend')}, "
+          f"{baseline['meta'].get('sizes')}):")
+    for name, stats in results.items():
+        old = baseline["results"].get(name)
+        if not old or not old.get("p50_ms") or not stats.get("p50_ms"):
+            continue
+        change = stats["p50_ms"] / old["p50_ms"] - 1
+        flag = ""
+        if change > max_regression:
+            regressed.append(name)
+            flag = "  <-- slower"
+        print(f"  {name:<40} p50 {old['p50_ms']:>9} -> {stats['p50_ms']:>9} ms  {change:+7.1%}{flag}")
+    return regressed
+
+
+def main():
+    from generate_fleet import PRESETS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="sqlalchemy", choices=["sqlalchemy", "firestore", "memory"])
+    parser.add_argument("--preset", default="small", choices=sorted(PRESETS))
+    for kind in ("routes", "buses", "drivers", "maintenance"):
+        parser.add_argument(f"--{kind}", type=int, help=f"override the preset's {kind} count")
+    parser.add_argument("--duration", type=float, default=1.0, help="seconds per route")
+    parser.add_argument("--min-requests", type=int, default=5)
+    parser.add_argument("--output", help="result file (default benchmarks/results/endpoints-...json)")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p50 slowdown vs baseline")
+    args = parser.parse_args()
+
+    sizes = dict(PRESETS[args.preset])
+    sizes.update({k: getattr(args, k) for k in sizes if getattr(args, k) is not None})
+
+    tmp = tempfile.mkdtemp()
+    setup_backend(args.backend, tmp)
+
+    from app import app
+    from generate_fleet import generate
+    from repository import get_repository
+
+    with app.app_context():
+        if args.backend == "sqlalchemy":
+            from models import Admin, db
+
+            db.create_all()
+            db.session.add(Admin(username="admin", password="admin123"))
+            db.session.commit()
+        elif args.backend == "firestore":
+            import firebase_service
+
+            firebase_service.create_default_admin()
+        print(f"Generating {sizes} ({args.backend})")
+        start = time.perf_counter()
+        ids = generate(get_repository(), sizes)
+        print(f"  took {time.perf_counter() - start:.1f} s\n")
+
+    cases = make_cases(ids)
+    covered = {(endpoint, method) for endpoint, method, _, _ in cases}
+    missing = sorted(
+        (rule.endpoint, method) for rule in app.url_map.iter_rules() if rule.endpoint != "static"
+        for method in rule.methods - {"HEAD", "OPTIONS"} if (rule.endpoint, method) not in covered
+    )
+    if missing:
+        sys.exit(f"no benchmark case for {missing}; add them to make_cases()")
+
+    client = app.test_client()
+    client.post("/", data={"username": "admin", "password": "admin123"})
+    created = {kind: [] for kind in CREATED_ID}
+    results = {}
+    for endpoint, method, kind, make in cases:
+        # logout would end the benchmark session
+        case_client = app.test_client() if endpoint == "logout" else client
+        max_requests = None
+        if method == "DELETE":
+            targets = created[kind]
+            make = lambda n, targets=targets, kind=kind: (DELETE_PATHS[kind].format(targets[n]), {})
+            max_requests = len(targets)
+        stats, responses = run_case(case_client, method, make, args.duration, args.min_requests, max_requests)
+        if method == "POST" and kind:
+            created[kind].extend(r.get_json()[CREATED_ID[kind]] for r in responses if r.status_code == 200)
+
+        name = f"{method} {endpoint}"
+        results[name] = stats
+        print(f"{name:<40} {stats['req_per_sec']:>9} req/s  p50 {stats['p50_ms']:>9} ms  "
+              f"p99 {stats['p99_ms']:>9} ms  {stats['statuses']}")
+
+    commit = git_commit()
+    output = args.output or os.path.join(
+        ROOT, "benchmarks", "results", f"endpoints-{args.backend}-{args.preset}-{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    report = {
+        "meta": {
+            "commit": commit,
+            "backend": args.backend,
+            "sizes": sizes,
+            "duration": args.duration,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nwrote {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressed = compare(results, json.load(f), args.max_regression)
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
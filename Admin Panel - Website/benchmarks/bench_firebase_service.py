@@ -0,0 +1,64 @@
+"""
+firebase_service benchmark
+Compares per-document calls with the batched helpers, and cold with
+cached collection reads, against fake_firestore.FakeClient.
+
+Usage:
+    python benchmarks/bench_firebase_service.py [--docs 300] [--latency 0.01]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import firebase_service as fs
+from fake_firestore import FakeClient
+
+
+def run(label, client, fn):
+    before = client.round_trips
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28} {elapsed * 1000:9.1f} ms  {client.round_trips - before:6d} round trips")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds per simulated round trip")
+    args = parser.parse_args()
+
+    client = FakeClient(latency=args.latency)
+    fs.set_client(client)
+    rows = [{"number": str(i), "route_id": None, "status": "Active"} for i in range(args.docs)]
+
+    print(f"{args.docs} buses, {args.latency * 1000:.0f} ms per round trip")
+
+    print("writes")
+    ids = run("add_bus x N", client, lambda: [fs.add_bus(dict(r)) for r in rows])
+    run("update_bus x N", client, lambda: [fs.update_bus(i, {"status": "In Depot"}) for i in ids])
+    run("delete_bus x N", client, lambda: [fs.delete_bus(i) for i in ids])
+    ids = run("add_many", client, lambda: fs.add_many("buses", rows))
+    run("update_many", client, lambda: fs.update_many("buses", {i: {"status": "Active"} for i in ids}))
+
+    print("reads")
+    run("get_bus_by_id x N", client, lambda: [fs.get_bus_by_id(i) for i in ids])
+    run("get_many", client, lambda: fs.get_many("buses", ids))
+    fs.invalidate_cache()
+    run("get_all_buses (cold)", client, fs.get_all_buses)
+    run("get_all_buses (cached)", client, lambda: [fs.get_all_buses() for _ in range(100)])
+    fs.CACHE_TTL = 0  # force a version check on every call
+    run("get_all_buses (revalidate)", client, fs.get_all_buses)
+    fs.update_bus(ids[0], {"status": "Breakdown"})
+    buses = run("get_all_buses (after write)", client, fs.get_all_buses)
+    assert any(b["bus_id"] == ids[0] and b["status"] == "Breakdown" for b in buses)
+
+    run("delete_many", client, lambda: fs.delete_many("buses", ids))
+
+
+if __name__ == "__main__":
+    main()
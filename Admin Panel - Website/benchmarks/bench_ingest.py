@@ -0,0 +1,75 @@
+"""
+Ingest load benchmark
+Drives location updates at increasing concurrency against the sync Flask
+route and the async ingest service (both under gunicorn when installed,
+else the Flask dev server / a single uvicorn worker), and prints throughput, latency
+and 429 counts for each level.
+
+Usage:
+    python benchmarks/bench_ingest.py [--levels 1,10,100,500] [--duration 5] [--workers 2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadgen import free_port, have_module, run_load, start_server, summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def location_request(index, n):
+    body = json.dumps({"bus_id": index + 1, "lat": 21.76 + n * 1e-5, "lng": 72.15,
+                       "speed": 30, "occupancy": n % 60}).encode()
+    return "POST", "/api/public/location-update", body, {"Content-Type": "application/json"}
+
+
+def server_commands(workers, port):
+    sync = ([sys.executable, "-m", "gunicorn", "-w", str(workers), "-k", "gthread", "--threads", "8",
+             "-b", f"127.0.0.1:{port}", "wsgi:app"]
+            if have_module("gunicorn") else
+            [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port), "--with-threads"])
+    async_ = ([sys.executable, "-m", "gunicorn", "-w", str(workers), "-k", "uvicorn.workers.UvicornWorker",
+               "-b", f"127.0.0.1:{port}", "ingest:app"]
+              if have_module("gunicorn") else
+              [sys.executable, "-m", "uvicorn", "ingest:app", "--port", str(port), "--log-level", "warning"])
+    return {"sync": sync, "async": async_}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", default="1,10,100,500")
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(",")]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {"DATA_BACKEND": "memory", "SHARED_STATE_PATH": os.path.join(tmp, "state.db"), "SCHEDULER": "0"}
+        for name in ("sync", "async"):
+            if name == "async" and not have_module("uvicorn"):
+                print("async: skipped, uvicorn is not installed")
+                continue
+            port = free_port()
+            probe = "/health" if name == "async" else "/api/public/buses"
+            proc = start_server(server_commands(args.workers, port)[name], env, port, ROOT, probe)
+            try:
+                for level in levels:
+                    raw = asyncio.run(run_load("127.0.0.1", port, location_request, level, args.duration))
+                    results[f"{name}@{level}"] = summary = summarize(raw, args.duration)
+                    print(f"{name:>5} c={level:<4} {summary['ok_per_sec']:>9} ok/s  "
+                          f"p50 {summary['p50_ms']} ms  p99 {summary['p99_ms']} ms  {summary['statuses']}")
+            finally:
+                proc.terminate()
+                proc.wait()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Metrics overhead benchmark
+Times the same requests through the Flask test client with and without
+metrics.init_app, for a plain and a streamed (chunked) response, and the
+raw cost of the registry operations.
+
+Usage:
+    python benchmarks/bench_metrics.py [--requests 2000]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ["DATA_BACKEND"] = "memory"
+os.environ.pop("METRICS_DIR", None)
+
+from flask import Flask, Response, jsonify, stream_with_context
+
+import metrics
+
+# Chunks per streamed response
+STREAM_CHUNKS = 20
+
+
+def make_app(instrumented):
+    app = Flask(__name__)
+    app.config["DATA_BACKEND"] = "memory"
+
+    @app.route("/ping")
+    def ping():
+        return jsonify({"ok": True})
+
+    @app.route("/stream")
+    def stream():
+        def generate():
+            for i in range(STREAM_CHUNKS):
+                yield b'{"chunk": %d}\n' % i
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    if instrumented:
+        metrics.init_app(app)
+    return app
+
+
+def time_requests(app, n, path="/ping"):
+    client = app.test_client()
+    client.get(path).get_data()
+    start = time.perf_counter()
+    for _ in range(n):
+        client.get(path).get_data()
+    return (time.perf_counter() - start) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    for label, path in (("request", "/ping"), ("streamed", "/stream")):
+        plain = min(time_requests(make_app(False), args.requests, path) for _ in range(3))
+        instrumented = min(time_requests(make_app(True), args.requests, path) for _ in range(3))
+        print(f"{label + ' without metrics:':<25}{plain * 1e6:8.1f} us")
+        print(f"{label + ' with metrics:':<25}{instrumented * 1e6:8.1f} us  (+{(instrumented - plain) * 1e6:.1f} us)")
+
+    registry = metrics.Registry()
+    labels = (("endpoint", "ping"), ("method", "GET"))
+    start = time.perf_counter()
+    for i in range(100000):
+        registry.observe("latency", i * 1e-5, metrics.LATENCY_BUCKETS, labels)
+    print(f"histogram observe:       {(time.perf_counter() - start) * 10:8.2f} us")
+
+    start = time.perf_counter()
+    for _ in range(100):
+        metrics.render()
+    print(f"render /metrics:         {(time.perf_counter() - start) * 10:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
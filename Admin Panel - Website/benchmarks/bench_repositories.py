@@ -0,0 +1,127 @@
+"""
+Repository conformance + benchmark
+Runs the same checks and timings against every available data backend.
+
+The firestore backend runs against fake_firestore.FakeClient, with
+--firestore-latency seconds slept per simulated round trip.
+
+Usage:
+    python benchmarks/bench_repositories.py [--rows 2000] [--backends memory,sqlalchemy]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+import firebase_service
+import repository
+from fake_firestore import FakeClient
+from models import db
+
+
+def make_app(backend, firestore_latency=0.0):
+    """Small Flask app with an in-memory SQLite database"""
+    if backend == "firestore":
+        firebase_service.set_client(FakeClient(latency=firestore_latency))
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["DATA_BACKEND"] = backend
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        repository.init_app(app, db)
+    return app
+
+
+# -------------- CONFORMANCE --------------
+def check_conformance(repo):
+    """Assert the behaviour every backend must share"""
+    bus_id = repo.add("buses", {"number": "C-1", "route_id": None, "status": "Active"})
+    bus = repo.get("buses", bus_id)
+    assert bus["bus_id"] == bus_id and bus["number"] == "C-1", bus
+    assert any(b["bus_id"] == bus_id for b in repo.list("buses"))
+
+    assert repo.update("buses", bus_id, {"status": "Breakdown", "ignored": 1})
+    bus = repo.get("buses", bus_id)
+    assert bus["status"] == "Breakdown" and "ignored" not in bus, bus
+
+    assert repo.update("buses", "does-not-exist", {"status": "x"}) is False
+    assert repo.get("buses", "does-not-exist") is None
+
+    ids = repo.add_many("drivers", [{"name": f"D{i}", "phone": str(i), "attendance": "Absent"} for i in range(5)])
+    assert len(ids) == 5
+    rows = repo.get_many("drivers", ids + ["does-not-exist"])
+    assert set(rows) == set(ids), rows
+    assert repo.update_many("drivers", {i: {"attendance": "Present"} for i in ids}) == 5
+    assert all(r["attendance"] == "Present" for r in repo.get_many("drivers", ids).values())
+    assert repo.delete_many("drivers", ids) == 5
+    assert repo.get_many("drivers", ids) == {}
+
+    # list() carries the related display names
+    route_id = repo.add("routes", {"name": "C-Route", "start_stop": "A", "end_stop": "B"})
+    assert repo.update("buses", bus_id, {"route_id": route_id})
+    log_id = repo.add("maintenance", {"bus_id": bus_id, "issue": "Brakes", "status": "Pending"})
+    assert next(b for b in repo.list("buses") if b["bus_id"] == bus_id)["route_name"] == "C-Route"
+    assert next(m for m in repo.list("maintenance") if m["id"] == log_id)["bus_number"] == "C-1"
+    assert repo.delete("maintenance", log_id) and repo.delete("routes", route_id)
+
+    assert repo.delete("buses", bus_id)
+    assert repo.delete("buses", bus_id) is False
+
+    repo.update_live_location(bus_id, {"lat": 21.76, "lng": 72.15, "speed": 30, "occupancy": 10})
+    live = repo.get_live_locations()[str(bus_id)]
+    assert live["lat"] == 21.76 and "last_update" in live, live
+
+
+# -------------- BENCHMARK --------------
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def bench(repo, rows):
+    data = [{"number": f"B{i}", "route_id": None, "status": "Active"} for i in range(rows)]
+    results = {}
+
+    ids, results["add_many"] = timed(lambda: repo.add_many("buses", data))
+    _, results["list"] = timed(lambda: repo.list("buses"))
+    _, results["get_many"] = timed(lambda: repo.get_many("buses", ids))
+    sample = ids[:min(200, len(ids))]
+    _, elapsed = timed(lambda: [repo.get("buses", i) for i in sample])
+    results["get x1 (avg)"] = elapsed / len(sample)
+    _, results["update_many"] = timed(lambda: repo.update_many("buses", {i: {"status": "In Depot"} for i in ids}))
+    _, results["delete_many"] = timed(lambda: repo.delete_many("buses", ids))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--backends", default="memory,sqlalchemy,firestore")
+    parser.add_argument("--firestore-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    for backend in args.backends.split(","):
+        try:
+            app = make_app(backend, args.firestore_latency)
+        except Exception as e:
+            print(f"[{backend}] skipped: {e}")
+            continue
+
+        with app.app_context():
+            repo = repository.get_repository()
+            check_conformance(repo)
+            print(f"[{backend}] conformance OK")
+            for op, seconds in bench(repo, args.rows).items():
+                per_sec = args.rows / seconds if "avg" not in op and seconds else 1 / seconds
+                print(f"  {op:<14} {seconds * 1000:9.2f} ms  {per_sec:12.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Rostering benchmark
+Generates a city timetable with generate_fleet.py's row factories, solves
+the day's roster with rostering.Roster and times it. Then it marks drivers
+absent and breaks buses down one at a time in the middle of the day, timing
+each incremental repair, with and without the shared-state round trip
+(from_dict + to_dict) the web app adds.
+
+After the solve and after all repairs, the roster is checked against every
+rule (Roster.violations). Repairs must also leave the trips that had
+already departed unchanged.
+
+Usage:
+    python benchmarks/bench_roster.py [--routes 100] [--buses 800] [--drivers 1500] [--events 20]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_fleet import bus_rows, route_rows
+from rostering import Roster, generate_trips
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--routes", type=int, default=100)
+    parser.add_argument("--buses", type=int, default=800)
+    parser.add_argument("--drivers", type=int, default=1500)
+    parser.add_argument("--events", type=int, default=20, help="driver absences and bus breakdowns each")
+    parser.add_argument("--now", default="12:00", help="time of day of the events")
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    routes = [dict(row, route_id=i + 1) for i, row in enumerate(route_rows(args.routes, rng))]
+    buses = {i + 1: row["route_id"] for i, row in enumerate(bus_rows(args.buses, [r["route_id"] for r in routes], rng))
+             if row["status"] == "Active"}
+    drivers = list(range(1, args.drivers + 1))
+
+    trips, ms = timed(lambda: generate_trips(routes))
+    print(f"{len(trips)} trips from {len(routes)} routes in {ms:.1f} ms; "
+          f"{len(buses)} Active buses, {len(drivers)} present drivers")
+    roster, ms = timed(lambda: Roster(trips, buses, drivers).solve())
+    print(f"solve: {ms:.1f} ms  {roster.summary()}")
+    problems = roster.violations()
+    assert not problems, problems[:5]
+
+    hours, minutes = map(int, args.now.split(":"))
+    now = hours * 60 + minutes
+    departed = {t: (roster.bus_of.get(t), roster.driver_of.get(t)) for t, trip in roster.trips.items() if trip[2] < now}
+
+    def events():
+        working = [d for d, trips in roster.driver_trips.items() if any(start >= now for start, _, _ in trips)]
+        running = [b for b, trips in roster.bus_trips.items() if any(start >= now for start, _, _ in trips)]
+        for driver_id in rng.sample(working, min(args.events, len(working))):
+            yield f"driver {driver_id} absent", lambda r, d=driver_id: r.driver_absent(d, now)
+        for bus_id in rng.sample(running, min(args.events, len(running))):
+            yield f"bus {bus_id} broke down", lambda r, b=bus_id: r.bus_unavailable(b, now)
+
+    repair_ms, stored_ms = [], []
+    print(f"\nevents at {args.now}:")
+    for name, event in events():
+        changed, ms = timed(lambda: event(roster))
+        repair_ms.append(ms)
+        uncovered = sum(1 for c in changed if c["bus_id"] is None)
+        stored, total = timed(lambda: Roster.from_dict(roster.to_dict()))
+        stored_ms.append(ms + total)
+        print(f"  {name:<26} {len(changed):>3} trips changed, {uncovered} uncovered  {ms:7.2f} ms")
+        roster = stored
+
+    print(f"\nrepair: max {max(repair_ms):.1f} ms, mean {sum(repair_ms) / len(repair_ms):.1f} ms; "
+          f"with the shared-state round trip max {max(stored_ms):.1f} ms")
+    print(f"after the events: {roster.summary()}")
+    problems = roster.violations()
+    assert not problems, problems[:5]
+    moved = [t for t, before in departed.items() if (roster.bus_of.get(t), roster.driver_of.get(t)) != before]
+    assert not moved, f"departed trips changed: {moved[:5]}"
+    print("roster valid, departed trips untouched")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Serialization benchmark
+Encodes a synthetic driver table with each available JSON encoder and with
+MessagePack, then compares peak memory of building a whole list response
+with serialization.stream_list's chunked output.
+
+Usage:
+    python benchmarks/bench_serialization.py [--rows 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+import serialization
+from generate_fleet import driver_rows
+
+
+def rows(n):
+    for i, row in enumerate(driver_rows(n, random.Random(1))):
+        yield dict(row, driver_id=i + 1)
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+    data = list(rows(args.rows))
+
+    for name, (dumps, loads) in serialization.ENCODERS.items():
+        start = time.perf_counter()
+        body = dumps(data)
+        encode = time.perf_counter() - start
+        start = time.perf_counter()
+        loads(body)
+        print(f"{name:>8}: encode {encode * 1000:7.1f} ms  decode {(time.perf_counter() - start) * 1000:7.1f} ms  "
+              f"{len(body) / 1e6:6.2f} MB")
+    if serialization.msgpack is not None:
+        start = time.perf_counter()
+        body = serialization.msgpack.packb(data)
+        encode = time.perf_counter() - start
+        start = time.perf_counter()
+        serialization.msgpack.unpackb(body)
+        print(f"{'msgpack':>8}: encode {encode * 1000:7.1f} ms  decode {(time.perf_counter() - start) * 1000:7.1f} ms  "
+              f"{len(body) / 1e6:6.2f} MB")
+
+    app = Flask(__name__)
+    serialization.init_app(app)
+
+    def whole():
+        with app.test_request_context():
+            app.json.response(list(rows(args.rows))).get_data()
+
+    def streamed(accept):
+        def run():
+            with app.test_request_context(headers={"Accept": accept}):
+                for _ in serialization.stream_list(rows(args.rows)).response:
+                    pass
+        return run
+
+    print(f"\npeak memory for {args.rows} rows ({serialization.ENCODER}):")
+    print(f"  list + jsonify   {peak_memory(whole) / 1e6:7.1f} MB")
+    print(f"  streamed JSON    {peak_memory(streamed('application/json')) / 1e6:7.1f} MB")
+    print(f"  streamed NDJSON  {peak_memory(streamed('application/x-ndjson')) / 1e6:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Shared state benchmark
+Several writer processes post live locations into one shared_state.SharedState
+file while this process reads it, checking that every write becomes visible
+and timing writes, cold reads and cached reads.
+
+Usage:
+    python benchmarks/bench_shared_state.py [--workers 4] [--buses 500] [--rounds 20]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared_state import SharedState
+
+
+def writer(path, worker, buses, rounds, batch):
+    state = SharedState(path)
+    start = time.perf_counter()
+    for r in range(rounds):
+        records = [
+            (f"W{worker}-{b}", {"lat": 21.7 + r * 1e-4, "lng": 72.1, "speed": 30, "occupancy": r})
+            for b in range(buses)
+        ]
+        if batch:
+            state.update_live_locations(records)
+        else:
+            for bus_id, location in records:
+                state.update_live_location(bus_id, location)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--buses", type=int, default=500, help="buses per worker")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for batch in (False, True):
+            path = os.path.join(tmp, f"state-{batch}.db")
+            reader = SharedState(path)
+            reader.get_live_locations()
+
+            with multiprocessing.Pool(args.workers) as pool:
+                jobs = [(path, w, args.buses, args.rounds, batch) for w in range(args.workers)]
+                start = time.perf_counter()
+                pool.starmap(writer, jobs)
+                elapsed = time.perf_counter() - start
+
+            writes = args.workers * args.buses * args.rounds
+            live = reader.get_live_locations()
+            assert len(live) == args.workers * args.buses, len(live)
+            assert all(info["occupancy"] == args.rounds - 1 for info in live.values())
+            label = "batched" if batch else "per-row"
+            print(f"{label:>8} writes: {writes / elapsed:10.0f} locations/s across {args.workers} processes")
+
+        start = time.perf_counter()
+        reader._live = None
+        reader.get_live_locations()
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(100):
+            reader.get_live_locations()
+        cached = (time.perf_counter() - start) / 100
+        print(f"read {len(live)} locations: cold {cold * 1000:.2f} ms, unchanged {cached * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
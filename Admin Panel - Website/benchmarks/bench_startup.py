@@ -0,0 +1,77 @@
+"""
+Startup benchmark
+Measures, in fresh interpreters, how long `import app` takes and how long
+the first request after import takes (lazy backends initialize there).
+
+Usage:
+    python benchmarks/bench_startup.py [--backend sqlalchemy] [--repeat 5]
+        [--max-import-ms 500] [--max-first-request-ms 500]
+
+Exits non-zero when a median exceeds one of the --max-* budgets, so it can
+gate CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TRIAL = """
+import json, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+response = app.app.test_client().get("/api/public/buses")
+t2 = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "first_request_ms": (t2 - t1) * 1000}))
+"""
+
+
+def run_trial(env):
+    out = subprocess.run(
+        [sys.executable, "-c", TRIAL], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="sqlalchemy", choices=["sqlalchemy", "memory"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float)
+    parser.add_argument("--max-first-request-ms", type=float)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATA_BACKEND=args.backend, SCHEDULER="0",
+                   DATABASE_URL="sqlite:///" + os.path.join(tmp, "startup.db"))
+        if args.backend == "sqlalchemy":
+            subprocess.run([sys.executable, "create_db.py", "--no-seed"], cwd=ROOT, env=env,
+                           check=True, capture_output=True)
+        trials = [run_trial(env) for _ in range(args.repeat)]
+
+    result = {
+        "backend": args.backend,
+        "import_ms": round(statistics.median(t["import_ms"] for t in trials), 2),
+        "first_request_ms": round(statistics.median(t["first_request_ms"] for t in trials), 2),
+    }
+    print(json.dumps(result, indent=2))
+
+    failed = False
+    if args.max_import_ms is not None and result["import_ms"] > args.max_import_ms:
+        print(f"import took {result['import_ms']:.1f} ms, budget {args.max_import_ms} ms")
+        failed = True
+    if args.max_first_request_ms is not None and result["first_request_ms"] > args.max_first_request_ms:
+        print(f"first request took {result['first_request_ms']:.1f} ms, budget {args.max_first_request_ms} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Query count check
+Seeds the SQLAlchemy backend at a small and a realistic size, requests the
+dashboard, list pages and public APIs under app.testing with a per-page
+SQL_QUERY_BUDGET, and fails if any page runs more statements than its
+budget or more statements at the larger size (an N+1).
+
+Also checks that the guard catches a view that walks MaintenanceLog.bus
+lazily.
+
+Usage:
+    python benchmarks/check_query_counts.py [--buses 2000] [--maintenance 20000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TMP = tempfile.mkdtemp()
+os.environ["DATA_BACKEND"] = "sqlalchemy"
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(TMP, "queries.db")
+os.environ["SHARED_STATE_PATH"] = os.path.join(TMP, "state.db")
+os.environ.pop("METRICS_DIR", None)
+# Only the SQL of the requests themselves, no background jobs
+os.environ["SCHEDULER"] = "0"
+
+from sqlalchemy import event
+
+import metrics
+from app import app
+from models import Admin, MaintenanceLog, db
+from repository import get_repository
+
+# Page -> most SQL statements it may run, whatever the data size
+PAGES = {
+    "/dashboard": 4,
+    "/buses": 1,
+    "/drivers": 1,
+    "/routes": 1,
+    "/maintenance": 1,
+    "/api/public/buses": 1,
+    "/api/public/routes": 1,
+    "/api/public/drivers": 1,
+}
+
+
+@app.route("/_check/lazy-maintenance")
+@metrics.query_budget(5)
+def lazy_maintenance():
+    # Deliberate N+1: one SELECT per log for the bus
+    return {"buses": [log.bus.number for log in MaintenanceLog.query.limit(50)]}
+
+
+def seed(sizes):
+    db.drop_all()
+    db.create_all()
+    db.session.add(Admin(username="admin", password="admin123"))
+    db.session.commit()
+    repo = get_repository()
+    route_ids = repo.add_many("routes", [
+        {"name": f"Route {i}", "start_stop": f"Stop {i}A", "end_stop": f"Stop {i}B"}
+        for i in range(sizes["routes"])
+    ])
+    bus_ids = repo.add_many("buses", [
+        {"number": f"GJ-04-{i:05d}", "route_id": route_ids[i % len(route_ids)], "status": "Active"}
+        for i in range(sizes["buses"])
+    ])
+    repo.add_many("drivers", [
+        {"name": f"Driver {i}", "phone": f"98{i:08d}", "attendance": "Present"}
+        for i in range(sizes["drivers"])
+    ])
+    repo.add_many("maintenance", [
+        {"bus_id": bus_ids[i % len(bus_ids)], "issue": "Brake check", "status": "Pending"}
+        for i in range(sizes["maintenance"])
+    ])
+
+
+def count_pages(client):
+    counts = {}
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "after_cursor_execute", on_execute)
+    try:
+        for path, budget in PAGES.items():
+            app.config["SQL_QUERY_BUDGET"] = budget
+            statements.clear()
+            response = client.get(path)
+            assert response.status_code == 200, (path, response.status_code)
+            # A streamed list runs its SQL (and its budget check) while the body is read
+            response.get_data()
+            counts[path] = len(statements)
+    finally:
+        event.remove(db.engine, "after_cursor_execute", on_execute)
+        app.config.pop("SQL_QUERY_BUDGET", None)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--routes", type=int, default=100)
+    parser.add_argument("--buses", type=int, default=2000)
+    parser.add_argument("--drivers", type=int, default=1000)
+    parser.add_argument("--maintenance", type=int, default=20000)
+    args = parser.parse_args()
+
+    sizes = {
+        "small": {"routes": 2, "buses": 5, "drivers": 5, "maintenance": 10},
+        "realistic": {"routes": args.routes, "buses": args.buses, "drivers": args.drivers,
+                      "maintenance": args.maintenance},
+    }
+    app.testing = True
+    results = {}
+    with app.app_context():
+        for label, size in sizes.items():
+            seed(size)
+            client = app.test_client()
+            client.post("/", data={"username": "admin", "password": "admin123"})
+            # QueryBudgetExceeded propagates from the request under app.testing
+            results[label] = count_pages(client)
+
+        client = app.test_client()
+        try:
+            client.get("/_check/lazy-maintenance")
+        except metrics.QueryBudgetExceeded as exc:
+            print(f"guard caught lazy loading: {exc}")
+        else:
+            raise AssertionError("query budget guard did not catch the N+1 view")
+
+    failed = False
+    for path in PAGES:
+        small, large = results["small"][path], results["realistic"][path]
+        ok = small == large
+        failed |= not ok
+        print(f"{path:<22} {small:>3} statements small, {large:>3} realistic, budget {PAGES[path]}"
+              f"{'' if ok else '  <-- grows with data'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Minimal asyncio HTTP/1.1 load generator used by the benchmark scripts.
+
+Keeps one keep-alive connection per concurrent client and records the
+status and latency of every request.
+"""
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+
+class Connection:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=b"", headers=None):
+        """Send one request; returns (status, headers, body)"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                 f"Content-Length: {len(body)}"]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed")
+        version, status = status_line.split()[:2]
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            data = b""
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                data += await self.reader.readexactly(size)
+                await self.reader.readline()
+        elif "content-length" in response_headers:
+            data = await self.reader.readexactly(int(response_headers["content-length"]))
+        else:
+            data = await self.reader.read()
+
+        if version == b"HTTP/1.0" or response_headers.get("connection", "").lower() == "close":
+            self.close()
+        return int(status), response_headers, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def run_load(host, port, make_request, concurrency, duration):
+    """Hammer host:port for `duration` seconds with `concurrency` clients.
+
+    make_request(client_index, n) returns (method, path, body, headers).
+    Returns a list of (status, latency_seconds); status 0 means a
+    connection error.
+    """
+    results = []
+    deadline = time.perf_counter() + duration
+
+    async def client(index):
+        conn = Connection(host, port)
+        n = 0
+        while time.perf_counter() < deadline:
+            method, path, body, headers = make_request(index, n)
+            n += 1
+            start = time.perf_counter()
+            try:
+                status, _, _ = await conn.request(method, path, body, headers)
+            except (ConnectionError, OSError, asyncio.IncompleteReadError, ValueError):
+                conn.close()
+                status = 0
+            results.append((status, time.perf_counter() - start))
+        conn.close()
+
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    return results
+
+
+def summarize(results, duration):
+    """Throughput, latency percentiles and status counts for run_load output"""
+    latencies = sorted(latency for status, latency in results if 200 <= status < 300)
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+
+    def pct(p):
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+    return {
+        "requests": len(results),
+        "ok_per_sec": round(len(latencies) / duration, 1),
+        "p50_ms": pct(0.50),
+        "p99_ms": pct(0.99),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else None,
+        "statuses": statuses,
+    }
+
+
+# -------------- SERVER HELPERS --------------
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, env, port, cwd, probe="/api/public/buses", timeout=30):
+    """Start a server subprocess and wait until `probe` answers"""
+    proc = subprocess.Popen(args, cwd=cwd, env=dict(os.environ, **env),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited: {' '.join(args)}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}{probe}", timeout=1)
+            return proc
+        except urllib.error.HTTPError:
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"server did not start: {' '.join(args)}")
+
+
+def have_module(name):
+    return subprocess.run([sys.executable, "-c", f"import {name}"], capture_output=True).returncode == 0
@@ -0,0 +1,313 @@
+"""
+Virtual-fleet GPS simulator
+Drives virtual buses back and forth along the routes served by
+/api/public/routes and posts their positions to the location-update API
+from a pool of client processes, at a configurable ping rate with jitter.
+
+Reports sustained pings/sec, error rate, request latency and the
+end-to-end latency from a ping being sent to its position showing up in
+GET /api/public/live-locations. In every process a few "probe" buses are
+watched by polling that API every --poll-interval seconds.
+
+With --start sync|async a throwaway fleet is generated (generate_fleet.py)
+and the admin panel is started under gunicorn; async also starts
+ingest.py, which receives the pings (and serves the batch variant used
+with --batch-size > 1). Otherwise point --target / --read at running
+servers.
+
+Usage:
+    python benchmarks/simulate_fleet.py --start async --buses 2000 --rate 1 --duration 20
+    python benchmarks/simulate_fleet.py --target http://127.0.0.1:5001 --read http://127.0.0.1:5000 \\
+                                        --batch-size 50
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+from urllib.request import urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadgen import Connection, free_port, have_module, start_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UPDATE_PATH = "/api/public/location-update"
+LIVE_PATH = "/api/public/live-locations"
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Bhavnagar city centre; stops without coordinates are placed around it
+CENTER = (21.7645, 72.1519)
+STOP_RADIUS_DEG = 0.06
+METERS_PER_DEG = 111_000
+
+
+def stop_position(name):
+    """Stable pseudo-coordinates for a stop name"""
+    digest = hashlib.sha1(name.encode()).digest()
+    angle = digest[0] / 255 * 2 * math.pi
+    radius = STOP_RADIUS_DEG * (0.2 + 0.8 * digest[1] / 255)
+    return CENTER[0] + radius * math.sin(angle), CENTER[1] + radius * math.cos(angle)
+
+
+class VirtualBus:
+    """Shuttles between its route's two stops at a roughly constant speed"""
+
+    def __init__(self, bus_id, route, rng):
+        self.bus_id = bus_id
+        self.start = stop_position(route["start_stop"] or "start")
+        self.end = stop_position(route["end_stop"] or "end")
+        self.speed_kmh = rng.uniform(18, 40)
+        length_m = max(math.dist(self.start, self.end) * METERS_PER_DEG, 500)
+        self.trip_s = length_m / (self.speed_kmh / 3.6)
+        self.phase = rng.random() * 2
+        self.occupancy = rng.randrange(0, 40)
+        self.rng = rng
+
+    def ping(self, now):
+        leg = (now / self.trip_s + self.phase) % 2
+        f = leg if leg < 1 else 2 - leg
+        self.occupancy = min(60, max(0, self.occupancy + self.rng.randint(-2, 2)))
+        return {
+            "bus_id": self.bus_id,
+            "lat": round(self.start[0] + (self.end[0] - self.start[0]) * f, 6),
+            "lng": round(self.start[1] + (self.end[1] - self.start[1]) * f, 6),
+            "speed": round(self.speed_kmh + self.rng.uniform(-3, 3), 1),
+            "occupancy": self.occupancy,
+        }
+
+
+# -------------- CLIENT PROCESS --------------
+async def drive(target, read, buses, routes, opts, start_at, seed):
+    rng = random.Random(seed)
+    fleet = [VirtualBus(bus["bus_id"], routes[str(bus["route_id"])], rng) for bus in buses]
+    probes = {str(bus.bus_id) for bus in fleet[:opts["probes"]]}
+    sent = {}  # (bus_id, lat, lng) -> send time, probe buses only
+    stats = {"pings": 0, "ok": 0, "statuses": {}, "rtt": [], "visibility": [], "late": 0}
+    pool = asyncio.Queue()
+    for _ in range(opts["connections"]):
+        pool.put_nowait(Connection(*target))
+    deadline = start_at + opts["duration"]
+    interval = 1.0 / opts["rate"]
+
+    async def post(path, payload, pings):
+        body = json.dumps(payload).encode()
+        conn = await pool.get()
+        begin = time.perf_counter()
+        try:
+            status, _, _ = await conn.request("POST", path, body, JSON_HEADERS)
+        except (ConnectionError, OSError, asyncio.IncompleteReadError, ValueError):
+            conn.close()
+            status = 0
+        finally:
+            pool.put_nowait(conn)
+        stats["rtt"].append(time.perf_counter() - begin)
+        stats["statuses"][status] = stats["statuses"].get(status, 0) + 1
+        stats["pings"] += pings
+        if status == 200:
+            stats["ok"] += pings
+
+    async def group_loop(group):
+        # First ping at a random phase so processes don't ping in lockstep
+        next_at = start_at + rng.uniform(0, interval)
+        while True:
+            now = time.time()
+            if next_at > now:
+                await asyncio.sleep(next_at - now)
+            if time.time() >= deadline:
+                return
+            updates = [bus.ping(time.time()) for bus in group]
+            for update in updates:
+                if str(update["bus_id"]) in probes:
+                    sent[(str(update["bus_id"]), update["lat"], update["lng"])] = time.perf_counter()
+            if len(updates) == 1:
+                await post(UPDATE_PATH, updates[0], 1)
+            else:
+                await post(UPDATE_PATH + "/batch", {"updates": updates}, len(updates))
+            next_at += interval * (1 + rng.uniform(-opts["jitter"], opts["jitter"]))
+            if next_at < time.time() - interval:
+                # Can't keep up: skip missed pings instead of bursting
+                stats["late"] += 1
+                next_at = time.time()
+
+    async def observe():
+        if not probes:
+            return
+        conn = Connection(*read)
+        path = f"{LIVE_PATH}?bus_ids={','.join(sorted(probes))}"
+        await asyncio.sleep(max(0.0, start_at - time.time()))
+        # Keep watching a little after the last ping
+        while time.time() < deadline + opts["settle"]:
+            try:
+                status, _, body = await conn.request("GET", path)
+            except (ConnectionError, OSError, asyncio.IncompleteReadError, ValueError):
+                conn.close()
+                status, body = 0, b""
+            seen_at = time.perf_counter()
+            if status == 200:
+                for bus_id, location in json.loads(body).items():
+                    sent_at = sent.pop((bus_id, location.get("lat"), location.get("lng")), None)
+                    if sent_at is not None:
+                        stats["visibility"].append(seen_at - sent_at)
+            await asyncio.sleep(opts["poll_interval"])
+        conn.close()
+
+    size = opts["batch_size"]
+    groups = [fleet[i:i + size] for i in range(0, len(fleet), size)]
+    await asyncio.gather(observe(), *(group_loop(group) for group in groups))
+    while not pool.empty():
+        pool.get_nowait().close()
+    # Probe pings never seen: overwritten by a newer ping first, or lost
+    stats["unseen"] = len(sent)
+    return stats
+
+
+def client_process(args):
+    return asyncio.run(drive(*args))
+
+
+# -------------- REPORT --------------
+def percentiles(values):
+    if not values:
+        return {"p50_ms": None, "p99_ms": None, "max_ms": None}
+    values = sorted(values)
+
+    def pct(p):
+        return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 2)
+
+    return {"p50_ms": pct(0.50), "p99_ms": pct(0.99), "max_ms": round(values[-1] * 1000, 2)}
+
+
+def summarize(results, opts, n_buses):
+    pings = sum(r["pings"] for r in results)
+    ok = sum(r["ok"] for r in results)
+    statuses = {}
+    for r in results:
+        for status, count in r["statuses"].items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+    return {
+        "buses": n_buses,
+        "target_pings_per_sec": round(n_buses * opts["rate"], 1),
+        "pings_per_sec": round(ok / opts["duration"], 1),
+        "pings": pings,
+        "error_rate": round(1 - ok / pings, 4) if pings else None,
+        "statuses": statuses,
+        "late_ticks": sum(r["late"] for r in results),
+        "request": percentiles([t for r in results for t in r["rtt"]]),
+        "visibility": dict(percentiles([t for r in results for t in r["visibility"]]),
+                           samples=sum(len(r["visibility"]) for r in results),
+                           unseen=sum(r["unseen"] for r in results)),
+    }
+
+
+# -------------- LOCAL SERVERS --------------
+def start_local(mode, buses, routes, workers, tmp):
+    env = {
+        "DATA_BACKEND": "sqlalchemy",
+        "DATABASE_URL": "sqlite:///" + os.path.join(tmp, "sim.db"),
+        "SHARED_STATE_PATH": os.path.join(tmp, "state.db"),
+        "METRICS_DIR": os.path.join(tmp, "metrics"),
+        "SCHEDULER": "0",
+    }
+    subprocess.run([sys.executable, "generate_fleet.py", "--fresh", "--routes", str(routes),
+                    "--buses", str(buses), "--drivers", "0", "--maintenance", "0"],
+                   cwd=ROOT, env=dict(os.environ, **env), check=True, stdout=subprocess.DEVNULL)
+
+    procs = []
+    app_port = free_port()
+    app_cmd = ([sys.executable, "-m", "gunicorn", "-w", str(workers), "-k", "gthread", "--threads", "8",
+                "-b", f"127.0.0.1:{app_port}", "wsgi:app"]
+               if have_module("gunicorn") else
+               [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(app_port), "--with-threads"])
+    procs.append(start_server(app_cmd, env, app_port, ROOT))
+    read = target = f"http://127.0.0.1:{app_port}"
+    if mode == "async":
+        ingest_port = free_port()
+        ingest_cmd = ([sys.executable, "-m", "gunicorn", "-w", str(workers), "-k", "uvicorn.workers.UvicornWorker",
+                       "-b", f"127.0.0.1:{ingest_port}", "ingest:app"]
+                      if have_module("gunicorn") else
+                      [sys.executable, "-m", "uvicorn", "ingest:app", "--port", str(ingest_port),
+                       "--log-level", "warning"])
+        procs.append(start_server(ingest_cmd, env, ingest_port, ROOT, probe="/health"))
+        target = f"http://127.0.0.1:{ingest_port}"
+    return target, read, procs
+
+
+def host_port(url):
+    parts = urlsplit(url)
+    return parts.hostname, parts.port or 80
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--start", choices=["sync", "async"], help="generate a fleet and start local servers")
+    parser.add_argument("--target", default="http://127.0.0.1:5000", help="server receiving the pings")
+    parser.add_argument("--read", help="server with the live-location API (default: --target)")
+    parser.add_argument("--buses", type=int, default=500)
+    parser.add_argument("--routes", type=int, default=20, help="routes to generate with --start")
+    parser.add_argument("--rate", type=float, default=1.0, help="pings per second per bus")
+    parser.add_argument("--jitter", type=float, default=0.2, help="+/- fraction of the ping interval")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--processes", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--connections", type=int, default=16, help="keep-alive connections per process")
+    parser.add_argument("--batch-size", type=int, default=1, help="pings per request (>1 uses /batch)")
+    parser.add_argument("--probes", type=int, default=5, help="buses per process watched for visibility")
+    parser.add_argument("--poll-interval", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=2, help="server workers with --start")
+    parser.add_argument("--output", help="write the summary to this JSON file")
+    args = parser.parse_args()
+
+    procs = []
+    tmp = tempfile.TemporaryDirectory()
+    try:
+        if args.start:
+            args.target, args.read, procs = start_local(args.start, args.buses, args.routes, args.workers, tmp.name)
+        read = args.read or args.target
+
+        routes = {str(r["route_id"]): r for r in json.load(urlopen(read + "/api/public/routes"))}
+        buses = [b for b in json.load(urlopen(read + "/api/public/buses")) if str(b["route_id"]) in routes]
+        buses = buses[:args.buses]
+        if not buses:
+            sys.exit("no buses with a route to simulate")
+
+        opts = {
+            "rate": args.rate, "jitter": args.jitter, "duration": args.duration, "connections": args.connections,
+            "batch_size": max(1, args.batch_size), "probes": args.probes, "poll_interval": args.poll_interval,
+            "settle": 2.0,
+        }
+        n = max(1, min(args.processes, len(buses)))
+        start_at = time.time() + 1.0
+        jobs = [(host_port(args.target), host_port(read), buses[i::n], routes, opts, start_at, i)
+                for i in range(n)]
+        print(f"{len(buses)} buses x {args.rate} pings/s from {n} processes for {args.duration:.0f} s "
+              f"-> {args.target}{' (batch ' + str(args.batch_size) + ')' if args.batch_size > 1 else ''}")
+        with multiprocessing.Pool(n) as pool:
+            results = pool.map(client_process, jobs)
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+        tmp.cleanup()
+
+    summary = summarize(results, opts, len(buses))
+    print(f"sustained      {summary['pings_per_sec']} pings/s (target {summary['target_pings_per_sec']}), "
+          f"error rate {summary['error_rate']:.2%}, statuses {summary['statuses']}")
+    print(f"request        p50 {summary['request']['p50_ms']} ms  p99 {summary['request']['p99_ms']} ms")
+    vis = summary["visibility"]
+    print(f"ping->visible  p50 {vis['p50_ms']} ms  p99 {vis['p99_ms']} ms  max {vis['max_ms']} ms  "
+          f"({vis['samples']} probe pings, {vis['unseen']} overwritten/unseen, poll {args.poll_interval * 1000:.0f} ms)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(dict(summary, options=opts, target=args.target), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
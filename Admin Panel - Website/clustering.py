@@ -0,0 +1,155 @@
+"""
+Map clustering
+Zoom-aware clusters of the live bus positions, so a zoomed-out map of
+thousands of buses is one small response instead of one marker per bus.
+
+Positions are projected to Web Mercator and binned into cells of CELL_PX
+screen pixels at MAX_ZOOM. Each coarser zoom level is then built by merging
+the 2x2 cells below it, so the whole pyramid costs one pass over the buses
+plus one pass per level over the occupied cells, and a query only reads the
+cells of one level:
+
+    index = cluster_index(get_repository())
+    index.clusters(zoom, bbox=(west, south, east, north))
+
+The pyramid is cached per process and rebuilt once the live positions have
+changed, at most every CLUSTER_REFRESH seconds.
+"""
+import math
+import os
+import threading
+import time
+
+TILE_PX = 256
+CELL_PX = 64
+TILE_CELLS = TILE_PX // CELL_PX
+# Finest level; at this zoom a cell is a few dozen metres
+MAX_ZOOM = 17
+# Web Mercator's latitude limit
+MAX_LAT = 85.05112878
+CLUSTER_REFRESH = float(os.environ.get("CLUSTER_REFRESH", 2))
+
+
+def _cell(lat, lng, zoom):
+    """(x, y) of the grid cell holding lat/lng at `zoom`"""
+    size = TILE_CELLS << zoom
+    lat = max(-MAX_LAT, min(MAX_LAT, lat))
+    sin_lat = math.sin(math.radians(lat))
+    x = (lng + 180.0) / 360.0
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(int(x * size), 0), size - 1), min(max(int(y * size), 0), size - 1)
+
+
+def _number(value):
+    """`value` as a finite float, or None (NaN / inf positions are skipped)"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+class ClusterIndex:
+    """Per zoom level {cell: [count, lat sum, lng sum, occupancy sum, occupancy count, bus_id]}"""
+
+    def __init__(self, locations, max_zoom=MAX_ZOOM):
+        self.max_zoom = max_zoom
+        self.bus_count = 0
+        finest = {}
+        for bus_id, location in locations.items():
+            lat, lng = _number(location.get("lat")), _number(location.get("lng"))
+            if lat is None or lng is None:
+                continue
+            key = _cell(lat, lng, max_zoom)
+            cell = finest.get(key)
+            if cell is None:
+                finest[key] = cell = [0, 0.0, 0.0, 0.0, 0, bus_id]
+            cell[0] += 1
+            cell[1] += lat
+            cell[2] += lng
+            occupancy = _number(location.get("occupancy"))
+            if occupancy is not None:
+                cell[3] += occupancy
+                cell[4] += 1
+            self.bus_count += 1
+
+        self.levels = [None] * (max_zoom + 1)
+        self.levels[max_zoom] = finest
+        for zoom in range(max_zoom - 1, -1, -1):
+            merged = {}
+            for (x, y), child in self.levels[zoom + 1].items():
+                cell = merged.get((x >> 1, y >> 1))
+                if cell is None:
+                    merged[(x >> 1, y >> 1)] = list(child)
+                else:
+                    for i in range(5):
+                        cell[i] += child[i]
+            self.levels[zoom] = merged
+
+    def clusters(self, zoom, bbox=None):
+        """Clusters at `zoom`, only those inside bbox (west, south, east, north) if given"""
+        zoom = min(max(zoom, 0), self.max_zoom)
+        if bbox is not None:
+            west, south, east, north = bbox
+            x0, y0 = _cell(north, west, zoom)
+            x1, y1 = _cell(south, east, zoom)
+        result = []
+        for (x, y), (count, lat_sum, lng_sum, occupancy_sum, occupancy_count, bus_id) in self.levels[zoom].items():
+            if bbox is not None:
+                if not y0 <= y <= y1:
+                    continue
+                # west > east: the box crosses the antimeridian
+                if not (x0 <= x <= x1 if x0 <= x1 else x >= x0 or x <= x1):
+                    continue
+            cluster = {
+                "cell": f"{zoom}/{x}/{y}",
+                "count": count,
+                "lat": round(lat_sum / count, 6),
+                "lng": round(lng_sum / count, 6),
+                "avg_occupancy": round(occupancy_sum / occupancy_count, 1) if occupancy_count else None,
+            }
+            if count == 1:
+                cluster["bus_id"] = bus_id
+            result.append(cluster)
+        return result
+
+
+# -------------- CACHE --------------
+_lock = threading.Lock()
+_cached = None  # (repository, live version, built at, index)
+
+
+def cluster_index(repo, refresh=CLUSTER_REFRESH):
+    """The ClusterIndex of `repo`'s live locations, rebuilt when they change"""
+    global _cached
+    version = repo.live_locations_version()
+    with _lock:
+        if _cached is not None and _cached[0] is repo:
+            _, cached_version, built, index = _cached
+            if version is not None and version == cached_version:
+                return index
+            if time.monotonic() - built < refresh:
+                return index
+        index = ClusterIndex(repo.get_live_locations())
+        _cached = (repo, version, time.monotonic(), index)
+        return index
+
+
+def parse_query(args):
+    """Read ?zoom=Z[&bbox=west,south,east,north]; returns (zoom, bbox, None) or (None, None, error)"""
+    try:
+        zoom = int(args.get("zoom", ""))
+    except ValueError:
+        return None, None, "zoom must be an integer"
+    if zoom < 0:
+        return None, None, "zoom must be 0 or more"
+
+    bbox = args.get("bbox")
+    if bbox:
+        try:
+            bbox = tuple(float(v) for v in bbox.split(","))
+        except ValueError:
+            bbox = ()
+        if len(bbox) != 4 or not all(map(math.isfinite, bbox)) or bbox[1] > bbox[3]:
+            return None, None, "bbox must be west,south,east,north"
+    return min(zoom, MAX_ZOOM), bbox or None, None
@@ -0,0 +1,99 @@
+"""
+Response compression
+gzip / brotli for dynamic responses, negotiated from Accept-Encoding
+(brotli only when the `brotli` package is installed).
+
+Responses under COMPRESS_MIN_SIZE bytes, already encoded ones (the
+pre-compressed static files) and types that don't shrink pass through
+untouched. Streamed responses are compressed chunk by chunk, so
+serialization.stream_list keeps its flat memory use.
+"""
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only
+    brotli = None
+
+MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+# Fast settings: this runs on every request, unlike the static build
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+COMPRESSIBLE = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/msgpack",
+    "application/x-msgpack",
+    "image/svg+xml",
+)
+
+
+def choose_encoding(accept_encodings):
+    """br or gzip by the client's preference (br wins ties), else None"""
+    offers = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return accept_encodings.best_match(offers)
+
+
+def _compressor(encoding):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    # wbits 31: gzip container
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def compress(data, encoding):
+    feed, finish = _compressor(encoding)
+    return feed(data) + finish()
+
+
+def _compress_stream(chunks, encoding):
+    feed, finish = _compressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            out = feed(chunk)
+            if out:
+                yield out
+        yield finish()
+    finally:
+        # Closes stream_with_context, ending the request context
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def compress_response(response, accept_encodings):
+    """Compress `response` in place if worthwhile and accepted"""
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or not (response.mimetype or "").startswith(COMPRESSIBLE)):
+        return response
+    if not response.is_streamed and (response.content_length or 0) < MIN_SIZE:
+        return response
+    encoding = choose_encoding(accept_encodings)
+    response.vary.add("Accept-Encoding")
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        response.set_data(compress(response.get_data(), encoding))
+    response.content_encoding = encoding
+    return response
+
+
+def init_app(app):
+    from flask import request
+
+    @app.after_request
+    def _compress(response):
+        return compress_response(response, request.accept_encodings)
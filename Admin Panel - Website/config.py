@@ -2,7 +2,22 @@ import os
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
+# Database used by app.py and create_db.py (relative SQLite paths live in instance/)
+DATABASE_URI = os.environ.get("DATABASE_URL", "sqlite:///smart_bus.db")
+
+# Live positions + cache versions shared by all worker processes (see shared_state.py)
+SHARED_STATE_PATH = os.environ.get(
+    "SHARED_STATE_PATH", os.path.join(BASE_DIR, "instance", "shared_state.db")
+)
+
+# Per-day driver attendance bitmaps (see attendance.py)
+ATTENDANCE_PATH = os.environ.get(
+    "ATTENDANCE_PATH", os.path.join(BASE_DIR, "instance", "attendance.db")
+)
+
 class Config:
     SECRET_KEY = "change-this-secret-key"
     SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(BASE_DIR, "smart_bus.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Data backend used by the repository layer: sqlalchemy / firestore / memory
+    DATA_BACKEND = os.environ.get("DATA_BACKEND", "sqlalchemy")
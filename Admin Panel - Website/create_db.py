@@ -1,18 +1,68 @@
 # create_db.py
-from app import app, db
-from models import Admin, Bus, Driver, Route, MaintenanceLog
-
-with app.app_context():
-    # Drop all tables and recreate
-    db.drop_all()
-    db.create_all()
-
-    # default admin user
-    admin = Admin(username='admin', password='admin123')
-    db.session.add(admin)
-    db.session.commit()
-
-    print("Database & tables created, default admin user added.")
-    print("Default credentials:")
-    print("   Username: admin")
-    print("   Password: admin123")
+# Schema / seed CLI. Builds a bare Flask app with only the database
+# extension, so it doesn't import app.py or any of the web routes.
+import argparse
+import os
+
+from config import DATABASE_URI
+
+
+def make_db_app():
+    """Minimal Flask app bound to the same database as app.py"""
+    from flask import Flask
+    from models import db
+
+    # Named like app.py so both resolve the same instance/ folder
+    app = Flask("app")
+    app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URI
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    return app
+
+
+def create_sqlalchemy(drop=True, seed=True):
+    from models import db, Admin
+
+    app = make_db_app()
+    with app.app_context():
+        if drop:
+            # Drop all tables and recreate
+            db.drop_all()
+        db.create_all()
+
+        # default admin user
+        if seed and not Admin.query.filter_by(username='admin').first():
+            admin = Admin(username='admin', password='admin123')
+            db.session.add(admin)
+            db.session.commit()
+
+    print("Database & tables created" + (", default admin user added." if seed else "."))
+
+
+def create_firestore():
+    import firebase_service
+
+    firebase_service.create_default_admin()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the database schema and default admin user")
+    parser.add_argument("--backend", default=os.environ.get("DATA_BACKEND", "sqlalchemy"),
+                        choices=["sqlalchemy", "firestore"])
+    parser.add_argument("--keep", action="store_true", help="don't drop existing tables")
+    parser.add_argument("--no-seed", action="store_true", help="don't add the default admin user")
+    args = parser.parse_args()
+
+    if args.backend == "firestore":
+        create_firestore()
+    else:
+        create_sqlalchemy(drop=not args.keep, seed=not args.no_seed)
+
+    if not args.no_seed:
+        print("Default credentials:")
+        print("   Username: admin")
+        print("   Password: admin123")
+
+
+if __name__ == "__main__":
+    main()
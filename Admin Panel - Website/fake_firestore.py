@@ -0,0 +1,185 @@
+"""
+In-process fake Firestore client
+Implements the subset of google.cloud.firestore used by firebase_service,
+so it can be exercised and benchmarked without network or credentials.
+
+    import firebase_service
+    from fake_firestore import FakeClient
+
+    firebase_service.set_client(FakeClient(latency=0.02))
+
+`latency` is slept once per simulated round trip and `round_trips`
+counts them, which makes the cost of per-document calls visible.
+"""
+import copy
+import threading
+import time
+import uuid
+from datetime import datetime
+
+
+class NotFound(Exception):
+    """Raised when updating a document that does not exist"""
+
+
+class DocumentSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class DocumentReference:
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+
+    def _apply(self, op, data=None, merge=False):
+        docs = self._client._docs.setdefault(self._collection, {})
+        if op == 'set':
+            if merge and self.id in docs:
+                docs[self.id].update(copy.deepcopy(data))
+            else:
+                docs[self.id] = copy.deepcopy(data)
+        elif op == 'update':
+            if self.id not in docs:
+                raise NotFound(f"{self._collection}/{self.id}")
+            docs[self.id].update(copy.deepcopy(data))
+        else:
+            docs.pop(self.id, None)
+
+    def get(self):
+        self._client._round_trip()
+        with self._client._lock:
+            data = self._client._docs.get(self._collection, {}).get(self.id)
+            return DocumentSnapshot(self.id, copy.deepcopy(data))
+
+    def set(self, data, merge=False):
+        self._client._round_trip()
+        with self._client._lock:
+            self._apply('set', data, merge)
+
+    def update(self, data):
+        self._client._round_trip()
+        with self._client._lock:
+            self._apply('update', data)
+
+    def delete(self):
+        self._client._round_trip()
+        with self._client._lock:
+            self._apply('delete')
+
+
+class Query:
+    def __init__(self, client, collection, filters=(), order=None, limit=None):
+        self._client = client
+        self._collection = collection
+        self._filters = list(filters)
+        self._order = order
+        self._limit = limit
+
+    def where(self, field, op, value):
+        if op != '==':
+            raise NotImplementedError(f"fake_firestore only supports '==', got {op!r}")
+        return Query(self._client, self._collection, self._filters + [(field, value)], self._order, self._limit)
+
+    def order_by(self, field, direction='ASCENDING'):
+        return Query(self._client, self._collection, self._filters, (field, direction), self._limit)
+
+    def limit(self, count):
+        return Query(self._client, self._collection, self._filters, self._order, count)
+
+    def stream(self):
+        self._client._round_trip()
+        with self._client._lock:
+            items = list(self._client._docs.get(self._collection, {}).items())
+        items = [
+            (doc_id, data) for doc_id, data in items
+            if all(data.get(field) == value for field, value in self._filters)
+        ]
+        if self._order:
+            field, direction = self._order
+            items = [item for item in items if field in item[1]]
+            items.sort(key=lambda item: item[1][field], reverse=(direction == 'DESCENDING'))
+        if self._limit is not None:
+            items = items[:self._limit]
+        for doc_id, data in items:
+            yield DocumentSnapshot(doc_id, copy.deepcopy(data))
+
+
+class CollectionReference(Query):
+    def document(self, doc_id=None):
+        return DocumentReference(self._client, self._collection, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return datetime.now(), ref
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, ref, data, merge=False):
+        self._writes.append((ref, 'set', data, merge))
+
+    def update(self, ref, data):
+        self._writes.append((ref, 'update', data, False))
+
+    def delete(self, ref):
+        self._writes.append((ref, 'delete', None, False))
+
+    def commit(self):
+        if len(self._writes) > 500:
+            raise ValueError("A batch can contain at most 500 writes")
+        self._client._round_trip()
+        with self._client._lock:
+            # All or nothing, like Firestore: check updates before applying
+            present = {}
+            for ref, op, _, _ in self._writes:
+                key = (ref._collection, ref.id)
+                if op == 'update':
+                    exists = present.get(key, ref.id in self._client._docs.get(ref._collection, {}))
+                    if not exists:
+                        raise NotFound(f"{ref._collection}/{ref.id}")
+                present[key] = op != 'delete'
+            for ref, op, data, merge in self._writes:
+                ref._apply(op, data, merge)
+        self._writes = []
+
+
+class FakeClient:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.round_trips = 0
+        self._docs = {}
+        self._lock = threading.RLock()
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def collection(self, name):
+        return CollectionReference(self, name)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def get_all(self, refs):
+        self._round_trip()
+        with self._lock:
+            return [
+                DocumentSnapshot(ref.id, copy.deepcopy(self._docs.get(ref._collection, {}).get(ref.id)))
+                for ref in refs
+            ]
@@ -2,14 +2,18 @@
 Firebase Firestore Service
 Replaces SQLAlchemy with Firebase Firestore for real-time database operations
 """
-import firebase_admin
-from firebase_admin import credentials, firestore
 from datetime import datetime
 import os
+import threading
+import time
+import uuid
 
 # Initialize Firebase Admin SDK
 def init_firebase():
     """Initialize Firebase Admin SDK"""
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
     if not firebase_admin._apps:
         # Check if running with service account key file
         if os.path.exists('firebase-service-account.json'):
@@ -24,11 +28,30 @@ def init_firebase():
                 print(f"⚠️  Firebase initialization error: {e}")
                 print("Please set up firebase-service-account.json or GOOGLE_APPLICATION_CREDENTIALS")
                 raise
-    
+
     return firestore.client()
 
-# Initialize Firestore client
-db = init_firebase()
+# Firestore client, created on first use (see get_db / set_client)
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_db():
+    """Return the Firestore client, initializing Firebase on first call"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = init_firebase()
+    return _client
+
+
+def set_client(client):
+    """Use `client` instead of the real Firestore (e.g. fake_firestore.FakeClient)"""
+    global _client
+    with _client_lock:
+        _client = client
+    invalidate_cache()
 
 # Collection names
 COLLECTIONS = {
@@ -40,6 +63,199 @@ COLLECTIONS = {
     'live_locations': 'live_locations'
 }
 
+# Name of the id field added to documents read from each collection
+ID_FIELDS = {
+    'admins': 'id',
+    'buses': 'bus_id',
+    'drivers': 'driver_id',
+    'routes': 'route_id',
+    'maintenance': 'id',
+}
+
+# Firestore allows at most 500 writes per batch
+BATCH_LIMIT = 500
+
+# One document per collection (_meta/<collection>) holding its version token,
+# bumped once per write call. Separate documents keep writes to different
+# collections off each other's ~1 write/s per-document limit.
+VERSIONS_COLLECTION = '_meta'
+
+
+# ============================================
+# BATCHED OPERATIONS
+# ============================================
+
+def _doc_to_dict(collection_key, doc):
+    data = doc.to_dict()
+    data[ID_FIELDS[collection_key]] = doc.id
+    return data
+
+
+def _version_ref(collection_key):
+    return get_db().collection(VERSIONS_COLLECTION).document(COLLECTIONS[collection_key])
+
+
+def _commit(collection_key, writes):
+    """Commit (op, doc_ref, data) writes in WriteBatches.
+
+    The last batch also bumps the collection's version token, so readers
+    sharing the cache see the change without an extra round trip, and a
+    bulk write touches the version document once rather than per batch.
+    """
+    client = get_db()
+    version_ref = _version_ref(collection_key)
+    per_batch = BATCH_LIMIT - 1
+    starts = range(0, len(writes), per_batch)
+    bumped = False
+    try:
+        for start in starts:
+            batch = client.batch()
+            for op, ref, data in writes[start:start + per_batch]:
+                if op == 'set':
+                    batch.set(ref, data)
+                elif op == 'update':
+                    batch.update(ref, data)
+                else:
+                    batch.delete(ref)
+            if start == starts[-1]:
+                batch.set(version_ref, {'token': uuid.uuid4().hex})
+            batch.commit()
+        bumped = True
+    finally:
+        if not bumped and len(starts) > 1:
+            # Earlier batches may have gone through; readers must not keep serving the old rows
+            try:
+                version_ref.set({'token': uuid.uuid4().hex})
+            except Exception as e:
+                # Other hosts only notice once their cached copy is CACHE_MAX_AGE old
+                print(f"Warning: Could not bump the version of {COLLECTIONS[collection_key]} "
+                      f"after a failed write: {e}")
+        # This process and the workers sharing its state file reload either way
+        invalidate_cache(collection_key)
+        if _shared is not None:
+            _shared.bump('firestore:' + collection_key)
+
+
+def get_many(collection_key, doc_ids):
+    """Fetch several documents by ID in one get_all round trip.
+
+    Returns {doc_id: data} for the documents that exist.
+    """
+    collection = get_db().collection(COLLECTIONS[collection_key])
+    refs = [collection.document(str(doc_id)) for doc_id in doc_ids]
+    if not refs:
+        return {}
+    return {
+        doc.id: _doc_to_dict(collection_key, doc)
+        for doc in get_db().get_all(refs)
+        if doc.exists
+    }
+
+
+def add_many(collection_key, rows):
+    """Add several documents with batched writes, returning their IDs"""
+    collection = get_db().collection(COLLECTIONS[collection_key])
+    now = datetime.now()
+    writes = []
+    for data in rows:
+        writes.append(('set', collection.document(), dict(data, created_at=now)))
+    _commit(collection_key, writes)
+    return [ref.id for _, ref, _ in writes]
+
+
+def update_many(collection_key, updates):
+    """Apply {doc_id: data} updates with batched writes.
+
+    All documents must exist; Firestore fails the whole batch otherwise.
+    """
+    collection = get_db().collection(COLLECTIONS[collection_key])
+    now = datetime.now()
+    writes = [
+        ('update', collection.document(str(doc_id)), dict(data, updated_at=now))
+        for doc_id, data in updates.items()
+    ]
+    _commit(collection_key, writes)
+    return len(writes)
+
+
+def delete_many(collection_key, doc_ids):
+    """Delete several documents with batched writes"""
+    collection = get_db().collection(COLLECTIONS[collection_key])
+    writes = [('delete', collection.document(str(doc_id)), None) for doc_id in doc_ids]
+    _commit(collection_key, writes)
+    return len(writes)
+
+
+# ============================================
+# READ-THROUGH CACHE
+# ============================================
+
+# Serve cached collections for CACHE_TTL seconds, then revalidate against
+# the version document (one read). Writes that bypass this module (e.g.
+# the Flutter app) don't bump the version, so CACHE_MAX_AGE caps how long
+# a revalidated entry is trusted before the collection is re-streamed.
+CACHE_TTL = float(os.environ.get('FIRESTORE_CACHE_TTL', 5))
+CACHE_MAX_AGE = float(os.environ.get('FIRESTORE_CACHE_MAX_AGE', 60))
+
+# collection_key -> (rows, version, checked_at, fetched_at, shared_version)
+_cache = {}
+_cache_lock = threading.Lock()
+
+# Optional shared_state.SharedState; lets a write in one worker process
+# invalidate the cached collection in every other worker immediately
+_shared = None
+
+
+def use_shared_state(state):
+    """Share cache invalidations with other processes through `state`"""
+    global _shared
+    _shared = state
+    invalidate_cache()
+
+
+def _shared_version(collection_key):
+    return _shared.version('firestore:' + collection_key) if _shared is not None else None
+
+
+def invalidate_cache(collection_key=None):
+    """Drop one cached collection, or all of them"""
+    with _cache_lock:
+        if collection_key is None:
+            _cache.clear()
+        else:
+            _cache.pop(collection_key, None)
+
+
+def _collection_version(collection_key):
+    doc = _version_ref(collection_key).get()
+    if not doc.exists:
+        return None
+    return doc.to_dict().get('token')
+
+
+def cached_collection(collection_key, loader):
+    """Return loader() for a collection through the TTL + version cache"""
+    now = time.monotonic()
+    shared_version = _shared_version(collection_key)
+    with _cache_lock:
+        entry = _cache.get(collection_key)
+
+    if entry is not None and entry[4] == shared_version:
+        rows, version, checked_at, fetched_at, _ = entry
+        if now - checked_at < CACHE_TTL:
+            return [dict(row) for row in rows]
+        if now - fetched_at < CACHE_MAX_AGE and _collection_version(collection_key) == version:
+            with _cache_lock:
+                _cache[collection_key] = (rows, version, now, fetched_at, shared_version)
+            return [dict(row) for row in rows]
+
+    # Read the version first so a write racing with the load invalidates it
+    version = _collection_version(collection_key)
+    rows = loader()
+    with _cache_lock:
+        _cache[collection_key] = (rows, version, now, now, shared_version)
+    return [dict(row) for row in rows]
+
 
 # ============================================
 # ADMIN OPERATIONS
@@ -47,7 +263,7 @@ COLLECTIONS = {
 
 def get_admin_by_username(username):
     """Get admin by username"""
-    admins_ref = db.collection(COLLECTIONS['admins'])
+    admins_ref = get_db().collection(COLLECTIONS['admins'])
     query = admins_ref.where('username', '==', username).limit(1).stream()
     for doc in query:
         data = doc.to_dict()
@@ -65,7 +281,7 @@ def create_default_admin():
             'password': 'admin123',
             'created_at': datetime.now()
         }
-        db.collection(COLLECTIONS['admins']).add(admin_data)
+        get_db().collection(COLLECTIONS['admins']).add(admin_data)
         print("✅ Default admin user created")
     else:
         print("ℹ️  Admin user already exists")
@@ -75,9 +291,8 @@ def create_default_admin():
 # BUS OPERATIONS
 # ============================================
 
-def get_all_buses():
-    """Get all buses"""
-    buses_ref = db.collection(COLLECTIONS['buses'])
+def _load_buses():
+    buses_ref = get_db().collection(COLLECTIONS['buses'])
     buses = []
     for doc in buses_ref.stream():
         data = doc.to_dict()
@@ -86,9 +301,14 @@ def get_all_buses():
     return buses
 
 
+def get_all_buses():
+    """Get all buses"""
+    return cached_collection('buses', _load_buses)
+
+
 def get_bus_by_id(bus_id):
     """Get bus by ID"""
-    doc = db.collection(COLLECTIONS['buses']).document(str(bus_id)).get()
+    doc = get_db().collection(COLLECTIONS['buses']).document(str(bus_id)).get()
     if doc.exists:
         data = doc.to_dict()
         data['bus_id'] = doc.id
@@ -98,21 +318,18 @@ def get_bus_by_id(bus_id):
 
 def add_bus(bus_data):
     """Add a new bus"""
-    bus_data['created_at'] = datetime.now()
-    doc_ref = db.collection(COLLECTIONS['buses']).add(bus_data)
-    return doc_ref[1].id  # Return document ID
+    return add_many('buses', [bus_data])[0]  # Return document ID
 
 
 def update_bus(bus_id, bus_data):
     """Update a bus"""
-    bus_data['updated_at'] = datetime.now()
-    db.collection(COLLECTIONS['buses']).document(str(bus_id)).update(bus_data)
+    update_many('buses', {bus_id: bus_data})
     return True
 
 
 def delete_bus(bus_id):
     """Delete a bus"""
-    db.collection(COLLECTIONS['buses']).document(str(bus_id)).delete()
+    delete_many('buses', [bus_id])
     return True
 
 
@@ -120,9 +337,8 @@ def delete_bus(bus_id):
 # DRIVER OPERATIONS
 # ============================================
 
-def get_all_drivers():
-    """Get all drivers"""
-    drivers_ref = db.collection(COLLECTIONS['drivers'])
+def _load_drivers():
+    drivers_ref = get_db().collection(COLLECTIONS['drivers'])
     drivers = []
     for doc in drivers_ref.stream():
         data = doc.to_dict()
@@ -131,9 +347,14 @@ def get_all_drivers():
     return drivers
 
 
+def get_all_drivers():
+    """Get all drivers"""
+    return cached_collection('drivers', _load_drivers)
+
+
 def get_driver_by_id(driver_id):
     """Get driver by ID"""
-    doc = db.collection(COLLECTIONS['drivers']).document(str(driver_id)).get()
+    doc = get_db().collection(COLLECTIONS['drivers']).document(str(driver_id)).get()
     if doc.exists:
         data = doc.to_dict()
         data['driver_id'] = doc.id
@@ -144,30 +365,24 @@ def get_driver_by_id(driver_id):
 def add_driver(driver_data):
     """Add a new driver"""
     driver_data['attendance'] = driver_data.get('attendance', 'Absent')
-    driver_data['created_at'] = datetime.now()
-    doc_ref = db.collection(COLLECTIONS['drivers']).add(driver_data)
-    return doc_ref[1].id
+    return add_many('drivers', [driver_data])[0]
 
 
 def update_driver(driver_id, driver_data):
     """Update a driver"""
-    driver_data['updated_at'] = datetime.now()
-    db.collection(COLLECTIONS['drivers']).document(str(driver_id)).update(driver_data)
+    update_many('drivers', {driver_id: driver_data})
     return True
 
 
 def delete_driver(driver_id):
     """Delete a driver"""
-    db.collection(COLLECTIONS['drivers']).document(str(driver_id)).delete()
+    delete_many('drivers', [driver_id])
     return True
 
 
 def update_driver_attendance(driver_id, status):
     """Update driver attendance"""
-    db.collection(COLLECTIONS['drivers']).document(str(driver_id)).update({
-        'attendance': status,
-        'updated_at': datetime.now()
-    })
+    update_many('drivers', {driver_id: {'attendance': status}})
     return True
 
 
@@ -175,9 +390,8 @@ def update_driver_attendance(driver_id, status):
 # ROUTE OPERATIONS
 # ============================================
 
-def get_all_routes():
-    """Get all routes"""
-    routes_ref = db.collection(COLLECTIONS['routes'])
+def _load_routes():
+    routes_ref = get_db().collection(COLLECTIONS['routes'])
     routes = []
     for doc in routes_ref.stream():
         data = doc.to_dict()
@@ -186,9 +400,14 @@ def get_all_routes():
     return routes
 
 
+def get_all_routes():
+    """Get all routes"""
+    return cached_collection('routes', _load_routes)
+
+
 def get_route_by_id(route_id):
     """Get route by ID"""
-    doc = db.collection(COLLECTIONS['routes']).document(str(route_id)).get()
+    doc = get_db().collection(COLLECTIONS['routes']).document(str(route_id)).get()
     if doc.exists:
         data = doc.to_dict()
         data['route_id'] = doc.id
@@ -198,21 +417,18 @@ def get_route_by_id(route_id):
 
 def add_route(route_data):
     """Add a new route"""
-    route_data['created_at'] = datetime.now()
-    doc_ref = db.collection(COLLECTIONS['routes']).add(route_data)
-    return doc_ref[1].id
+    return add_many('routes', [route_data])[0]
 
 
 def update_route(route_id, route_data):
     """Update a route"""
-    route_data['updated_at'] = datetime.now()
-    db.collection(COLLECTIONS['routes']).document(str(route_id)).update(route_data)
+    update_many('routes', {route_id: route_data})
     return True
 
 
 def delete_route(route_id):
     """Delete a route"""
-    db.collection(COLLECTIONS['routes']).document(str(route_id)).delete()
+    delete_many('routes', [route_id])
     return True
 
 
@@ -220,13 +436,12 @@ def delete_route(route_id):
 # MAINTENANCE OPERATIONS
 # ============================================
 
-def get_all_maintenance():
-    """Get all maintenance logs, ordered by reported_at desc"""
-    maintenance_ref = db.collection(COLLECTIONS['maintenance'])
+def _load_maintenance():
+    maintenance_ref = get_db().collection(COLLECTIONS['maintenance'])
     maintenance = []
     try:
         # Try to order by reported_at
-        query = maintenance_ref.order_by('reported_at', direction=firestore.Query.DESCENDING)
+        query = maintenance_ref.order_by('reported_at', direction='DESCENDING')
         for doc in query.stream():
             data = doc.to_dict()
             data['id'] = doc.id
@@ -254,9 +469,14 @@ def get_all_maintenance():
     return maintenance
 
 
+def get_all_maintenance():
+    """Get all maintenance logs, ordered by reported_at desc"""
+    return cached_collection('maintenance', _load_maintenance)
+
+
 def get_maintenance_by_id(maintenance_id):
     """Get maintenance log by ID"""
-    doc = db.collection(COLLECTIONS['maintenance']).document(str(maintenance_id)).get()
+    doc = get_db().collection(COLLECTIONS['maintenance']).document(str(maintenance_id)).get()
     if doc.exists:
         data = doc.to_dict()
         data['id'] = doc.id
@@ -269,20 +489,18 @@ def add_maintenance(maintenance_data):
     maintenance_data['status'] = maintenance_data.get('status', 'Pending')
     maintenance_data['reported_at'] = datetime.now()
     maintenance_data['reported_on'] = datetime.now().strftime('%Y-%m-%d %H:%M')
-    doc_ref = db.collection(COLLECTIONS['maintenance']).add(maintenance_data)
-    return doc_ref[1].id
+    return add_many('maintenance', [maintenance_data])[0]
 
 
 def update_maintenance(maintenance_id, maintenance_data):
     """Update a maintenance log"""
-    maintenance_data['updated_at'] = datetime.now()
-    db.collection(COLLECTIONS['maintenance']).document(str(maintenance_id)).update(maintenance_data)
+    update_many('maintenance', {maintenance_id: maintenance_data})
     return True
 
 
 def delete_maintenance(maintenance_id):
     """Delete a maintenance log"""
-    db.collection(COLLECTIONS['maintenance']).document(str(maintenance_id)).delete()
+    delete_many('maintenance', [maintenance_id])
     return True
 
 
@@ -292,7 +510,7 @@ def delete_maintenance(maintenance_id):
 
 def get_live_locations():
     """Get all live bus locations"""
-    locations_ref = db.collection(COLLECTIONS['live_locations'])
+    locations_ref = get_db().collection(COLLECTIONS['live_locations'])
     locations = {}
     for doc in locations_ref.stream():
         data = doc.to_dict()
@@ -303,6 +521,19 @@ def get_live_locations():
 def update_live_location(bus_id, location_data):
     """Update live location for a bus"""
     location_data['last_update'] = datetime.now().isoformat()
-    db.collection(COLLECTIONS['live_locations']).document(str(bus_id)).set(location_data, merge=True)
+    get_db().collection(COLLECTIONS['live_locations']).document(str(bus_id)).set(location_data, merge=True)
     return True
 
+
+def update_live_locations(records):
+    """Update live locations for several buses with batched writes"""
+    client = get_db()
+    collection = client.collection(COLLECTIONS['live_locations'])
+    now = datetime.now().isoformat()
+    for start in range(0, len(records), BATCH_LIMIT):
+        batch = client.batch()
+        for bus_id, location_data in records[start:start + BATCH_LIMIT]:
+            batch.set(collection.document(str(bus_id)),
+                      dict(location_data, last_update=location_data.get('last_update') or now), merge=True)
+        batch.commit()
+    return len(records)
@@ -0,0 +1,174 @@
+# generate_fleet.py
+# Synthetic fleet generator. Bulk-creates routes, buses, drivers,
+# maintenance logs and live positions through the repository layer, so the
+# same data can be loaded into any backend for benchmarks.
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+
+PRESETS = {
+    "small": {"routes": 10, "buses": 200, "drivers": 400, "maintenance": 5000},
+    "medium": {"routes": 50, "buses": 1000, "drivers": 2000, "maintenance": 100000},
+    "large": {"routes": 100, "buses": 5000, "drivers": 10000, "maintenance": 1000000},
+}
+
+# Rows per add_many call; bounds memory for the 1M-log preset
+CHUNK = 20000
+
+# Bhavnagar city centre, positions are scattered around it
+CENTER = (21.7645, 72.1519)
+
+# Share of live positions whose last report is old (bus app offline, bus parked)
+STALE_SHARE = 0.1
+
+STOPS = ["Bhavnagar Terminus", "Nilambaug Circle", "Kaliyabid", "Ghogha Circle", "Waghawadi Road",
+         "Sardarnagar", "Chitra GIDC", "Vidyanagar", "Subhashnagar", "Akwada", "Bortalav", "Tarsamiya"]
+ISSUES = ["Brake inspection", "Oil change", "Tyre replacement", "Engine overheating", "AC not cooling",
+          "Battery check", "Door sensor fault", "GPS unit offline", "Clutch wear", "Suspension noise"]
+FIRST_NAMES = ["Ramesh", "Suresh", "Mahesh", "Kiran", "Alpesh", "Bharat", "Dinesh", "Jignesh",
+               "Hitesh", "Paresh", "Nilesh", "Vijay"]
+LAST_NAMES = ["Patel", "Shah", "Parmar", "Solanki", "Chauhan", "Gohil", "Makwana", "Vaghela", "Joshi"]
+
+
+def _chunks(rows, size=CHUNK):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# -------------- ROW FACTORIES --------------
+def route_rows(n, rng):
+    for i in range(n):
+        start, end = rng.sample(STOPS, 2)
+        first = rng.choice(["05:30", "06:00", "06:30", "07:00"])
+        last = rng.choice(["21:00", "21:30", "22:00", "22:30"])
+        yield {
+            "name": f"Route {101 + i}",
+            "start_stop": start,
+            "end_stop": end,
+            "first_bus": first,
+            "last_bus": last,
+            "frequency_min": rng.choice([10, 15, 20, 30]),
+        }
+
+
+def bus_rows(n, route_ids, rng):
+    for i in range(n):
+        yield {
+            "number": f"GJ-04-{chr(65 + i // 26000 % 26)}{chr(65 + i // 1000 % 26)}-{i % 10000:04d}",
+            "route_id": route_ids[i % len(route_ids)] if route_ids else None,
+            "status": rng.choices(["Active", "In Depot", "Breakdown"], weights=[80, 15, 5])[0],
+        }
+
+
+def driver_rows(n, rng):
+    for i in range(n):
+        yield {
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "phone": f"9{rng.randrange(10 ** 8, 10 ** 9)}",
+            "attendance": rng.choices(["Present", "Absent"], weights=[85, 15])[0],
+        }
+
+
+def maintenance_rows(n, bus_ids, rng, now=None):
+    now = now or datetime.now()
+    for i in range(n):
+        reported = now - timedelta(minutes=rng.randrange(365 * 24 * 60))
+        yield {
+            "bus_id": bus_ids[rng.randrange(len(bus_ids))],
+            "issue": rng.choice(ISSUES),
+            "status": rng.choices(["Pending", "In Progress", "Resolved"], weights=[10, 5, 85])[0],
+            "reported_at": reported,
+            "reported_on": reported.strftime("%Y-%m-%d %H:%M"),
+        }
+
+
+def live_locations(buses, rng, spread=0.08, now=None):
+    """(bus_id, location) for the Active buses in `buses` ({id: row})"""
+    now = now or datetime.now()
+    for bus_id, bus in buses.items():
+        if bus["status"] != "Active":
+            continue
+        if rng.random() < STALE_SHARE:
+            age = timedelta(minutes=rng.randrange(10, 6 * 60))
+        else:
+            age = timedelta(seconds=rng.randrange(0, 120))
+        yield bus_id, {
+            "lat": round(CENTER[0] + rng.uniform(-spread, spread), 6),
+            "lng": round(CENTER[1] + rng.uniform(-spread, spread), 6),
+            "speed": rng.randrange(0, 55),
+            "occupancy": rng.randrange(0, 60),
+            "last_update": (now - age).isoformat(timespec="seconds"),
+        }
+
+
+# -------------- GENERATOR --------------
+def generate(repo, sizes, seed=42, log=print):
+    """Bulk-create a fleet of `sizes` through `repo`, returning the new ids per kind"""
+    rng = random.Random(seed)
+    ids = {}
+
+    def add(kind, rows):
+        ids[kind] = []
+        for chunk in _chunks(rows):
+            ids[kind].extend(repo.add_many(kind, chunk))
+        log(f"  {kind:<12} {len(ids[kind]):>9} rows")
+
+    add("routes", route_rows(sizes["routes"], rng))
+    bus_rows_list = list(bus_rows(sizes["buses"], ids["routes"], rng))
+    add("buses", bus_rows_list)
+    add("drivers", driver_rows(sizes["drivers"], rng))
+    if ids["buses"]:
+        add("maintenance", maintenance_rows(sizes["maintenance"], ids["buses"], rng))
+
+    buses = dict(zip(ids["buses"], bus_rows_list))
+    written = 0
+    for chunk in _chunks(live_locations(buses, rng)):
+        written += repo.update_live_locations(chunk)
+    log(f"  {'live':<12} {written:>9} positions")
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-create a synthetic fleet")
+    parser.add_argument("--backend", default=os.environ.get("DATA_BACKEND", "sqlalchemy"),
+                        choices=["sqlalchemy", "firestore"])
+    parser.add_argument("--preset", default="small", choices=sorted(PRESETS))
+    for kind in ("routes", "buses", "drivers", "maintenance"):
+        parser.add_argument(f"--{kind}", type=int, help=f"override the preset's {kind} count")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--fresh", action="store_true", help="drop and recreate the tables first (sqlalchemy)")
+    args = parser.parse_args()
+
+    sizes = dict(PRESETS[args.preset])
+    sizes.update({k: getattr(args, k) for k in sizes if getattr(args, k) is not None})
+
+    from config import SHARED_STATE_PATH
+    from repository import create_repository
+    from shared_state import SharedState
+
+    shared = SharedState(SHARED_STATE_PATH)
+    if args.backend == "sqlalchemy":
+        from create_db import create_sqlalchemy, make_db_app
+        from models import db
+
+        if args.fresh:
+            create_sqlalchemy(drop=True, seed=True)
+        app = make_db_app()
+        with app.app_context():
+            db.create_all()
+            print(f"Generating {sizes}")
+            generate(create_repository("sqlalchemy", db, shared), sizes, args.seed)
+    else:
+        print(f"Generating {sizes}")
+        generate(create_repository("firestore", shared_state=shared), sizes, args.seed)
+
+
+if __name__ == "__main__":
+    main()
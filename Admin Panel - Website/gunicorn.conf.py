@@ -0,0 +1,48 @@
+# gunicorn.conf.py
+# Worker configuration for `gunicorn -c gunicorn.conf.py wsgi:app`.
+# Live positions and cache invalidations go through shared_state.py
+# (SQLite in instance/), so all workers serve the same data.
+import glob
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.environ.get("THREADS", 4))
+timeout = 30
+keepalive = 5
+
+# Import the app once in the master; workers share its memory copy-on-write
+preload_app = True
+
+accesslog = "-"
+errorlog = "-"
+
+# Each worker writes its metrics here and /metrics merges them (see metrics.py).
+# Start the ingest service with the same METRICS_DIR to include its queue depth.
+os.environ.setdefault(
+    "METRICS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "metrics")
+)
+
+
+def on_starting(server):
+    # Snapshots left by a previous master would be counted again
+    for path in glob.glob(os.path.join(os.environ["METRICS_DIR"], "*.json")):
+        os.remove(path)
+
+
+def post_fork(server, worker):
+    # Connections opened before the fork must not be shared between workers
+    from app import app
+
+    if app.config["DATA_BACKEND"] == "sqlalchemy":
+        from models import db
+
+        with app.app_context():
+            db.engine.dispose(close=False)
+
+    # Every worker checks for due background jobs; leases make one of them run each (see jobs.py)
+    import jobs
+
+    jobs.autostart(app)
@@ -0,0 +1,300 @@
+"""
+Async location ingest service
+ASGI app for high-concurrency location updates from the bus apps:
+
+    gunicorn -k uvicorn.workers.UvicornWorker -w 4 -b 0.0.0.0:5001 ingest:app
+
+(or `uvicorn ingest:app --port 5001` for a single worker; uvicorn's own
+--workers mode leaves Nagle on for accepted sockets, which adds ~40 ms of
+delayed-ACK stall to every keep-alive request.)
+
+Payloads are validated exactly like /api/public/location-update in app.py,
+put on a bounded queue and written in batches by one background task per
+worker. When the queue is full the service answers 429 with Retry-After
+instead of piling up work. A batch with more valid updates than the whole
+queue holds could never fit, so it gets 413 instead.
+
+Bodies may be JSON or, with Content-Type: application/msgpack, MessagePack.
+
+Endpoints:
+    POST /api/public/location-update        one update (same body as app.py)
+    POST /api/public/location-update/batch  {"updates": [...]} or a JSON list
+    GET  /health                            queue depth and counters
+    GET  /metrics                           the same, in Prometheus format
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+import metrics
+import serialization
+from config import SHARED_STATE_PATH
+from validation import parse_location_update
+
+log = logging.getLogger(__name__)
+
+QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", 10000))
+BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", 500))
+FLUSH_INTERVAL = float(os.environ.get("INGEST_FLUSH_INTERVAL", 0.05))
+RETRY_AFTER = os.environ.get("INGEST_RETRY_AFTER", "1")
+MAX_BODY = 1024 * 1024
+_TOO_LARGE = object()
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"POST, GET, OPTIONS"),
+    (b"access-control-allow-headers", b"Content-Type"),
+]
+
+
+def default_sink():
+    """Write batches through the repository of the configured backend"""
+    from repository import create_repository
+    from shared_state import SharedState
+
+    backend = os.environ.get("DATA_BACKEND", "sqlalchemy")
+    repo = create_repository(backend, shared_state=SharedState(SHARED_STATE_PATH))
+    return repo.update_live_locations
+
+
+class IngestService:
+    """ASGI app: validate, enqueue, batch-write.
+
+    `sink(records)` receives lists of (bus_id, location) pairs, at most one
+    per bus (the newest), and runs in a worker thread.
+    """
+
+    def __init__(self, sink=None, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL):
+        self.sink = sink
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = None
+        self.writer = None
+        self.stats = {
+            "accepted": 0,
+            "invalid": 0,
+            "throttled": 0,
+            "written": 0,
+            "batches": 0,
+            "write_errors": 0,
+        }
+
+    def _count(self, kind, n):
+        self.stats[kind] += n
+        metrics.registry.inc("ingest_events_total", (("kind", kind),), n)
+
+    def _publish(self):
+        metrics.registry.set_gauge("ingest_queue_depth", self.queue.qsize())
+        metrics.registry.maybe_dump()
+
+    # ---------- WRITER ----------
+    def _ensure_started(self):
+        if self.writer is None:
+            if self.sink is None:
+                self.sink = default_sink()
+            self.queue = asyncio.Queue(maxsize=self.queue_size)
+            self.writer = asyncio.get_running_loop().create_task(self._write_loop())
+
+    def _drain(self, batch):
+        """Move queued updates into `batch`, returning how many were taken"""
+        taken = 0
+        while len(batch) < self.batch_size and not self.queue.empty():
+            bus_id, location = self.queue.get_nowait()
+            # Keep only the newest position per bus
+            batch.pop(str(bus_id), None)
+            batch[str(bus_id)] = (bus_id, location)
+            taken += 1
+        return taken
+
+    def _write_each(self, records):
+        """Write records one by one, skipping those that fail; returns how many were written"""
+        written = 0
+        for record in records:
+            try:
+                self.sink([record])
+                written += 1
+            except Exception:
+                log.warning("Dropped live location of bus %s: %r", record[0], record[1], exc_info=True)
+        return written
+
+    async def _write_loop(self):
+        while True:
+            bus_id, location = await self.queue.get()
+            batch = {str(bus_id): (bus_id, location)}
+            taken = 1 + self._drain(batch)
+            if len(batch) < self.batch_size:
+                # Light load: wait a moment so the write carries more rows
+                await asyncio.sleep(self.flush_interval)
+                taken += self._drain(batch)
+
+            records = list(batch.values())
+            try:
+                await asyncio.to_thread(self.sink, records)
+                self._count("written", len(records))
+                self._count("batches", 1)
+            except Exception:
+                log.exception("Failed to write %d live locations, retrying one at a time", len(records))
+                # One bad row must not lose the rest of the batch
+                written = await asyncio.to_thread(self._write_each, records)
+                self._count("written", written)
+                self._count("write_errors", len(records) - written)
+            # Marked done only once written, so queue.join() means flushed
+            for _ in range(taken):
+                self.queue.task_done()
+            self._publish()
+
+    async def _stop(self):
+        if self.writer is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=5)
+        except asyncio.TimeoutError:
+            log.warning("Dropping %d queued live locations on shutdown", self.queue.qsize())
+        self.writer.cancel()
+        self.writer = None
+
+    # ---------- HTTP ----------
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        self._ensure_started()
+        method = scope["method"]
+        path = scope["path"].rstrip("/")
+
+        if method == "OPTIONS":
+            await self._respond(send, 204, None)
+        elif path == "/api/public/location-update" and method == "POST":
+            await self._single(scope, receive, send)
+        elif path == "/api/public/location-update/batch" and method == "POST":
+            await self._batch(scope, receive, send)
+        elif path == "/health" and method == "GET":
+            await self._respond(send, 200, dict(self.stats, queue_depth=self.queue.qsize()))
+        elif path == "/metrics" and method == "GET":
+            self._publish()
+            body = metrics.render().encode()
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", b"text/plain; version=0.0.4"),
+                (b"content-length", str(len(body)).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+        else:
+            await self._respond(send, 404, {"error": "Not found"})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._ensure_started()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self._stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _read_body(self, scope, receive):
+        body = b""
+        more = True
+        while more:
+            message = await receive()
+            body += message.get("body", b"")
+            more = message.get("more_body", False)
+            if len(body) > MAX_BODY:
+                return _TOO_LARGE
+        content_type = dict(scope["headers"]).get(b"content-type", b"").split(b";")[0].strip().decode("latin-1")
+        try:
+            if serialization.msgpack is not None and content_type in serialization.MSGPACK_MIMETYPES:
+                return serialization.msgpack.unpackb(body, raw=False) if body else {}
+            return serialization.loads(body or b"{}")
+        except ValueError:
+            return {}
+
+    async def _respond(self, send, status, payload, headers=()):
+        body = serialization.dumps(payload) if payload is not None else b""
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                *CORS_HEADERS,
+                *headers,
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _throttle(self, send):
+        self._count("throttled", 1)
+        await self._respond(send, 429, {"error": "Ingest queue full, retry later"},
+                            [(b"retry-after", RETRY_AFTER.encode())])
+
+    async def _single(self, scope, receive, send):
+        data = await self._read_body(scope, receive)
+        if data is _TOO_LARGE:
+            await self._respond(send, 413, {"error": "Request body too large"})
+            return
+
+        bus_id, location, error = parse_location_update(data)
+        if error:
+            self._count("invalid", 1)
+            await self._respond(send, 400, {"error": error})
+            return
+
+        try:
+            self.queue.put_nowait((bus_id, location))
+        except asyncio.QueueFull:
+            await self._throttle(send)
+            return
+
+        self._count("accepted", 1)
+        await self._respond(send, 200, {
+            "ok": True,
+            "message": "Location queued",
+            "bus_id": bus_id,
+            "timestamp": datetime.now().isoformat()
+        })
+
+    async def _batch(self, scope, receive, send):
+        data = await self._read_body(scope, receive)
+        if data is _TOO_LARGE:
+            await self._respond(send, 413, {"error": "Request body too large"})
+            return
+
+        updates = data.get("updates") if isinstance(data, dict) else data
+        if not isinstance(updates, list):
+            await self._respond(send, 400, {"error": "updates must be a list"})
+            return
+
+        valid, errors = [], []
+        for index, item in enumerate(updates):
+            bus_id, location, error = parse_location_update(item)
+            if error:
+                errors.append({"index": index, "error": error})
+            else:
+                valid.append((bus_id, location))
+        self._count("invalid", len(errors))
+
+        # All or nothing, so clients can simply retry the same batch
+        if self.queue.maxsize and len(valid) > self.queue.maxsize:
+            await self._respond(send, 413, {
+                "error": f"Batch has {len(valid)} updates; send at most {self.queue.maxsize} per request",
+                "max_updates": self.queue.maxsize,
+            })
+            return
+        if self.queue.maxsize and self.queue.maxsize - self.queue.qsize() < len(valid):
+            await self._throttle(send)
+            return
+        for record in valid:
+            self.queue.put_nowait(record)
+
+        self._count("accepted", len(valid))
+        await self._respond(send, 200, {"ok": True, "accepted": len(valid), "errors": errors})
+
+
+app = IngestService()
@@ -0,0 +1,284 @@
+"""
+Background jobs
+An in-process scheduler for work that should not run inside a request,
+such as the daily attendance roll-over and solving the day's roster.
+
+Jobs run on a thread pool in each worker process (SCHEDULER_WORKERS,
+default 2), inside an app context. Every run first leases the job's row in
+the shared state file. Only one process runs a job at a time, and a
+periodic job runs once per period across all workers rather than once per
+worker. A lease left behind by a crashed process expires after the job's
+timeout, so keep the timeout above the job's longest run.
+
+The shared state file is local to one host, and so are the leases: with
+web servers on several hosts, every host runs every job. Run the timer on
+one host only (SCHEDULER=0 on the others, or `python jobs.py` on one).
+
+A job runs every `every` seconds, daily `at` "HH:MM", or only on demand.
+A daily job stays due until a timer run for its latest moment has
+succeeded: a moment missed while no worker was up, or whose run died, is
+caught up as soon as a timer runs again, and failed runs are retried after
+RETRY_AFTER seconds. Runs started by trigger() never count as the
+scheduled one, whatever they did. Daily jobs get the moment they ran for as
+`scheduled=` (a datetime), so a late run knows which day it is for.
+trigger() (POST /api/jobs/<name>) starts any job right away. Run times and
+failures go to /metrics (job_duration_seconds, job_runs_total). GET
+/api/jobs shows each job's last run, whichever worker ran it.
+
+The timer is not started by importing or serving the app: gunicorn.conf.py
+starts it in each worker, `python app.py` in the dev server, or run it in
+its own process with `python jobs.py`. Set SCHEDULER=0 to leave it off in
+the web processes (jobs then only run on demand or in `python jobs.py`).
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from metrics import JOB_BUCKETS, registry
+
+log = logging.getLogger(__name__)
+
+# Seconds between checks for due jobs
+TICK = 1.0
+# Seconds before a failed daily job is tried again
+RETRY_AFTER = 300
+
+
+def _parse_at(at):
+    hours, minutes = map(int, at.split(":"))
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"bad time of day: {at}")
+    return hours, minutes
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat(timespec='seconds') if timestamp else None
+
+
+class Scheduler:
+    """Registered jobs, the timer thread and the pool that runs them.
+
+    The pool and the thread belong to the process that started them and
+    are recreated after a fork, so the scheduler can be built before
+    gunicorn forks its workers.
+    """
+
+    def __init__(self, shared, app=None, workers=2):
+        self.shared = shared
+        self.app = app
+        self.workers = workers
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._pool = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def register(self, name, fn, every=None, at=None, timeout=600):
+        """Add job `name`: fn() every `every` seconds, daily at "HH:MM", or on demand only"""
+        self.jobs[name] = {
+            "name": name,
+            "fn": fn,
+            "every": every,
+            "at": _parse_at(at) if at else None,
+            "timeout": timeout,
+        }
+        return fn
+
+    def job(self, name, **schedule):
+        """Decorator form of register()"""
+        return lambda fn: self.register(name, fn, **schedule)
+
+    # ---------- TIMER ----------
+    def start(self):
+        """Start this process's timer thread (once; calling it again does nothing)"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            self._executor()
+            if self._thread is None:
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+                self._thread.start()
+
+    def stop(self, wait=True):
+        """Stop this process's timer; with `wait`, return once running jobs have finished"""
+        self._stopping.set()
+        with self._lock:
+            pool, thread = (self._pool, self._thread) if self._pid == os.getpid() else (None, None)
+            self._pid = self._pool = self._thread = None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+        if wait and thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def join(self, timeout=None):
+        """Wait for this process's timer to end, which it only does after stop()"""
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid():
+            thread.join(timeout)
+
+    def _executor(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="job")
+            self._thread = None
+        return self._pool
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            try:
+                self.run_pending()
+            except Exception:
+                log.exception("Scheduler check failed")
+            self._stopping.wait(TICK)
+
+    def scheduled_for(self, job, row, now):
+        """The datetime `job` is due for at `now`, given its row in the job table (None if it
+        never ran); None if it is not due"""
+        if row and row["lease_until"] > now:
+            return None
+        if job["every"] is not None:
+            due = row is None or (row["started"] or 0) <= now - job["every"]
+            return datetime.fromtimestamp(now) if due else None
+        if job["at"] is None:
+            return None
+        if row and row["status"] == "failed" and now - (row["finished"] or 0) < RETRY_AFTER:
+            return None
+        hours, minutes = job["at"]
+        today = datetime.fromtimestamp(now).replace(hour=hours, minute=minutes, second=0, microsecond=0)
+        if row is None or row["succeeded"] is None:
+            # Nothing to catch up before its first success; wait for today's moment
+            return today if now >= today.timestamp() else None
+        moment = today if now >= today.timestamp() else today - timedelta(days=1)
+        return moment if row["succeeded"] < moment.timestamp() else None
+
+    def run_pending(self, now=None):
+        """Start every job that is due and not running anywhere; returns their names"""
+        now = time.time() if now is None else now
+        # One read per check; the lease itself is only taken for jobs that look due
+        state = self.shared.jobs()
+        started = []
+        for name, job in self.jobs.items():
+            scheduled = self.scheduled_for(job, state.get(name), now)
+            if scheduled is None:
+                continue
+            kwargs = {"scheduled": scheduled} if job["at"] else {}
+            if self._submit(job, (), kwargs, lambda row, job=job: self.scheduled_for(job, row, now) is not None,
+                            covered=scheduled.timestamp()):
+                started.append(name)
+        return started
+
+    # ---------- RUNNING ----------
+    def trigger(self, name, *args):
+        """Run job `name` with `args` now; False if it is already running in some worker"""
+        return self._submit(self.jobs[name], args)
+
+    def _submit(self, job, args, kwargs=None, due=None, covered=None):
+        owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        if not self.shared.acquire_job(job["name"], owner, job["timeout"], due):
+            return False
+        with self._lock:
+            pool = self._executor()
+        pool.submit(self._run, job, args, kwargs or {}, owner, covered)
+        return True
+
+    def _run(self, job, args, kwargs, owner, covered=None):
+        status, error = "ok", None
+        start = time.perf_counter()
+        try:
+            if self.app is not None:
+                with self.app.app_context():
+                    job["fn"](*args, **kwargs)
+            else:
+                job["fn"](*args, **kwargs)
+        except Exception as exc:
+            status, error = "failed", f"{type(exc).__name__}: {exc}"
+            log.exception("Job %s failed", job["name"])
+        elapsed = time.perf_counter() - start
+
+        labels = (("job", job["name"]),)
+        registry.observe("job_duration_seconds", elapsed, JOB_BUCKETS, labels)
+        registry.inc("job_runs_total", labels + (("status", status),))
+        registry.maybe_dump()
+        try:
+            self.shared.finish_job(job["name"], owner, status, elapsed, error, covered)
+        except Exception:
+            log.exception("Could not record the run of job %s", job["name"])
+
+    # ---------- STATUS ----------
+    def status(self):
+        """Each registered job with its schedule and its last run in any worker"""
+        state = self.shared.jobs()
+        now = time.time()
+        result = []
+        for name, job in self.jobs.items():
+            row = state.get(name) or {}
+            result.append({
+                "name": name,
+                "every": job["every"],
+                "at": "%02d:%02d" % job["at"] if job["at"] else None,
+                "running": row.get("lease_until", 0) > now,
+                "last_started": _iso(row.get("started")),
+                "last_finished": _iso(row.get("finished")),
+                "last_succeeded": _iso(row.get("succeeded")),
+                "last_status": row.get("status"),
+                "last_error": row.get("error"),
+                "last_duration_ms": round(row["duration"] * 1000, 1) if row.get("duration") is not None else None,
+                "runs": row.get("runs", 0),
+                "failures": row.get("failures", 0),
+            })
+        return result
+
+
+# -------------- APP --------------
+def init_app(app):
+    """Create the app's scheduler; nothing runs on a timer until autostart() or start()"""
+    from shared_state import SharedState
+
+    scheduler = Scheduler(
+        SharedState(app.config.get('SHARED_STATE_PATH') or ':memory:'),
+        app,
+        workers=int(os.environ.get("SCHEDULER_WORKERS", 2)),
+    )
+    app.extensions['scheduler'] = scheduler
+    return scheduler
+
+
+def autostart(app):
+    """Start the app's timer in this process, unless SCHEDULER=0"""
+    if os.environ.get("SCHEDULER", "1") != "0":
+        app.extensions['scheduler'].start()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the background job timer in the foreground")
+    parser.add_argument("--run", metavar="JOB", help="run this job once and exit")
+    args = parser.parse_args()
+
+    from app import app
+
+    scheduler = app.extensions['scheduler']
+    if args.run:
+        if args.run not in scheduler.jobs:
+            parser.error(f"unknown job {args.run}; jobs: {', '.join(scheduler.jobs)}")
+        if not scheduler.trigger(args.run):
+            parser.exit(1, f"{args.run} is already running\n")
+        scheduler.stop()
+        return
+    logging.basicConfig(level=logging.INFO)
+    scheduler.start()
+    try:
+        scheduler.join()
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+
+if __name__ == "__main__":
+    main()
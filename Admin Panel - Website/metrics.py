@@ -0,0 +1,402 @@
+"""
+Request metrics
+Per-endpoint latency histograms, status counters, SQL statements per
+request, background job durations and failures, and gauges such as the
+ingest queue depth, exposed in Prometheus
+text format at /metrics.
+
+Each process keeps its own registry and writes a snapshot to METRICS_DIR
+at most once a second; /metrics merges the snapshots of every process, so
+all gunicorn workers (and the ingest service) report the same totals.
+A streamed response is measured until its body has been sent, so the
+latency and SQL of a streamed list include the rows it produced.
+
+Set SLOW_REQUEST_MS to log requests slower than that, with the hottest
+frames seen by a sampling profiler while they ran.
+
+Set SQL_QUERY_BUDGET (or app.config["SQL_QUERY_BUDGET"], or @query_budget(n)
+on a view) to flag requests that run more SQL statements than that: with
+app.testing they raise QueryBudgetExceeded, otherwise they are logged.
+Both name the most repeated statement, which for an N+1 is the lazy load.
+"""
+import bisect
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+log = logging.getLogger(__name__)
+
+METRICS_DIR = os.environ.get("METRICS_DIR")
+DUMP_INTERVAL = 1.0
+# Gauges from snapshots older than this belong to processes that are gone
+GAUGE_MAX_AGE = 60.0
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 600.0)
+
+HELP = {
+    "http_request_duration_seconds": ("histogram", "Request latency by endpoint"),
+    "http_requests_total": ("counter", "Requests by endpoint and status"),
+    "http_request_sql_statements": ("histogram", "SQL statements issued per request"),
+    "http_request_sql_seconds_total": ("counter", "Time spent in SQL by endpoint"),
+    "ingest_queue_depth": ("gauge", "Location updates waiting to be written"),
+    "ingest_events_total": ("counter", "Ingest service events by kind"),
+    "job_duration_seconds": ("histogram", "Background job run time by job"),
+    "job_runs_total": ("counter", "Background job runs by job and status"),
+}
+
+# [statement count, seconds, statements or None] of the current request
+_request_sql = ContextVar("request_sql", default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.last_dump = 0.0
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, tuple(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, labels=()):
+        with self.lock:
+            self.gauges[(name, tuple(labels))] = value
+
+    def observe(self, name, value, buckets, labels=()):
+        key = (name, tuple(labels))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {"buckets": list(buckets), "counts": [0] * (len(buckets) + 1),
+                                               "sum": 0.0}
+            hist["counts"][bisect.bisect_left(buckets, value)] += 1
+            hist["sum"] += value
+
+    # ---------- SNAPSHOTS ----------
+    def snapshot(self):
+        with self.lock:
+            return {
+                "time": time.time(),
+                "counters": [[n, list(l), v] for (n, l), v in self.counters.items()],
+                "gauges": [[n, list(l), v] for (n, l), v in self.gauges.items()],
+                "histograms": [[n, list(l), dict(h, counts=list(h["counts"]))]
+                               for (n, l), h in self.histograms.items()],
+            }
+
+    def maybe_dump(self, force=False):
+        """Write this process's snapshot to METRICS_DIR, at most once a second"""
+        now = time.monotonic()
+        if not METRICS_DIR or (not force and now - self.last_dump < DUMP_INTERVAL):
+            return
+        self.last_dump = now
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+
+registry = Registry()
+
+
+def _labels(labels):
+    return tuple(tuple(pair) for pair in labels)
+
+
+def collect():
+    """Merge the snapshots of every process (or just this one)"""
+    snapshots = {os.getpid(): registry.snapshot()}
+    if METRICS_DIR:
+        for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+            pid = int(os.path.basename(path).split(".")[0])
+            if pid == os.getpid():
+                continue
+            try:
+                with open(path) as f:
+                    snapshots[pid] = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    counters, gauges, histograms = {}, {}, {}
+    now = time.time()
+    for snap in snapshots.values():
+        for name, labels, value in snap["counters"]:
+            key = (name, _labels(labels))
+            counters[key] = counters.get(key, 0) + value
+        if now - snap["time"] < GAUGE_MAX_AGE:
+            for name, labels, value in snap["gauges"]:
+                key = (name, _labels(labels))
+                gauges[key] = gauges.get(key, 0) + value
+        for name, labels, hist in snap["histograms"]:
+            key = (name, _labels(labels))
+            merged = histograms.setdefault(key, {"buckets": hist["buckets"],
+                                                 "counts": [0] * len(hist["counts"]), "sum": 0.0})
+            merged["counts"] = [a + b for a, b in zip(merged["counts"], hist["counts"])]
+            merged["sum"] += hist["sum"]
+    return counters, gauges, histograms
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render():
+    """Prometheus text exposition of the merged metrics"""
+    counters, gauges, histograms = collect()
+    by_name = {}
+    for (name, labels), value in list(counters.items()) + list(gauges.items()):
+        by_name.setdefault(name, []).append(f"{name}{_fmt_labels(labels)} {value}")
+    for (name, labels), hist in histograms.items():
+        lines = by_name.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip(list(hist["buckets"]) + ["+Inf"], hist["counts"]):
+            cumulative += count
+            lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {hist['sum']}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {cumulative}")
+
+    out = []
+    for name in sorted(by_name):
+        kind, help_text = HELP.get(name, ("untyped", name))
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(by_name[name])
+    return "\n".join(out) + "\n"
+
+
+# ============================================
+# SLOW REQUEST PROFILER
+# ============================================
+
+class SlowRequestProfiler:
+    """Samples the stacks of in-flight requests from a background thread.
+
+    Only requests that have already run for half the slow threshold are
+    sampled, so fast requests cost nothing beyond two dict operations.
+    """
+
+    def __init__(self, threshold_ms, interval=0.005, top=10):
+        self.threshold = threshold_ms / 1000.0
+        self.interval = interval
+        self.top = top
+        self.active = {}  # thread id -> [start, Counter of frames]
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start_request(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+            self.thread.start()
+        with self.lock:
+            self.active[threading.get_ident()] = [time.perf_counter(), Counter()]
+
+    def end_request(self):
+        with self.lock:
+            entry = self.active.pop(threading.get_ident(), None)
+        return entry[1] if entry else Counter()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            with self.lock:
+                due = {tid: e for tid, e in self.active.items() if now - e[0] >= self.threshold / 2}
+            if not due:
+                continue
+            frames = sys._current_frames()
+            for tid, entry in due.items():
+                frame = frames.get(tid)
+                seen = set()
+                while frame is not None:
+                    code = frame.f_code
+                    key = f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                    if key not in seen:
+                        entry[1][key] += 1
+                        seen.add(key)
+                    frame = frame.f_back
+
+    def report(self, samples):
+        if not samples:
+            return "  (no samples)"
+        total = max(samples.values())
+        return "\n".join(f"  {count / total:6.0%}  {frame}" for frame, count in samples.most_common(self.top))
+
+
+# ============================================
+# FLASK + SQLALCHEMY HOOKS
+# ============================================
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info["query_start"].pop()
+    current = _request_sql.get()
+    if current is not None:
+        current[0] += 1
+        current[1] += time.perf_counter() - start
+        if current[2] is not None:
+            current[2].append(statement)
+
+
+def instrument_sqlalchemy():
+    """Count statements and SQL time of every engine, per request"""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def count_queries(record=True):
+    """Count the SQL run inside the block: yields [count, seconds, statements]"""
+    state = [0, 0.0, [] if record else None]
+    token = _request_sql.set(state)
+    try:
+        yield state
+    finally:
+        _request_sql.reset(token)
+
+
+def _measure_stream(chunks, finish):
+    """Yield `chunks`, then finish() once the body is done or closed"""
+    chunks = iter(chunks)
+    try:
+        yield from chunks
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+        finish()
+
+
+def query_budget(limit):
+    """Decorator: allow a view at most `limit` SQL statements per request"""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def check_query_budget(state, limit, where):
+    """Raise QueryBudgetExceeded if `state` (from count_queries) ran over `limit`"""
+    if limit is None or state[0] <= limit:
+        return
+    message = f"{where} ran {state[0]} SQL statements, budget is {limit}"
+    if state[2]:
+        statement, times = Counter(state[2]).most_common(1)[0]
+        message += f"; repeated {times}x: {' '.join(statement.split())[:300]}"
+    raise QueryBudgetExceeded(message)
+
+
+def init_app(app):
+    """Instrument a Flask app and serve /metrics"""
+    from flask import Response, g, request
+
+    threshold = os.environ.get("SLOW_REQUEST_MS")
+    profiler = SlowRequestProfiler(float(threshold)) if threshold else None
+    if app.config.get("DATA_BACKEND", "sqlalchemy") == "sqlalchemy":
+        instrument_sqlalchemy()
+
+    def budget_for(endpoint):
+        limit = app.config.get("SQL_QUERY_BUDGET", os.environ.get("SQL_QUERY_BUDGET"))
+        limit = getattr(app.view_functions.get(endpoint), "query_budget", limit)
+        return int(limit) if limit is not None else None
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+        g._metrics_budget = budget_for(request.endpoint)
+        # Statement texts are only kept while a budget is being enforced
+        g._metrics_sql = [0, 0.0, [] if g._metrics_budget is not None else None]
+        g._metrics_token = _request_sql.set(g._metrics_sql)
+        if profiler:
+            profiler.start_request()
+
+    @app.after_request
+    def _record(response):
+        start = g.pop("_metrics_start", None)
+        if start is None:
+            return response
+        sql = g.pop("_metrics_sql")
+        token = g.pop("_metrics_token")
+        budget = g.pop("_metrics_budget", None)
+        method, path = request.method, request.path
+        labels = (("endpoint", request.endpoint or "unmatched"), ("method", method))
+        status = response.status_code
+
+        def finish():
+            elapsed = time.perf_counter() - start
+            try:
+                _request_sql.reset(token)
+            except ValueError:
+                pass  # body closed from another context; the request's own context is gone
+            sql_count, sql_time = sql[0], sql[1]
+            registry.observe("http_request_duration_seconds", elapsed, LATENCY_BUCKETS, labels)
+            registry.inc("http_requests_total", labels + (("status", status),))
+            registry.observe("http_request_sql_statements", sql_count, SQL_COUNT_BUCKETS, labels)
+            registry.inc("http_request_sql_seconds_total", labels, sql_time)
+
+            if profiler:
+                samples = profiler.end_request()
+                if elapsed >= profiler.threshold:
+                    log.warning("Slow request %s %s: %.0f ms, %d SQL statements (%.0f ms)\n%s",
+                                method, path, elapsed * 1000, sql_count, sql_time * 1000,
+                                profiler.report(samples))
+            registry.maybe_dump()
+
+            try:
+                check_query_budget(sql, budget, f"{method} {path}")
+            except QueryBudgetExceeded:
+                if app.testing:
+                    raise
+                log.warning("Query budget exceeded", exc_info=True)
+
+        if response.is_streamed:
+            # Most of a streamed list's SQL runs while the body is produced, after this hook,
+            # so the request stays timed and its SQL counted until the body is finished
+            g._metrics_streaming = True
+            response.response = _measure_stream(response.response, finish)
+        else:
+            finish()
+        return response
+
+    @app.teardown_request
+    def _cleanup(exc):
+        # after_request is skipped if a before_request hook failed
+        token = g.pop("_metrics_token", None)
+        if token is not None:
+            _request_sql.reset(token)
+        # A streamed request is finished by its body, which can outlive the request context
+        if profiler and not g.pop("_metrics_streaming", False):
+            profiler.end_request()
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(render(), mimetype="text/plain; version=0.0.4")
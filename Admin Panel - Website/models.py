@@ -17,6 +17,8 @@ class Bus(db.Model):
     route_id = db.Column(db.Integer, db.ForeignKey('route.route_id'), nullable=True)
     status = db.Column(db.String(20), default='Active')  # Active / In Depot / Breakdown
 
+    route = db.relationship('Route', backref='buses')
+
 
 class Driver(db.Model):
     __tablename__ = 'driver'
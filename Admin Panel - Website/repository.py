@@ -0,0 +1,583 @@
+"""
+Repository layer
+One interface for the SQLAlchemy, Firestore and in-memory data backends.
+
+Routes in app.py talk to the repository returned by get_repository() and
+only ever see plain dicts, so the backend can be switched with the
+DATA_BACKEND config value ("sqlalchemy", "firestore" or "memory").
+"""
+import threading
+from datetime import datetime
+from itertools import count
+
+from flask import current_app
+
+# Entity kind -> name of its id field
+ID_FIELDS = {
+    'buses': 'bus_id',
+    'drivers': 'driver_id',
+    'routes': 'route_id',
+    'maintenance': 'id',
+}
+
+# Keeps IN (...) lists under SQLite's bound-parameter limit
+IN_CHUNK = 500
+
+# Entity kind -> writable fields
+FIELDS = {
+    'buses': ('number', 'route_id', 'status'),
+    'drivers': ('name', 'phone', 'attendance'),
+    'routes': ('name', 'start_stop', 'end_stop', 'first_bus', 'last_bus', 'frequency_min'),
+    'maintenance': ('bus_id', 'issue', 'status', 'reported_at', 'reported_on'),
+}
+
+
+# Entity kind -> (display field, parent kind, foreign key, parent field).
+# list() rows carry the parent's name so pages never look it up per row.
+RELATED = {
+    'buses': ('route_name', 'routes', 'route_id', 'name'),
+    'maintenance': ('bus_number', 'buses', 'bus_id', 'number'),
+}
+
+
+def pick_fields(kind, data):
+    """Return only the writable fields of `kind` present in `data`"""
+    return {k: data[k] for k in FIELDS[kind] if k in data}
+
+
+class Repository:
+    """Base class for data backends.
+
+    Every method works on plain dicts. The batched methods have a naive
+    default built on the single-row ones; backends override them with a
+    real bulk implementation.
+    """
+
+    name = 'base'
+
+    # ---------- AUTH ----------
+    def authenticate(self, username, password):
+        """Return the admin id for valid credentials, else None"""
+        raise NotImplementedError
+
+    # ---------- SINGLE ROW ----------
+    def list(self, kind):
+        """All rows of `kind`, with the RELATED display field filled in"""
+        raise NotImplementedError
+
+    def get(self, kind, entity_id):
+        raise NotImplementedError
+
+    def iter_list(self, kind, batch=1000):
+        """The rows of list(kind) as an iterator, read `batch` at a time where the backend can"""
+        yield from self.list(kind)
+
+    def add(self, kind, data):
+        """Insert a row and return its id"""
+        raise NotImplementedError
+
+    def update(self, kind, entity_id, data):
+        """Update a row, returning False if it does not exist"""
+        raise NotImplementedError
+
+    def delete(self, kind, entity_id):
+        """Delete a row, returning False if it does not exist"""
+        raise NotImplementedError
+
+    # ---------- BATCHED ----------
+    def get_many(self, kind, ids):
+        """Return {id: row} for the ids that exist"""
+        rows = {}
+        for entity_id in ids:
+            row = self.get(kind, entity_id)
+            if row is not None:
+                rows[row[ID_FIELDS[kind]]] = row
+        return rows
+
+    def find(self, kind, field, values):
+        """Rows of `kind` whose `field` is one of `values`"""
+        # As strings: ids are ints or strings depending on the backend
+        values = {str(value) for value in values}
+        return [row for row in self.iter_list(kind) if str(row.get(field)) in values]
+
+    def add_many(self, kind, rows):
+        """Insert several rows, returning their ids in order"""
+        return [self.add(kind, data) for data in rows]
+
+    def update_many(self, kind, updates):
+        """Apply {id: data} updates, returning the number of rows updated"""
+        return sum(1 for entity_id, data in updates.items() if self.update(kind, entity_id, data))
+
+    def delete_many(self, kind, ids):
+        """Delete several rows, returning the number of rows deleted"""
+        return sum(1 for entity_id in ids if self.delete(kind, entity_id))
+
+    def _with_related(self, kind, rows):
+        """Copy `rows` adding the RELATED display field, one get_many for all"""
+        if kind not in RELATED:
+            return rows
+        field, parent_kind, foreign_key, parent_field = RELATED[kind]
+        ids = {str(row[foreign_key]) for row in rows if row.get(foreign_key) is not None}
+        parents = {str(k): v for k, v in self.get_many(parent_kind, ids).items()}
+        return [
+            dict(row, **{field: parents.get(str(row.get(foreign_key)), {}).get(parent_field)})
+            for row in rows
+        ]
+
+    # ---------- LIVE LOCATIONS ----------
+    def get_live_locations(self):
+        raise NotImplementedError
+
+    def live_locations_version(self):
+        """Token that changes with the live locations, or None if unknown"""
+        return None
+
+    def update_live_location(self, bus_id, location):
+        raise NotImplementedError
+
+    def update_live_locations(self, records):
+        """Store several (bus_id, location) pairs, returning how many"""
+        for bus_id, location in records:
+            self.update_live_location(bus_id, location)
+        return len(records)
+
+
+# ============================================
+# SQLALCHEMY
+# ============================================
+
+class SQLAlchemyRepository(Repository):
+    """Repository backed by the Flask-SQLAlchemy models"""
+
+    name = 'sqlalchemy'
+
+    def __init__(self, db, shared_state=None):
+        from models import Admin, Bus, Driver, Route, MaintenanceLog
+        from shared_state import SharedState
+
+        self.db = db
+        self.admin_model = Admin
+        self.models = {
+            'buses': Bus,
+            'drivers': Driver,
+            'routes': Route,
+            'maintenance': MaintenanceLog,
+        }
+        # Relationship loaded together with each kind's list() query
+        self.eager = {
+            'buses': Bus.route,
+            'maintenance': MaintenanceLog.bus,
+        }
+        # Live positions are shared between worker processes
+        self.live = shared_state or SharedState(':memory:')
+
+    @staticmethod
+    def _pk(entity_id):
+        try:
+            return int(entity_id)
+        except (TypeError, ValueError):
+            return None
+
+    def _pk_column(self, kind):
+        return getattr(self.models[kind], ID_FIELDS[kind])
+
+    def _to_dict(self, kind, obj, related=False):
+        data = {ID_FIELDS[kind]: getattr(obj, ID_FIELDS[kind])}
+        for field in FIELDS[kind]:
+            data[field] = getattr(obj, field)
+        if related and kind in RELATED:
+            # Only with the relationship eager loaded, or this is a query per row
+            field, _, _, parent_field = RELATED[kind]
+            parent = getattr(obj, self.eager[kind].key)
+            data[field] = getattr(parent, parent_field) if parent is not None else None
+        return data
+
+    def authenticate(self, username, password):
+        admin = self.admin_model.query.filter_by(username=username, password=password).first()
+        return admin.id if admin else None
+
+    def _list_query(self, kind):
+        from sqlalchemy.orm import joinedload
+
+        query = self.models[kind].query
+        if kind in self.eager:
+            # Many-to-one, so a LEFT JOIN in the same query
+            query = query.options(joinedload(self.eager[kind]))
+        if kind == 'maintenance':
+            query = query.order_by(self.models[kind].reported_at.desc())
+        return query
+
+    def list(self, kind):
+        return [self._to_dict(kind, obj, related=True) for obj in self._list_query(kind).all()]
+
+    def iter_list(self, kind, batch=1000):
+        # Fetches `batch` rows per round; earlier objects can be garbage collected
+        for obj in self._list_query(kind).yield_per(batch):
+            yield self._to_dict(kind, obj, related=True)
+
+    def get(self, kind, entity_id):
+        pk = self._pk(entity_id)
+        obj = self.db.session.get(self.models[kind], pk) if pk is not None else None
+        return self._to_dict(kind, obj) if obj else None
+
+    def add(self, kind, data):
+        obj = self.models[kind](**pick_fields(kind, data))
+        self.db.session.add(obj)
+        self.db.session.commit()
+        return getattr(obj, ID_FIELDS[kind])
+
+    def update(self, kind, entity_id, data):
+        pk = self._pk(entity_id)
+        obj = self.db.session.get(self.models[kind], pk) if pk is not None else None
+        if not obj:
+            return False
+        for field, value in pick_fields(kind, data).items():
+            setattr(obj, field, value)
+        self.db.session.commit()
+        return True
+
+    def delete(self, kind, entity_id):
+        pk = self._pk(entity_id)
+        obj = self.db.session.get(self.models[kind], pk) if pk is not None else None
+        if not obj:
+            return False
+        self.db.session.delete(obj)
+        self.db.session.commit()
+        return True
+
+    def get_many(self, kind, ids):
+        pks = [pk for pk in map(self._pk, ids) if pk is not None]
+        rows = {}
+        for i in range(0, len(pks), IN_CHUNK):
+            objs = self.models[kind].query.filter(self._pk_column(kind).in_(pks[i:i + IN_CHUNK])).all()
+            rows.update((getattr(obj, ID_FIELDS[kind]), self._to_dict(kind, obj)) for obj in objs)
+        return rows
+
+    def find(self, kind, field, values):
+        column = getattr(self.models[kind], field)
+        return [self._to_dict(kind, obj) for obj in self.models[kind].query.filter(column.in_(list(values))).all()]
+
+    def add_many(self, kind, rows):
+        from sqlalchemy import insert
+
+        params = [pick_fields(kind, data) for data in rows]
+        if not params:
+            return []
+        # ORM bulk INSERT ... RETURNING: batched, no per-row objects
+        model = self.models[kind]
+        stmt = insert(model).returning(self._pk_column(kind), sort_by_parameter_order=True)
+        ids = self.db.session.scalars(stmt, params).all()
+        self.db.session.commit()
+        return ids
+
+    def update_many(self, kind, updates):
+        from sqlalchemy import update
+
+        id_field = ID_FIELDS[kind]
+        existing = set(self.get_many(kind, updates.keys()))
+        params = [
+            {id_field: self._pk(entity_id), **pick_fields(kind, data)}
+            for entity_id, data in updates.items()
+            if self._pk(entity_id) in existing
+        ]
+        if params:
+            # ORM bulk UPDATE by primary key, one executemany per batch
+            self.db.session.execute(update(self.models[kind]), params)
+            self.db.session.commit()
+        return len(params)
+
+    def delete_many(self, kind, ids):
+        from sqlalchemy import delete
+
+        pks = [pk for pk in map(self._pk, ids) if pk is not None]
+        deleted = 0
+        for i in range(0, len(pks), IN_CHUNK):
+            result = self.db.session.execute(
+                delete(self.models[kind]).where(self._pk_column(kind).in_(pks[i:i + IN_CHUNK]))
+            )
+            deleted += result.rowcount
+        self.db.session.commit()
+        return deleted
+
+    def get_live_locations(self):
+        return self.live.get_live_locations()
+
+    def live_locations_version(self):
+        return self.live.live_version()
+
+    def update_live_location(self, bus_id, location):
+        self.live.update_live_location(bus_id, location)
+
+    def update_live_locations(self, records):
+        return self.live.update_live_locations(records)
+
+
+# ============================================
+# FIRESTORE
+# ============================================
+
+class FirestoreRepository(Repository):
+    """Repository backed by the firebase_service module"""
+
+    name = 'firestore'
+
+    def __init__(self):
+        import firebase_service
+
+        self.fs = firebase_service
+        self.collections = {
+            'buses': firebase_service.COLLECTIONS['buses'],
+            'drivers': firebase_service.COLLECTIONS['drivers'],
+            'routes': firebase_service.COLLECTIONS['routes'],
+            'maintenance': firebase_service.COLLECTIONS['maintenance'],
+        }
+        self.readers = {
+            'buses': (firebase_service.get_all_buses, firebase_service.get_bus_by_id),
+            'drivers': (firebase_service.get_all_drivers, firebase_service.get_driver_by_id),
+            'routes': (firebase_service.get_all_routes, firebase_service.get_route_by_id),
+            'maintenance': (firebase_service.get_all_maintenance, firebase_service.get_maintenance_by_id),
+        }
+        self.writers = {
+            'buses': (firebase_service.add_bus, firebase_service.update_bus, firebase_service.delete_bus),
+            'drivers': (firebase_service.add_driver, firebase_service.update_driver, firebase_service.delete_driver),
+            'routes': (firebase_service.add_route, firebase_service.update_route, firebase_service.delete_route),
+            'maintenance': (
+                firebase_service.add_maintenance,
+                firebase_service.update_maintenance,
+                firebase_service.delete_maintenance,
+            ),
+        }
+
+    def authenticate(self, username, password):
+        admin = self.fs.get_admin_by_username(username)
+        if admin and admin.get('password') == password:
+            return admin['id']
+        return None
+
+    def list(self, kind):
+        # Copies, so the cached collection rows stay untouched
+        return self._with_related(kind, self.readers[kind][0]())
+
+    def get(self, kind, entity_id):
+        return self.readers[kind][1](entity_id)
+
+    def add(self, kind, data):
+        return self.writers[kind][0](pick_fields(kind, data))
+
+    def update(self, kind, entity_id, data):
+        if self.get(kind, entity_id) is None:
+            return False
+        return self.writers[kind][1](entity_id, pick_fields(kind, data))
+
+    def delete(self, kind, entity_id):
+        if self.get(kind, entity_id) is None:
+            return False
+        return self.writers[kind][2](entity_id)
+
+    def get_many(self, kind, ids):
+        return self.fs.get_many(kind, ids)
+
+    def add_many(self, kind, rows):
+        rows = [pick_fields(kind, data) for data in rows]
+        if kind == 'maintenance':
+            # get_all_maintenance orders by reported_at, which must be present
+            now = datetime.now()
+            rows = [dict(row, reported_at=row.get('reported_at') or now) for row in rows]
+        return self.fs.add_many(kind, rows)
+
+    def update_many(self, kind, updates):
+        existing = self.fs.get_many(kind, updates.keys())
+        return self.fs.update_many(kind, {
+            doc_id: pick_fields(kind, data)
+            for doc_id, data in updates.items()
+            if str(doc_id) in existing
+        })
+
+    def delete_many(self, kind, ids):
+        existing = self.fs.get_many(kind, ids)
+        return self.fs.delete_many(kind, list(existing))
+
+    def get_live_locations(self):
+        return self.fs.get_live_locations()
+
+    def update_live_location(self, bus_id, location):
+        return self.fs.update_live_location(bus_id, dict(location))
+
+    def update_live_locations(self, records):
+        return self.fs.update_live_locations(records)
+
+
+# ============================================
+# IN-MEMORY
+# ============================================
+
+class MemoryRepository(Repository):
+    """Repository kept in process memory, seeded from DataStore.
+
+    Rows are private to each process; only live locations go through the
+    shared state, so run this backend with a single worker.
+    """
+
+    name = 'memory'
+
+    def __init__(self, seed=True, shared_state=None):
+        from data_store import DataStore
+        from shared_state import SharedState
+
+        self.tables = {kind: {} for kind in ID_FIELDS}
+        self.counters = {kind: count(1) for kind in ID_FIELDS}
+        self.admins = {'admin': ('admin', 'admin123')}
+        self.live = shared_state or SharedState(':memory:')
+        if seed:
+            store = DataStore()
+            seed_rows = {
+                'buses': store.get_buses(),
+                'drivers': store.get_drivers(),
+                'routes': store.get_routes(),
+                'maintenance': store.get_maintenance(),
+            }
+            for kind, rows in seed_rows.items():
+                for row in rows:
+                    row = dict(row)
+                    row[ID_FIELDS[kind]] = str(row[ID_FIELDS[kind]])
+                    self.tables[kind][row[ID_FIELDS[kind]]] = row
+            if not self.live.get_live_locations():
+                self.live.update_live_locations(list(store.get_live_locations().items()))
+
+    def _next_id(self, kind):
+        entity_id = str(next(self.counters[kind]))
+        while entity_id in self.tables[kind]:
+            entity_id = str(next(self.counters[kind]))
+        return entity_id
+
+    def authenticate(self, username, password):
+        admin = self.admins.get(username)
+        if admin and admin[1] == password:
+            return admin[0]
+        return None
+
+    def list(self, kind):
+        rows = [dict(row) for row in self.tables[kind].values()]
+        if kind == 'maintenance':
+            rows.reverse()  # newest first, like the other backends
+        return self._with_related(kind, rows)
+
+    def get(self, kind, entity_id):
+        row = self.tables[kind].get(str(entity_id))
+        return dict(row) if row else None
+
+    def iter_list(self, kind, batch=1000):
+        table = self.tables[kind]
+        ids = list(table)
+        if kind == 'maintenance':
+            ids.reverse()
+        for i in range(0, len(ids), batch):
+            rows = [dict(table[k]) for k in ids[i:i + batch] if k in table]
+            yield from self._with_related(kind, rows)
+
+    def add(self, kind, data):
+        entity_id = self._next_id(kind)
+        row = {field: None for field in FIELDS[kind]}
+        row.update(pick_fields(kind, data))
+        row[ID_FIELDS[kind]] = entity_id
+        self.tables[kind][entity_id] = row
+        return entity_id
+
+    def update(self, kind, entity_id, data):
+        row = self.tables[kind].get(str(entity_id))
+        if row is None:
+            return False
+        row.update(pick_fields(kind, data))
+        return True
+
+    def delete(self, kind, entity_id):
+        return self.tables[kind].pop(str(entity_id), None) is not None
+
+    def get_many(self, kind, ids):
+        table = self.tables[kind]
+        return {str(i): dict(table[str(i)]) for i in ids if str(i) in table}
+
+    def get_live_locations(self):
+        return self.live.get_live_locations()
+
+    def live_locations_version(self):
+        return self.live.live_version()
+
+    def update_live_location(self, bus_id, location):
+        self.live.update_live_location(bus_id, location)
+
+    def update_live_locations(self, records):
+        return self.live.update_live_locations(records)
+
+
+# ============================================
+# FACTORY
+# ============================================
+
+def create_repository(backend, db=None, shared_state=None):
+    """Build the repository for a DATA_BACKEND name.
+
+    `shared_state` (a shared_state.SharedState) holds the live positions and
+    cache versions every worker process must agree on.
+    """
+    if backend == 'sqlalchemy':
+        if db is None:
+            from models import db
+        return SQLAlchemyRepository(db, shared_state)
+    if backend == 'firestore':
+        if shared_state is not None:
+            import firebase_service
+            firebase_service.use_shared_state(shared_state)
+        return FirestoreRepository()
+    if backend == 'memory':
+        return MemoryRepository(shared_state=shared_state)
+    raise ValueError(f"Unknown DATA_BACKEND: {backend!r}")
+
+
+def init_app(app, db=None):
+    """Register the configured backend on a Flask app.
+
+    The repository itself (and the backend modules it imports) is built
+    on the first get_repository() call, not at app import.
+    """
+    app.extensions['repository'] = {
+        'backend': app.config.get('DATA_BACKEND', 'sqlalchemy'),
+        'db': db,
+        'shared_state_path': app.config.get('SHARED_STATE_PATH'),
+        'shared': None,
+        'instance': None,
+        'lock': threading.Lock(),
+    }
+
+
+def get_repository():
+    """Return the repository of the current Flask app"""
+    state = current_app.extensions['repository']
+    if state['instance'] is None:
+        with state['lock']:
+            if state['instance'] is None:
+                path = state['shared_state_path']
+                shared = None
+                if path:
+                    from shared_state import SharedState
+                    shared = SharedState(path)
+                state['instance'] = create_repository(state['backend'], state['db'], shared)
+                state['shared'] = shared
+    return state['instance']
+
+
+def get_shared_state():
+    """Return the SharedState of the current app's repository.
+
+    Code that keeps documents for all workers (such as the roster) uses this
+    one rather than opening its own, so its writes invalidate the same caches.
+    """
+    repo = get_repository()
+    state = current_app.extensions['repository']
+    if state['shared'] is None:
+        with state['lock']:
+            if state['shared'] is None:
+                from shared_state import SharedState
+                # No SHARED_STATE_PATH: the repository's private one, if it has one
+                state['shared'] = getattr(repo, 'live', None) or SharedState(':memory:')
+    return state['shared']
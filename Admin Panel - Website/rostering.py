@@ -0,0 +1,481 @@
+"""
+Rostering
+Builds the day's trips from the route timetable and gives each trip a bus
+and a driver.
+
+Trips: every route runs a round trip from its start stop every
+frequency_min minutes, from first_bus to last_bus. Each trip takes
+trip_minutes.
+
+Buses: Active, serving the trip's route, and with no Pending or In Progress
+maintenance. A bus needs `turnaround` minutes between trips.
+
+Drivers: Present ones. A shift (first departure to last arrival) is at
+most max_shift minutes. At most max_driving minutes may pass between rests,
+and only a gap of `rest` minutes or more counts as one.
+
+solve() walks the trips in departure order. Each trip takes its route's
+earliest free bus. The driver of that bus's previous trip stays on when the
+rules allow; otherwise the longest-rested driver, or a fresh one, takes
+over. That is O(trips log drivers) for a whole city. Changes during the day
+are repaired in place, only touching the trips that lost their bus or
+driver:
+
+    roster = build(get_repository())
+    roster.driver_absent(driver_id, now=minutes)
+    roster.bus_unavailable(bus_id, now=minutes)
+
+The roster of the day is kept in shared_state.py, so every worker reads
+and repairs the same one (see current_roster / repair).
+"""
+from bisect import bisect_left, insort
+from datetime import date, datetime
+from heapq import heappop, heappush
+
+from repository import get_shared_state
+
+DEFAULT_RULES = {
+    "trip_minutes": 60,
+    "turnaround": 5,
+    "max_shift": 8 * 60,
+    "max_driving": 4 * 60,
+    "rest": 30,
+}
+
+# Maintenance states that keep a bus off the roster
+BLOCKING_MAINTENANCE = ("Pending", "In Progress")
+
+
+def _minutes(hhmm):
+    """Minutes after midnight for "HH:MM", or None"""
+    try:
+        hours, minutes = hhmm.split(":")
+        return int(hours) * 60 + int(minutes)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _hhmm(minutes):
+    return f"{minutes // 60 % 24:02d}:{minutes % 60:02d}"
+
+
+def generate_trips(routes, trip_minutes=DEFAULT_RULES["trip_minutes"]):
+    """[(trip_id, route_id, start, end)] from the routes' first_bus / last_bus / frequency_min"""
+    trips = []
+    for route in routes:
+        first, last = _minutes(route.get("first_bus")), _minutes(route.get("last_bus"))
+        try:
+            frequency = int(route.get("frequency_min") or 0)
+        except (TypeError, ValueError):
+            frequency = 0
+        if first is None or last is None or frequency <= 0:
+            continue
+        if last < first:  # runs past midnight
+            last += 24 * 60
+        route_id = str(route["route_id"])
+        for start in range(first, last + 1, frequency):
+            trips.append((f"{route_id}-{_hhmm(start)}", route_id, start, start + trip_minutes))
+    return trips
+
+
+class Roster:
+    """Trips with their bus and driver, plus per bus / per driver schedules"""
+
+    def __init__(self, trips, buses, drivers, rules=None, day=None):
+        self.rules = dict(DEFAULT_RULES, **(rules or {}))
+        self.day = day or date.today().isoformat()
+        self.trips = {trip[0]: trip for trip in sorted(trips, key=lambda t: (t[2], t[0]))}
+        self.buses = {str(bus_id): str(route_id) for bus_id, route_id in buses.items()}  # bus -> route
+        self.route_buses = {}
+        for bus_id, route_id in self.buses.items():
+            self.route_buses.setdefault(route_id, []).append(bus_id)
+        self.drivers = dict.fromkeys(map(str, drivers))  # ordered set
+        self.bus_of = {}
+        self.driver_of = {}
+        self.bus_trips = {bus_id: [] for bus_id in self.buses}  # sorted (start, end, trip_id)
+        self.driver_trips = {driver_id: [] for driver_id in self.drivers}
+
+    # ---------- CHECKS ----------
+    def _bus_fits(self, bus_id, start, end):
+        schedule = self.bus_trips[bus_id]
+        turnaround = self.rules["turnaround"]
+        i = bisect_left(schedule, (start,))
+        return ((i == 0 or schedule[i - 1][1] + turnaround <= start)
+                and (i == len(schedule) or end + turnaround <= schedule[i][0]))
+
+    def _driver_fits(self, driver_id, start, end):
+        schedule = self.driver_trips[driver_id]
+        rules = self.rules
+        i = bisect_left(schedule, (start,))
+        if i and schedule[i - 1][1] + rules["turnaround"] > start:
+            return False
+        if i < len(schedule) and end + rules["turnaround"] > schedule[i][0]:
+            return False
+        if schedule and max(end, schedule[-1][1]) - min(start, schedule[0][0]) > rules["max_shift"]:
+            return False
+        # The stretch without a rest that this trip would be part of
+        block_start, block_end = start, end
+        j = i - 1
+        while j >= 0 and block_start - schedule[j][1] < rules["rest"]:
+            block_start = schedule[j][0]
+            j -= 1
+        k = i
+        while k < len(schedule) and schedule[k][0] - block_end < rules["rest"]:
+            block_end = schedule[k][1]
+            k += 1
+        return block_end - block_start <= rules["max_driving"]
+
+    # ---------- ASSIGNMENT ----------
+    def _assign(self, trip, bus_id, driver_id):
+        trip_id, _, start, end = trip
+        self.bus_of[trip_id] = bus_id
+        self.driver_of[trip_id] = driver_id
+        insort(self.bus_trips[bus_id], (start, end, trip_id))
+        insort(self.driver_trips[driver_id], (start, end, trip_id))
+
+    def _unassign(self, trip_id):
+        start, end = self.trips[trip_id][2:]
+        bus_id = self.bus_of.pop(trip_id, None)
+        driver_id = self.driver_of.pop(trip_id, None)
+        if bus_id in self.bus_trips:
+            self.bus_trips[bus_id].remove((start, end, trip_id))
+        if driver_id in self.driver_trips:
+            self.driver_trips[driver_id].remove((start, end, trip_id))
+        return bus_id, driver_id
+
+    def solve(self):
+        """Assign every trip from scratch; returns self"""
+        for trip_id in list(self.bus_of):
+            self._unassign(trip_id)
+        rest = self.rules["rest"]
+        unused = {}  # route -> buses not used yet
+        for bus_id, route_id in reversed(self.buses.items()):
+            unused.setdefault(route_id, []).append(bus_id)
+        busy = {}  # route -> heap of (free at, bus)
+        fresh = list(reversed(self.drivers))
+        rested = []  # heap of (last arrival, driver); stale entries are skipped
+        last_driver = {}  # bus -> driver of its previous trip
+
+        for trip in self.trips.values():
+            trip_id, route_id, start, end = trip
+            heap = busy.setdefault(route_id, [])
+            if heap and heap[0][0] + self.rules["turnaround"] <= start:
+                bus_id = heap[0][1]
+            elif unused.get(route_id):
+                bus_id = unused[route_id][-1]
+            else:
+                continue  # no bus for this trip
+
+            driver_id = last_driver.get(bus_id)
+            if driver_id is None or not self._driver_fits(driver_id, start, end):
+                driver_id = None
+                while rested and rested[0][0] + rest <= start:
+                    arrival, candidate = heappop(rested)
+                    if self.driver_trips[candidate][-1][1] != arrival:
+                        continue  # has driven since
+                    if self._driver_fits(candidate, start, end):
+                        driver_id = candidate
+                        break
+                    # Over max_shift; later trips only end later, so drop them
+                while driver_id is None and fresh:
+                    candidate = fresh.pop()
+                    if self._driver_fits(candidate, start, end):
+                        driver_id = candidate
+            if driver_id is None:
+                continue  # no driver: the bus stays free
+
+            if heap and heap[0][1] == bus_id:
+                heappop(heap)
+            else:
+                unused[route_id].pop()
+            heappush(heap, (end, bus_id))
+            heappush(rested, (end, driver_id))
+            last_driver[bus_id] = driver_id
+            self._assign(trip, bus_id, driver_id)
+        return self
+
+    # ---------- REPAIRS ----------
+    def _find_bus(self, trip, candidates=None):
+        _, route_id, start, end = trip
+        for bus_id in self.route_buses.get(route_id, []) if candidates is None else candidates:
+            if self.buses.get(bus_id) == route_id and self._bus_fits(bus_id, start, end):
+                return bus_id
+        return None
+
+    def _find_driver(self, trip, bus_id, candidates=None):
+        """A driver for `trip`: the bus's previous driver, else anyone already working, else a fresh one"""
+        start, end = trip[2:]
+        if candidates is None:
+            schedule = self.bus_trips.get(bus_id, [])
+            i = bisect_left(schedule, (start,))
+            if i:
+                previous = self.driver_of[schedule[i - 1][2]]
+                if previous in self.drivers and self._driver_fits(previous, start, end):
+                    return previous
+            candidates = self.drivers
+        fresh = None
+        for driver_id in candidates:
+            if not self.driver_trips[driver_id]:
+                fresh = fresh or driver_id
+            elif self._driver_fits(driver_id, start, end):
+                return driver_id
+        return fresh
+
+    def _cover(self, trip_id, keep_bus=None, keep_driver=None, buses=None, drivers=None):
+        """Give trip_id a bus and a driver (keeping the given ones, else searching `buses` /
+        `drivers` or everyone); False leaves it uncovered"""
+        trip = self.trips[trip_id]
+        bus_id = keep_bus or self._find_bus(trip, buses)
+        driver_id = (keep_driver or self._find_driver(trip, bus_id, drivers)) if bus_id else None
+        if bus_id and driver_id:
+            self._assign(trip, bus_id, driver_id)
+            return True
+        return False
+
+    def _repair(self, trip_ids, keep):
+        """Re-cover trip_ids in departure order; keep(bus, driver) -> (bus, driver) to hold on to"""
+        changed = []
+        for trip_id in sorted(trip_ids, key=lambda t: self.trips[t][2]):
+            bus_id, driver_id = self._unassign(trip_id)
+            self._cover(trip_id, *keep(bus_id, driver_id))
+            changed.append(trip_id)
+        return [self.assignment(trip_id) for trip_id in changed]
+
+    def driver_absent(self, driver_id, now=0):
+        """Take driver_id off every trip departing at `now` or later; returns the changed trips"""
+        driver_id = str(driver_id)
+        self.drivers.pop(driver_id, None)
+        trips = [t for start, _, t in self.driver_trips.get(driver_id, []) if start >= now]
+        return self._repair(trips, lambda bus_id, _: (bus_id, None))
+
+    def bus_unavailable(self, bus_id, now=0):
+        """Move bus_id's trips departing at `now` or later to other buses; returns the changed trips"""
+        bus_id = str(bus_id)
+        route_id = self.buses.pop(bus_id, None)
+        if route_id is not None:
+            self.route_buses[route_id].remove(bus_id)
+        trips = [t for start, _, t in self.bus_trips.get(bus_id, []) if start >= now]
+        changed = self._repair(trips, lambda _, driver_id: (None, driver_id))
+        if not any(start < now for start, _, _ in self.bus_trips.get(bus_id, [])):
+            self.bus_trips.pop(bus_id, None)
+        return changed
+
+    def driver_present(self, driver_id, now=0):
+        """Add driver_id and use them for uncovered trips from `now`; returns the changed trips"""
+        driver_id = str(driver_id)
+        self.drivers[driver_id] = None
+        self.driver_trips.setdefault(driver_id, [])
+        # Uncovered trips had no driver that fits; only the new one can change that
+        return self.fill(now, drivers=[driver_id])
+
+    def bus_available(self, bus_id, route_id, now=0):
+        """Add bus_id on route_id and use it for uncovered trips from `now`; returns the changed trips"""
+        bus_id, route_id = str(bus_id), str(route_id)
+        self.buses[bus_id] = route_id
+        self.route_buses.setdefault(route_id, []).append(bus_id)
+        self.bus_trips.setdefault(bus_id, [])
+        return self.fill(now, route_id=route_id, buses=[bus_id])
+
+    def route_changed(self, route_id, trips, now=0):
+        """Replace route_id's trips departing at `now` or later with `trips` (its new timetable,
+        empty once deleted). Unchanged trips keep their crew; returns the changed trips."""
+        route_id = str(route_id)
+        new = {trip[0]: tuple(trip) for trip in trips if trip[2] >= now}
+        cancelled, freed = [], set()
+        for trip_id, trip in list(self.trips.items()):
+            if trip[1] == route_id and trip[2] >= now and new.get(trip_id) != trip:
+                cancelled.append(dict(self.assignment(trip_id), bus_id=None, driver_id=None, cancelled=True))
+                freed.add(self._unassign(trip_id)[1])
+                del self.trips[trip_id]
+        added = [trip for trip_id, trip in new.items() if trip_id not in self.trips]
+        if added:
+            self.trips.update((trip[0], trip) for trip in added)
+            self.trips = dict(sorted(self.trips.items(), key=lambda item: (item[1][2], item[0])))
+        changed = [trip[0] for trip in sorted(added, key=lambda t: t[2]) if self._cover(trip[0])]
+        result = cancelled + [self.assignment(trip_id) for trip_id in changed]
+        # Drivers of cancelled trips may now fit trips elsewhere that had nobody
+        freed = [driver_id for driver_id in freed if driver_id in self.drivers]
+        return result + (self.fill(now, drivers=freed) if freed else [])
+
+    def fill(self, now=0, route_id=None, buses=None, drivers=None):
+        """Try to cover the uncovered trips departing at `now` or later (on route_id), with
+        `buses` / `drivers` if given"""
+        changed = [trip_id for trip_id, trip in self.trips.items()
+                   if trip[2] >= now and trip_id not in self.bus_of and route_id in (None, trip[1])
+                   and self._cover(trip_id, buses=buses, drivers=drivers)]
+        return [self.assignment(trip_id) for trip_id in changed]
+
+    # ---------- OUTPUT ----------
+    def assignment(self, trip_id):
+        _, route_id, start, end = self.trips[trip_id]
+        return {
+            "trip_id": trip_id,
+            "route_id": route_id,
+            "departs": _hhmm(start),
+            "arrives": _hhmm(end),
+            "bus_id": self.bus_of.get(trip_id),
+            "driver_id": self.driver_of.get(trip_id),
+        }
+
+    def assignments(self):
+        return [self.assignment(trip_id) for trip_id in self.trips]
+
+    def summary(self):
+        return {
+            "day": self.day,
+            "trips": len(self.trips),
+            "covered": len(self.bus_of),
+            "uncovered": len(self.trips) - len(self.bus_of),
+            "buses_used": sum(1 for trips in self.bus_trips.values() if trips),
+            "drivers_used": sum(1 for trips in self.driver_trips.values() if trips),
+        }
+
+    def violations(self):
+        """Broken rules, as readable strings (empty for a valid roster)"""
+        problems = []
+        for trip_id, bus_id in self.bus_of.items():
+            _, route_id, start, end = self.trips[trip_id]
+            driver_id = self.driver_of.get(trip_id)
+            if self.buses.get(bus_id, route_id) != route_id:
+                problems.append(f"{trip_id}: bus {bus_id} is not on route {route_id}")
+            for schedule, what, fits in ((self.bus_trips, f"bus {bus_id}", self._bus_fits),
+                                         (self.driver_trips, f"driver {driver_id}", self._driver_fits)):
+                owner = bus_id if schedule is self.bus_trips else driver_id
+                entry = (start, end, trip_id)
+                schedule[owner].remove(entry)
+                if not fits(owner, start, end):
+                    problems.append(f"{trip_id}: breaks the rules for {what}")
+                insort(schedule[owner], entry)
+        return problems
+
+    # ---------- STORAGE ----------
+    def to_dict(self):
+        return {
+            "day": self.day,
+            "rules": self.rules,
+            "trips": list(self.trips.values()),
+            "buses": self.buses,
+            "drivers": list(self.drivers),
+            "assigned": {trip_id: [bus_id, self.driver_of[trip_id]] for trip_id, bus_id in self.bus_of.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        roster = cls([tuple(t) for t in data["trips"]], data["buses"], data["drivers"], data["rules"], data["day"])
+        for trip_id, (bus_id, driver_id) in data["assigned"].items():
+            # Buses / drivers taken off the roster keep their trips from before
+            roster.bus_trips.setdefault(bus_id, [])
+            roster.driver_trips.setdefault(driver_id, [])
+            roster._assign(roster.trips[trip_id], bus_id, driver_id)
+        return roster
+
+
+# -------------- REPOSITORY --------------
+def available(repo):
+    """(buses {bus_id: route_id}, drivers [driver_id]) that can be rostered today"""
+    blocked = {str(m["bus_id"]) for m in repo.find("maintenance", "status", BLOCKING_MAINTENANCE)}
+    buses = {bus["bus_id"]: bus["route_id"] for bus in repo.find("buses", "status", ["Active"])
+             if bus["route_id"] is not None and str(bus["bus_id"]) not in blocked}
+    drivers = [d["driver_id"] for d in repo.find("drivers", "attendance", ["Present"])]
+    return buses, drivers
+
+
+def build(repo, rules=None):
+    """Solve today's roster from the repository"""
+    rules = dict(DEFAULT_RULES, **(rules or {}))
+    buses, drivers = available(repo)
+    trips = generate_trips(repo.iter_list("routes"), rules["trip_minutes"])
+    return Roster(trips, buses, drivers, rules).solve()
+
+
+def minutes_now():
+    now = datetime.now()
+    return now.hour * 60 + now.minute
+
+
+DOCUMENT = "roster"
+
+
+def current_roster(repo, shared, rebuild=False):
+    """Today's roster from shared state, solved and stored first if there is none yet"""
+    stored = shared.get_document(DOCUMENT)
+    if stored and stored["day"] == date.today().isoformat() and not rebuild:
+        return Roster.from_dict(stored)
+    roster = build(repo)
+    shared.update_document(DOCUMENT, lambda _: roster.to_dict())
+    return roster
+
+
+def repair(shared, change):
+    """Apply change(roster, now) to today's stored roster, if there is one; returns its result.
+
+    The roster is only written back if something changed, since every write
+    clears the other workers' caches.
+    """
+    stored = shared.get_document(DOCUMENT)
+    if not stored or stored["day"] != date.today().isoformat():
+        return []
+    result = []
+
+    def update(stored):
+        if not stored or stored["day"] != date.today().isoformat():
+            return None
+        roster = Roster.from_dict(stored)
+        pools = (list(roster.buses), list(roster.drivers), list(roster.trips))
+        result.extend(change(roster, minutes_now()))
+        # A bus or driver can join or leave without changing any trip
+        if not result and pools == (list(roster.buses), list(roster.drivers), list(roster.trips)):
+            return None
+        return roster.to_dict()
+
+    shared.update_document(DOCUMENT, update)
+    return result
+
+
+def refresh_bus(repo, shared, bus_id):
+    """Re-check one bus after it or its maintenance changed, repairing the roster if needed"""
+    bus = repo.get("buses", bus_id)
+    blocked = any(m["status"] in BLOCKING_MAINTENANCE for m in repo.find("maintenance", "bus_id", [bus["bus_id"]])) \
+        if bus else True
+    usable = bus is not None and bus["status"] == "Active" and bus["route_id"] is not None and not blocked
+
+    def change(roster, now):
+        route_id = roster.buses.get(str(bus_id))
+        if usable and route_id == str(bus["route_id"]):
+            return []
+        changed = roster.bus_unavailable(bus_id, now) if route_id is not None else []
+        if usable:
+            changed += roster.bus_available(bus_id, bus["route_id"], now)
+        return changed
+
+    return repair(shared, change)
+
+
+def refresh_route(repo, shared, route_id):
+    """Re-time one route's remaining trips after it was added, edited or deleted"""
+    route = repo.get("routes", route_id)
+
+    def change(roster, now):
+        trips = generate_trips([route], roster.rules["trip_minutes"]) if route else []
+        return roster.route_changed(route_id, trips, now)
+
+    return repair(shared, change)
+
+
+def refresh_driver(repo, shared, driver_id):
+    """Re-check one driver after their attendance changed, repairing the roster if needed"""
+    driver = repo.get("drivers", driver_id)
+    present = driver is not None and driver["attendance"] == "Present"
+
+    def change(roster, now):
+        if present == (str(driver_id) in roster.drivers):
+            return []
+        return roster.driver_present(driver_id, now) if present else roster.driver_absent(driver_id, now)
+
+    return repair(shared, change)
+
+
+# -------------- APP --------------
+def get_shared():
+    """SharedState holding the current app's roster: the repository's own"""
+    return get_shared_state()
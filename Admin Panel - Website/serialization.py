@@ -0,0 +1,188 @@
+"""
+Response serialization
+Pluggable JSON encoder (orjson when installed, else the standard library),
+MessagePack content negotiation for the Flutter app, and streamed list
+responses for large tables.
+
+    serialization.init_app(app)        # app.json uses the fast encoder
+    return respond(data)               # JSON or MessagePack, per Accept
+    return stream_list(rows)           # rows: any iterator of dicts
+
+stream_list answers small results in one piece. Once a result passes
+STREAM_THRESHOLD rows it is sent chunked, STREAM_CHUNK rows at a time, as a
+JSON array or, for `Accept: application/x-ndjson`, one JSON object per
+line, so memory stays flat whatever the table size. MessagePack bodies are
+always built whole; clients that need constant memory should ask for NDJSON.
+
+JSON_ENCODER=json forces the standard library encoder.
+"""
+import json
+import os
+from datetime import date
+from decimal import Decimal
+
+from flask import Response, request, stream_with_context
+from flask.json.provider import JSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # optional, only makes encoding faster
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional, MessagePack is then never offered
+    msgpack = None
+
+JSON_MIMETYPE = "application/json"
+NDJSON_MIMETYPE = "application/x-ndjson"
+MSGPACK_MIMETYPES = ("application/msgpack", "application/x-msgpack")
+
+STREAM_THRESHOLD = 1000
+STREAM_CHUNK = 500
+
+
+def _default(obj):
+    """Types the encoders can't handle, converted like Flask's default provider"""
+    if isinstance(obj, date):
+        return http_date(obj)
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# -------------- ENCODERS --------------
+def _std_dumps(obj):
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _orjson_dumps(obj):
+    # Datetimes go through _default so both encoders format them the same
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+
+ENCODERS = {"json": (_std_dumps, json.loads)}
+if orjson is not None:
+    ENCODERS["orjson"] = (_orjson_dumps, orjson.loads)
+
+ENCODER = os.environ.get("JSON_ENCODER") or ("orjson" if orjson is not None else "json")
+dumps, loads = ENCODERS[ENCODER]
+
+
+def set_encoder(name, encoder=None):
+    """Switch the encoder by name, or register `encoder` as (dumps, loads) under it"""
+    global ENCODER, dumps, loads
+    if encoder is not None:
+        ENCODERS[name] = encoder
+    ENCODER = name
+    dumps, loads = ENCODERS[name]
+
+
+class FastJSONProvider(JSONProvider):
+    """app.json provider backed by the selected encoder (used by jsonify)"""
+
+    mimetype = JSON_MIMETYPE
+
+    # Callers passing options (the session serializer's object_hook, ...)
+    # get the standard library, which supports them all
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            kwargs.setdefault("default", _default)
+            return json.dumps(obj, **kwargs)
+        return dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        return self._app.response_class(dumps(self._prepare_response_obj(args, kwargs)), mimetype=self.mimetype)
+
+
+def init_app(app):
+    app.json = FastJSONProvider(app)
+
+
+# -------------- NEGOTIATION --------------
+def _offers():
+    offers = [JSON_MIMETYPE, NDJSON_MIMETYPE]
+    if msgpack is not None:
+        offers.extend(MSGPACK_MIMETYPES)
+    return offers
+
+
+def negotiate():
+    """The response type the client asked for (JSON unless it prefers another)"""
+    return request.accept_mimetypes.best_match(_offers(), default=JSON_MIMETYPE) or JSON_MIMETYPE
+
+
+def request_data():
+    """Request body as Python data, from JSON or MessagePack"""
+    if msgpack is not None and request.mimetype in MSGPACK_MIMETYPES:
+        try:
+            return msgpack.unpackb(request.get_data(), raw=False)
+        except ValueError:
+            return None
+    return request.get_json()
+
+
+def respond(data, status=200):
+    """Encode `data` as JSON or MessagePack depending on Accept"""
+    mimetype = negotiate()
+    if mimetype in MSGPACK_MIMETYPES:
+        body = msgpack.packb(data, default=_default, datetime=False)
+    else:
+        mimetype = JSON_MIMETYPE
+        body = dumps(data)
+    response = Response(body, status=status, mimetype=mimetype)
+    response.vary.add("Accept")
+    return response
+
+
+def stream_list(rows, threshold=STREAM_THRESHOLD, chunk=STREAM_CHUNK):
+    """Respond with the dicts from `rows`, streaming once there are many"""
+    rows = iter(rows)
+    mimetype = negotiate()
+    head = []
+    for row in rows:
+        head.append(row)
+        if len(head) > threshold:
+            break
+    else:
+        # Small result: one body with a Content-Length
+        if mimetype == NDJSON_MIMETYPE:
+            response = Response(b"".join(dumps(row) + b"\n" for row in head), mimetype=mimetype)
+            response.vary.add("Accept")
+            return response
+        return respond(head)
+
+    if mimetype in MSGPACK_MIMETYPES:
+        head.extend(rows)
+        return respond(head)
+
+    def generate_ndjson():
+        batch = head
+        while batch:
+            yield b"".join(dumps(row) + b"\n" for row in batch)
+            batch = [row for _, row in zip(range(chunk), rows)]
+
+    def generate_json():
+        yield b"["
+        batch, first = head, True
+        while batch:
+            body = b",".join(dumps(row) for row in batch)
+            yield body if first else b"," + body
+            first = False
+            batch = [row for _, row in zip(range(chunk), rows)]
+        yield b"]"
+
+    generate = generate_ndjson if mimetype == NDJSON_MIMETYPE else generate_json
+    # The request context (and the DB session) stays open while streaming
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.vary.add("Accept")
+    return response
@@ -0,0 +1,260 @@
+"""
+Shared state across worker processes
+Live bus positions, cache version tokens, small JSON documents and
+background job leases kept in a small SQLite file (WAL mode), so every
+gunicorn worker sees the same data.
+
+Change notification is `PRAGMA data_version`: it only changes when another
+connection commits, so each process keeps its last snapshot in memory and
+re-reads the table only after some other worker has written.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# Columns stored for each live location
+LIVE_FIELDS = ('lat', 'lng', 'speed', 'occupancy')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS live_location (
+    bus_id TEXT PRIMARY KEY,
+    lat REAL NOT NULL,
+    lng REAL NOT NULL,
+    speed REAL,
+    occupancy INTEGER,
+    last_update TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS version (
+    key TEXT PRIMARY KEY,
+    token INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS document (
+    key TEXT PRIMARY KEY,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job (
+    name TEXT PRIMARY KEY,
+    owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    started REAL,
+    finished REAL,
+    succeeded REAL,
+    status TEXT,
+    error TEXT,
+    duration REAL,
+    runs INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+JOB_COLUMNS = "name, owner, lease_until, started, finished, succeeded, status, error, duration, runs, failures"
+
+
+class SharedState:
+    """SQLite-backed live locations and version counters.
+
+    One connection per process, opened lazily and reopened after fork,
+    so it is safe to create before gunicorn forks its workers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._live = None
+        self._versions = {}
+        self._documents = {}
+        # Bumped whenever the snapshot is dropped, see live_version()
+        self._live_token = 0
+
+    def _connect(self):
+        if self._conn is None or self._pid != os.getpid():
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            if "succeeded" not in {column[1] for column in conn.execute("PRAGMA table_info(job)")}:
+                # Job tables from before succeeded was added
+                try:
+                    conn.execute("ALTER TABLE job ADD COLUMN succeeded REAL")
+                except sqlite3.OperationalError:
+                    pass  # another process added it first
+            self._conn = conn
+            self._pid = os.getpid()
+            self._data_version = None
+        return self._conn
+
+    def _refresh(self, conn):
+        """Drop the in-memory snapshot if another connection has committed"""
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._data_version = data_version
+            self._live = None
+            self._versions = {}
+            self._documents = {}
+            self._live_token += 1
+
+    def _written(self):
+        # data_version doesn't move for our own commits
+        self._live = None
+        self._versions = {}
+        self._documents = {}
+        self._live_token += 1
+
+    # ---------- LIVE LOCATIONS ----------
+    def get_live_locations(self):
+        """Return {bus_id: location} as of the latest commit of any worker"""
+        with self._lock:
+            conn = self._connect()
+            self._refresh(conn)
+            if self._live is None:
+                rows = conn.execute(
+                    "SELECT bus_id, lat, lng, speed, occupancy, last_update FROM live_location"
+                ).fetchall()
+                self._live = {
+                    row[0]: dict(zip(LIVE_FIELDS + ('last_update',), row[1:]))
+                    for row in rows
+                }
+            return {bus_id: dict(info) for bus_id, info in self._live.items()}
+
+    def live_version(self):
+        """Token that changes whenever the live locations may have changed"""
+        with self._lock:
+            self._refresh(self._connect())
+            return self._live_token
+
+    def update_live_locations(self, records):
+        """Upsert (bus_id, location) pairs in a single transaction"""
+        now = datetime.now().isoformat(timespec='seconds')
+        params = [
+            (str(bus_id), *(location.get(field) for field in LIVE_FIELDS), location.get('last_update') or now)
+            for bus_id, location in records
+        ]
+        if not params:
+            return 0
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(
+                    "INSERT INTO live_location (bus_id, lat, lng, speed, occupancy, last_update) "
+                    "VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(bus_id) DO UPDATE SET lat = excluded.lat, lng = excluded.lng, "
+                    "speed = excluded.speed, occupancy = excluded.occupancy, "
+                    "last_update = excluded.last_update",
+                    params,
+                )
+            self._written()
+        return len(params)
+
+    def update_live_location(self, bus_id, location):
+        self.update_live_locations([(bus_id, location)])
+
+    # ---------- VERSIONS ----------
+    def version(self, key):
+        """Current token for `key` (0 if never bumped)"""
+        with self._lock:
+            conn = self._connect()
+            self._refresh(conn)
+            if key not in self._versions:
+                row = conn.execute("SELECT token FROM version WHERE key = ?", (key,)).fetchone()
+                self._versions[key] = row[0] if row else 0
+            return self._versions[key]
+
+    def bump(self, key):
+        """Advance `key`, telling every worker its cached copy is stale"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO version (key, token) VALUES (?, 1) "
+                "ON CONFLICT(key) DO UPDATE SET token = token + 1",
+                (key,),
+            )
+            self._written()
+
+    # ---------- DOCUMENTS ----------
+    def get_document(self, key):
+        """JSON document stored under `key`, or None. Callers must not modify it."""
+        with self._lock:
+            conn = self._connect()
+            self._refresh(conn)
+            if key not in self._documents:
+                row = conn.execute("SELECT body FROM document WHERE key = ?", (key,)).fetchone()
+                self._documents[key] = json.loads(row[0]) if row else None
+            return self._documents[key]
+
+    def update_document(self, key, fn):
+        """Replace document `key` with fn(current document or None), atomically across workers.
+
+        Nothing is written if fn returns None. Returns what fn returned.
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute("SELECT body FROM document WHERE key = ?", (key,)).fetchone()
+                value = fn(json.loads(row[0]) if row else None)
+                if value is not None:
+                    conn.execute(
+                        "INSERT INTO document (key, body) VALUES (?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET body = excluded.body",
+                        (key, json.dumps(value, separators=(",", ":"))),
+                    )
+            if value is not None:
+                self._written()
+            return value
+
+    # ---------- JOB LEASES ----------
+    def acquire_job(self, name, owner, ttl, due=None):
+        """Lease job `name` to `owner` for `ttl` seconds; False if it is leased already.
+
+        With `due`, the lease is only taken if due(row) is true for the job's
+        row (see jobs(); None if it never ran), checked in the same
+        transaction, so a periodic job runs once per period across workers.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                cursor = conn.execute(f"SELECT {JOB_COLUMNS} FROM job WHERE name = ?", (name,))
+                row = cursor.fetchone()
+                row = dict(zip([c[0] for c in cursor.description], row)) if row else None
+                if (row and row["lease_until"] > now) or (due is not None and not due(row)):
+                    return False
+                conn.execute(
+                    "INSERT INTO job (name, owner, lease_until, started) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, "
+                    "lease_until = excluded.lease_until, started = excluded.started",
+                    (name, owner, now + ttl, now),
+                )
+            return True
+
+    def finish_job(self, name, owner, status, duration, error=None, covered=None):
+        """Record the outcome of `owner`'s run and release the lease (unless it expired and was taken).
+
+        `covered` is the scheduled moment the run was for; a successful run
+        stores it as `succeeded`. On-demand runs pass None and leave it alone.
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "UPDATE job SET lease_until = 0, finished = ?, status = ?, duration = ?, error = ?, "
+                "succeeded = CASE WHEN ? = 'ok' AND ? IS NOT NULL THEN ? ELSE succeeded END, "
+                "runs = runs + 1, failures = failures + ? WHERE name = ? AND owner = ?",
+                (time.time(), status, duration, error, status, covered, covered, int(status != "ok"), name, owner),
+            )
+
+    def jobs(self):
+        """{name: row} of every job that has been leased"""
+        with self._lock:
+            cursor = self._connect().execute(f"SELECT {JOB_COLUMNS} FROM job")
+            columns = [c[0] for c in cursor.description]
+            return {row[0]: dict(zip(columns, row)) for row in cursor.fetchall()}
@@ -0,0 +1,245 @@
+# static_assets.py
+# Build step for static/: minifies CSS and JS, writes content-hashed copies
+# plus .gz / .br variants to static/dist/ and a manifest. At runtime
+# init_app() makes url_for('static', filename='main.js') point at the
+# fingerprinted file, served pre-compressed with Cache-Control: immutable.
+#
+#     python static_assets.py          # run before deploying
+#
+# Without a build (or for a source file edited since), the original files
+# are served as before.
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+
+try:
+    import brotli
+except ImportError:  # optional, only gzip variants are built then
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+DIST = "dist"
+MANIFEST = "manifest.json"
+# A year; fingerprinted names change whenever the content does
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Already-compressed formats are copied but not gzipped
+PRECOMPRESS = (".css", ".js", ".svg", ".json", ".txt", ".html")
+# A "/" after one of these starts a regex literal, not a division
+JS_REGEX_AFTER = "(,=:[!&|?{};+-*%<>~^"
+# Punctuation that never needs a space next to it
+JS_TIGHT = "{}()[];,:=<>*&|!?"
+
+
+# -------------- MINIFIERS --------------
+def _tokens(source, regex_allowed_after):
+    """Split CSS/JS into (kind, text) tokens: str, comment, space, regex or code"""
+    i, n = 0, len(source)
+    last = ""  # last significant code character
+    while i < n:
+        c = source[i]
+        if c in "\"'`":
+            j = i + 1
+            while j < n and source[j] != c:
+                j += 2 if source[j] == "\\" else 1
+            yield "str", source[i:j + 1]
+            last, i = c, j + 1
+        elif source.startswith("/*", i):
+            j = source.find("*/", i + 2)
+            j = n if j < 0 else j + 2
+            yield "comment", source[i:j]
+            i = j
+        elif regex_allowed_after is not None and source.startswith("//", i):
+            j = source.find("\n", i)
+            j = n if j < 0 else j
+            yield "comment", source[i:j]
+            i = j
+        elif regex_allowed_after is not None and c == "/" and (not last or last in regex_allowed_after):
+            j, in_class = i + 1, False
+            while j < n and (in_class or source[j] != "/") and source[j] != "\n":
+                if source[j] == "\\":
+                    j += 1
+                elif source[j] in "[]":
+                    in_class = source[j] == "["
+                j += 1
+            j += 1
+            while j < n and source[j].isalpha():
+                j += 1
+            yield "regex", source[i:j]
+            last, i = "/", j
+        elif c.isspace():
+            j = i
+            while j < n and source[j].isspace():
+                j += 1
+            yield "space", source[i:j]
+            i = j
+        else:
+            j = i + 1
+            while j < n and not source[j].isspace() and source[j] not in "\"'`/":
+                j += 1
+            yield "code", source[i:j]
+            last, i = source[j - 1], j
+
+
+def minify_js(source):
+    """Drop comments and collapse whitespace.
+
+    Spaces next to punctuation are removed (except around + and -, where
+    "a - -b" must not become "a--b"); line breaks are kept for automatic
+    semicolon insertion unless they follow { ; or ,
+    """
+    out, pending = [], None
+    for kind, text in _tokens(source, regex_allowed_after=JS_REGEX_AFTER):
+        if kind in ("comment", "space"):
+            # A dropped comment still separates the tokens around it
+            if pending != "\n":
+                pending = "\n" if "\n" in text else " "
+            continue
+        if pending and out:
+            prev = out[-1][-1]
+            if pending == "\n" and prev not in "{;,":
+                out.append("\n")
+            elif pending == " " and prev not in JS_TIGHT and text[0] not in JS_TIGHT:
+                out.append(" ")
+        pending = None
+        out.append(text)
+    return "".join(out) + "\n"
+
+
+def minify_css(source):
+    """Drop comments and whitespace around CSS punctuation"""
+    out = []
+    for kind, text in _tokens(source, regex_allowed_after=None):
+        if kind == "comment":
+            continue
+        if kind == "space":
+            text = " "
+            if out and out[-1] == " ":
+                continue
+        out.append(text)
+    css = "".join(out)
+    # Tighten punctuation outside of string literals
+    parts = re.split(r"(\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*')", css)
+    for k in range(0, len(parts), 2):
+        parts[k] = re.sub(r"\s*([{};,])\s*", r"\1", parts[k]).replace(";}", "}")
+    return "".join(parts).strip() + "\n"
+
+
+MINIFIERS = {".js": minify_js, ".css": minify_css}
+
+
+# -------------- BUILD --------------
+def _hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def build(static_dir=STATIC_DIR, log_fn=print):
+    """Minify, fingerprint and pre-compress every file in static_dir"""
+    dist = os.path.join(static_dir, DIST)
+    shutil.rmtree(dist, ignore_errors=True)
+    os.makedirs(dist)
+    manifest = {}
+    for name in sorted(os.listdir(static_dir)):
+        path = os.path.join(static_dir, name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, "rb") as f:
+            source = f.read()
+        root, ext = os.path.splitext(name)
+        data = source
+        if ext in MINIFIERS:
+            data = MINIFIERS[ext](source.decode("utf-8")).encode("utf-8")
+        out_name = f"{root}.{_hash(data)[:10]}{ext}"
+        with open(os.path.join(dist, out_name), "wb") as f:
+            f.write(data)
+        sizes = [f"{len(source):>8} -> {len(data):>8}"]
+        if ext in PRECOMPRESS:
+            gz = gzip.compress(data, 9, mtime=0)
+            with open(os.path.join(dist, out_name + ".gz"), "wb") as f:
+                f.write(gz)
+            sizes.append(f"gzip {len(gz):>7}")
+            if brotli is not None:
+                br = brotli.compress(data, quality=11)
+                with open(os.path.join(dist, out_name + ".br"), "wb") as f:
+                    f.write(br)
+                sizes.append(f"br {len(br):>7}")
+        manifest[name] = {"file": f"{DIST}/{out_name}", "source_sha256": _hash(source)}
+        log_fn(f"  {name:<20} {out_name:<32} {'  '.join(sizes)}")
+    with open(os.path.join(dist, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_manifest(static_dir=STATIC_DIR):
+    """{source name: fingerprinted path}, leaving out sources edited since the build"""
+    try:
+        with open(os.path.join(static_dir, DIST, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    current = {}
+    for name, entry in manifest.items():
+        try:
+            with open(os.path.join(static_dir, name), "rb") as f:
+                fresh = _hash(f.read()) == entry["source_sha256"]
+        except OSError:
+            fresh = False
+        if fresh:
+            current[name] = entry["file"]
+        else:
+            log.warning("static/%s changed since the last build; serving it unfingerprinted", name)
+    return current
+
+
+# -------------- SERVING --------------
+def init_app(app):
+    """Point url_for('static') at built assets and serve them pre-compressed"""
+    from flask import request, send_from_directory
+
+    manifest = load_manifest(app.static_folder)
+    default_static = app.view_functions["static"]
+
+    @app.url_defaults
+    def _fingerprint(endpoint, values):
+        if endpoint == "static" and values.get("filename") in manifest:
+            values["filename"] = manifest[values["filename"]]
+
+    def static(filename):
+        if not filename.startswith(DIST + "/") or filename.endswith(".json"):
+            return default_static(filename=filename)
+        variants = {encoding: filename + suffix for encoding, suffix in (("br", ".br"), ("gzip", ".gz"))
+                    if os.path.isfile(os.path.join(app.static_folder, filename + suffix))}
+        encoding = request.accept_encodings.best_match(list(variants))
+        if encoding:
+            response = send_from_directory(app.static_folder, variants[encoding], max_age=IMMUTABLE_MAX_AGE)
+            response.mimetype = _mimetype(filename)
+            response.content_encoding = encoding
+        else:
+            response = send_from_directory(app.static_folder, filename, max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        response.vary.add("Accept-Encoding")
+        return response
+
+    app.view_functions["static"] = static
+
+
+def _mimetype(filename):
+    import mimetypes
+
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def main():
+    print(f"Building {STATIC_DIR}/{DIST}" + ("" if brotli else " (brotli not installed: gzip only)"))
+    build()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The app reads its backend from the environment on import
+TMP = tempfile.mkdtemp()
+os.environ["DATA_BACKEND"] = "memory"
+os.environ["SHARED_STATE_PATH"] = os.path.join(TMP, "state.db")
+os.environ["SCHEDULER"] = "0"
+os.environ.pop("METRICS_DIR", None)
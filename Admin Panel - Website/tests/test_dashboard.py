@@ -0,0 +1,40 @@
+import html
+import json
+import re
+
+import pytest
+
+from app import app
+from repository import get_repository
+
+ONCLICK = re.compile(r"""onclick='(\w+)\((.*?)\)'""")
+
+
+@pytest.fixture
+def client():
+    app.testing = True
+    client = app.test_client()
+    client.post("/", data={"username": "admin", "password": "admin123"})
+    return client
+
+
+def test_dashboard_buttons_quote_string_ids(client):
+    with app.app_context():
+        repo = get_repository()
+        bus_id = repo.add("buses", {"number": "O'Hare \"express\"", "route_id": "R1", "status": "Active"})
+
+    page = client.get("/dashboard").get_data(as_text=True)
+    calls = ONCLICK.findall(page)
+    assert {name for name, _ in calls} >= {
+        "editBus", "deleteBus", "editDriver", "deleteDriver",
+        "editRoute", "deleteRoute", "editMaintenance", "deleteMaintenance",
+    }
+    for name, args in calls:
+        # Every argument must be a JavaScript literal; JSON is a subset
+        values = json.loads("[" + html.unescape(args) + "]")
+        assert all(isinstance(value, (str, int, type(None))) for value in values), (name, values)
+
+    assert ["editBus", [str(bus_id), "O'Hare \"express\"", "R1", "Active"]] in [
+        [name, json.loads("[" + html.unescape(args) + "]")] for name, args in calls
+    ]
+    assert '"BHN-101"' in html.unescape(page)
@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+from ingest import IngestService
+
+
+def post(service, path, payload):
+    """Send one POST to the ASGI app; returns (status, json body)"""
+    async def call():
+        messages = [{"type": "http.request", "body": json.dumps(payload).encode(), "more_body": False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": path,
+                 "headers": [(b"content-type", b"application/json")]}
+        await service(scope, receive, send)
+        await service._stop()
+        return sent[0]["status"], json.loads(sent[1]["body"])
+
+    return asyncio.run(call())
+
+
+def updates(n):
+    return [{"bus_id": i, "lat": 23.0, "lng": 72.5} for i in range(n)]
+
+
+def test_batch_larger_than_the_queue_is_rejected_with_413():
+    service = IngestService(sink=lambda records: None, queue_size=3)
+    status, body = post(service, "/api/public/location-update/batch", {"updates": updates(5)})
+    assert status == 413
+    assert body["max_updates"] == 3
+    assert service.stats["throttled"] == 0
+
+
+def test_batch_that_fits_the_queue_is_accepted():
+    written = []
+    service = IngestService(sink=written.extend, queue_size=3, flush_interval=0)
+    status, body = post(service, "/api/public/location-update/batch", {"updates": updates(3) + [{"bus_id": 9}]})
+    assert status == 200
+    assert body["accepted"] == 3 and len(body["errors"]) == 1
+    assert sorted(bus_id for bus_id, _ in written) == [0, 1, 2]
@@ -0,0 +1,36 @@
+import time
+from datetime import datetime
+
+import jobs
+from shared_state import SharedState
+
+
+def wait_for_runs(scheduler, name, runs):
+    deadline = time.time() + 5
+    while (scheduler.shared.jobs().get(name) or {}).get("runs", 0) < runs:
+        assert time.time() < deadline, f"{name} did not finish"
+        time.sleep(0.01)
+
+
+def test_manual_run_does_not_count_as_the_missed_daily_run():
+    calls = []
+
+    def rollover(day=None, scheduled=None):
+        calls.append(scheduled)
+        if len(calls) == 1:
+            raise RuntimeError("database locked")
+
+    scheduler = jobs.Scheduler(SharedState(":memory:"))
+    scheduler.register("rollover", rollover, at="10:00")
+    moment = datetime.now().replace(hour=10, minute=0, second=0, microsecond=0).timestamp()
+
+    assert scheduler.run_pending(now=moment) == ["rollover"]
+    wait_for_runs(scheduler, "rollover", 1)
+    # A backfill for some other day, started by hand, succeeds
+    assert scheduler.trigger("rollover", "2024-01-01")
+    wait_for_runs(scheduler, "rollover", 2)
+
+    assert scheduler.run_pending(now=moment + jobs.RETRY_AFTER + 60) == ["rollover"]
+    wait_for_runs(scheduler, "rollover", 3)
+    assert calls[2] == datetime.fromtimestamp(moment)
+    assert scheduler.run_pending(now=moment + jobs.RETRY_AFTER + 120) == []
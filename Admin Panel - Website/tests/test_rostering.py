@@ -0,0 +1,55 @@
+import pytest
+
+import rostering
+from app import app
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Every trip of the day is still ahead
+    monkeypatch.setattr(rostering, "minutes_now", lambda: 0)
+    app.testing = True
+    client = app.test_client()
+    client.post("/", data={"username": "admin", "password": "admin123"})
+    return client
+
+
+def roster_writes(monkeypatch):
+    """List that collects what each later update of the roster document wrote (None: nothing)"""
+    with app.app_context():
+        shared = rostering.get_shared()
+    writes = []
+    update_document = shared.update_document
+
+    def record(key, fn):
+        writes.append(update_document(key, fn))
+        return writes[-1]
+
+    monkeypatch.setattr(shared, "update_document", record)
+    return writes
+
+
+def test_new_bus_covers_trips_and_renames_leave_the_roster_alone(client, monkeypatch):
+    route_id = client.post("/api/routes", json={
+        "name": "Morning line", "start_stop": "A", "end_stop": "B",
+        "first_bus": "06:00", "last_bus": "09:00", "frequency_min": 90,
+    }).get_json()["route_id"]
+    # Enough that some are still free whatever the seeded routes take
+    for i in range(6):
+        driver_id = client.post("/api/drivers", json={"name": f"Driver {i}", "phone": "9800000000"}).get_json()["driver_id"]
+        client.post(f"/api/drivers/{driver_id}/attendance", json={"status": "Present"})
+
+    trips = [t for t in client.get("/api/roster").get_json()["trips"] if t["route_id"] == str(route_id)]
+    assert len(trips) == 3 and all(t["bus_id"] is None for t in trips)
+
+    bus_id = client.post("/api/buses", json={"number": "GJ-01", "route_id": route_id}).get_json()["bus_id"]
+    trips = [t for t in client.get("/api/roster").get_json()["trips"] if t["route_id"] == str(route_id)]
+    assert all(t["bus_id"] == str(bus_id) for t in trips), (bus_id, trips)
+
+    writes = roster_writes(monkeypatch)
+    client.put(f"/api/buses/{bus_id}", json={"number": "GJ-02", "route_id": route_id, "status": "Active"})
+    client.put(f"/api/routes/{route_id}", json={"name": "Day line", "first_bus": "06:00",
+                                               "last_bus": "09:00", "frequency_min": 90})
+    client.put(f"/api/drivers/{driver_id}", json={"name": "Driver 5 K", "attendance": "Present"})
+    # The bus rename skips the roster; the route and driver edits leave it as it was
+    assert writes == [None, None]
@@ -0,0 +1,53 @@
+"""
+Request validation shared by the Flask app and the async ingest service
+"""
+import math
+
+
+def _number(value, low=-math.inf, high=math.inf):
+    """`value` (a number or numeric string) as a finite float in [low, high], or None"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        return None
+    try:
+        number = float(value)
+    except (ValueError, OverflowError):
+        return None
+    return number if math.isfinite(number) and low <= number <= high else None
+
+
+def parse_location_update(data):
+    """Validate a location-update payload.
+
+    lat / lng / speed / occupancy are coerced to finite numbers (lat within
+    ±90, lng within ±180), so nothing but plain numbers reaches storage.
+    Returns (bus_id, location, None) on success or (None, None, error).
+    """
+    if not isinstance(data, dict):
+        return None, None, "bus_id, lat, and lng are required"
+
+    bus_id = data.get("bus_id")
+    if data.get("lat") in (None, "") or data.get("lng") in (None, "") or bus_id in (None, ""):
+        return None, None, "bus_id, lat, and lng are required"
+    if isinstance(bus_id, bool) or not isinstance(bus_id, (int, str)):
+        return None, None, "bus_id must be a string or an integer"
+
+    lat = _number(data["lat"], -90, 90)
+    if lat is None:
+        return None, None, "lat must be a number between -90 and 90"
+    lng = _number(data["lng"], -180, 180)
+    if lng is None:
+        return None, None, "lng must be a number between -180 and 180"
+    # Missing or null speed / occupancy mean 0
+    speed = _number(0 if data.get("speed") is None else data["speed"])
+    if speed is None:
+        return None, None, "speed must be a number"
+    occupancy = _number(0 if data.get("occupancy") is None else data["occupancy"])
+    if occupancy is None:
+        return None, None, "occupancy must be a number"
+
+    return bus_id, {
+        "lat": lat,
+        "lng": lng,
+        "speed": speed,
+        "occupancy": round(occupancy),
+    }, None
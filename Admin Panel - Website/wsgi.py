@@ -0,0 +1,10 @@
+# wsgi.py
+# Production entry point:
+#   gunicorn -c gunicorn.conf.py wsgi:app
+from app import app
+
+if __name__ == "__main__":
+    import jobs
+
+    jobs.autostart(app)
+    app.run(host='0.0.0.0', port=5000)